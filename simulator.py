@@ -66,6 +66,10 @@ parser.add_argument('-t', '--timestamp-results', dest="timestamp_results",
 parser.add_argument('-p', '--publish', action="store_true", default=False,
                     help='''automatically publish experiment results to git''')
 
+parser.add_argument('-r', '--resume', action="store_true", default=False,
+                    help='''resume an interrupted MCS run from the checkpoint in '''
+                         '''its results directory, rather than starting over''')
+
 args = parser.parse_args()
 
 # Allow configs to be specified as paths as well as module names
@@ -91,6 +95,11 @@ else:
   # We default to a Fuzzer
   simulator = Fuzzer(SimulationConfig())
 
+if args.resume:
+  if not hasattr(simulator, "resume_from_checkpoint"):
+    parser.error("--resume is only supported by MCSFinder")
+  simulator.resume_from_checkpoint = True
+
 # Set an interrupt handler
 def handle_int(signal, frame):
   import os
@@ -14,8 +14,13 @@
 # limitations under the License.
 
 from sts.replay_event import *
+from sts.openflow_buffer import PendingMessage
+from sts.control_flow.base import StateChange
+from pox.lib.revent import EventMixin
+from pox.openflow.software_switch import DpPacketOut
 import time
-from collections import Counter
+import threading
+from collections import Counter, defaultdict
 import operator
 import logging
 
@@ -41,6 +46,14 @@ class EventSchedulerStats(object):
     self.msgrecv2timeouts = Counter()
     # ControlMessageSend packet classes -> timeout counts
     self.msgsend2timeouts = Counter()
+    # Coarse grained event classes -> matches ahead of an earlier event of
+    # the trace, in partial order mode
+    self.event2reordered = Counter()
+    # Coarse grained event classes -> [seconds spent waiting for each match]
+    self.event2wait_seconds = defaultdict(list)
+    # Coarse grained event classes -> [seconds from the arrival of the awaited
+    # message or state change until the match]
+    self.event2wakeup_seconds = defaultdict(list)
     self.replay_start = None
     self.record_start = None
 
@@ -62,6 +75,10 @@ class EventSchedulerStats(object):
       pkt_class = event.get_packet().__class__.__name__
       self.msgsend2matched[pkt_class] += 1
 
+  def event_reordered(self, event):
+    msg.replay_event_success(self.time(event) + " Matched event out of recorded order "+str(event))
+    self.event2reordered[event.__class__.__name__] += 1
+
   def event_timed_out(self, event):
     msg.replay_event_timeout(self.time(event) + " Event timed out "+str(event))
     self.event2timeouts[event.__class__.__name__] += 1
@@ -72,6 +89,13 @@ class EventSchedulerStats(object):
       pkt_class = event.get_packet().__class__.__name__
       self.msgsend2timeouts[pkt_class] += 1
 
+  def record_wait(self, event, wait_seconds, wakeup_seconds=None):
+    ''' Record how long a matched event was waited for, and, if the arrival
+    of what it waited on was observed, how long after the arrival it matched '''
+    self.event2wait_seconds[event.__class__.__name__].append(wait_seconds)
+    if wakeup_seconds is not None:
+      self.event2wakeup_seconds[event.__class__.__name__].append(wakeup_seconds)
+
   def sorted_match_counts(self):
     for e, count in sorted(self.event2matched.items(),
                            key=operator.itemgetter(1)):
@@ -106,6 +130,25 @@ class EventSchedulerStats(object):
       d['ControlMessageSend']['total'] = total
     return d
 
+  def get_reordered_dict(self):
+    return dict(self.event2reordered)
+
+  def get_wait_latency_dict(self):
+    ''' Return { event type -> { "matched", "mean_wait_ms", "max_wait_ms",
+    "observed_arrivals", "mean_wakeup_ms", "max_wakeup_ms" } } '''
+    d = {}
+    for e, waits in self.event2wait_seconds.iteritems():
+      wakeups = self.event2wakeup_seconds.get(e, [])
+      d[e] = {
+        "matched" : len(waits),
+        "mean_wait_ms" : sum(waits) * 1000 / len(waits),
+        "max_wait_ms" : max(waits) * 1000,
+        "observed_arrivals" : len(wakeups),
+        "mean_wakeup_ms" : sum(wakeups) * 1000 / len(wakeups) if wakeups else 0.0,
+        "max_wakeup_ms" : max(wakeups) * 1000 if wakeups else 0.0,
+      }
+    return d
+
   def __str__(self):
     total_matched = sum(self.event2matched.values())
     total_timeouts = sum(self.event2timeouts.values())
@@ -132,6 +175,18 @@ class EventSchedulerStats(object):
         for pkt_class, c in self.msgsend2timeouts.iteritems():
           s.append("\t\t  %s : %d\n" % (pkt_class, c))
 
+    if self.event2reordered:
+      s.append("Matched out of recorded order per event type:\n")
+      for e, count in sorted(self.event2reordered.items()):
+        s.append("  %s %d\n" % (e, count,))
+
+    s.append("Wait latency per event type (wait mean/max, arrival to match mean/max):\n")
+    for e, latency in sorted(self.get_wait_latency_dict().items()):
+      s.append("  %s %.1f/%.1f ms, %.1f/%.1f ms (%d of %d arrivals observed)\n" %
+               (e, latency["mean_wait_ms"], latency["max_wait_ms"],
+                latency["mean_wakeup_ms"], latency["max_wakeup_ms"],
+                latency["observed_arrivals"], latency["matched"]))
+
     return "".join(s)
 
 class EventSchedulerBase(object):
@@ -189,17 +244,85 @@ class DumbEventScheduler(EventSchedulerBase):
     self._log_event(event)
     self.last_event = event
 
+def arrival_key(event):
+  ''' Return the key of the message, state change, or dataplane packet that
+  event waits on, as reported by EventScheduler's arrival listeners, or None
+  if no arrival notification is raised for it '''
+  if type(event) == ControlMessageReceive:
+    return ("receive", event.pending_receive)
+  if type(event) == ControlMessageSend:
+    return ("send", event.pending_send)
+  if type(event) == ControllerStateChange:
+    return ("state_change", event.pending_state_change)
+  if type(event) == DataplanePermit:
+    return ("dataplane", event.fingerprint[1:])
+  return None
+
+class PartialOrder(object):
+  ''' Relaxes the total order in which a DAG's internal events are matched
+  to the happens-before order given by EventDag.happens_before(): while
+  EventScheduler waits for an internal event, later internal events that
+  are causally independent of it (and of every other pending event before
+  them) may be matched first. The Replayer then skips them when it reaches
+  them in the trace.
+
+  Only events up to the next totally ordered event (e.g. the next input),
+  and at most window events ahead, are considered. '''
+  def __init__(self, dag, window=16):
+    self.dag = dag
+    self.window = window
+    self._event2index = { event : i for i, event in enumerate(dag.events) }
+    # indices of events matched ahead of the event being waited on
+    self._matched_early = set()
+
+  def matched_early(self, event):
+    return self._event2index.get(event) in self._matched_early
+
+  def record_match(self, event):
+    self._matched_early.add(self._event2index[event])
+
+  def _resolved(self, index, waiting_index):
+    # Everything before the event being waited on has been matched or has
+    # timed out. Whitelisted events are never waited on.
+    return (index < waiting_index or index in self._matched_early or
+            self.dag.events[index].whitelisted())
+
+  def ready_successors(self, event):
+    ''' Return the unmatched internal events after the given one whose
+    happens-before predecessors have all been resolved '''
+    index = self._event2index.get(event)
+    if index is None or self.dag.happens_before(index) is None:
+      return []
+    ready = []
+    events = self.dag.events
+    for i in xrange(index + 1, min(len(events), index + 1 + self.window)):
+      predecessors = self.dag.happens_before(i)
+      if predecessors is None:
+        break
+      if i in self._matched_early or events[i].whitelisted():
+        continue
+      if all(self._resolved(p, index) for p in predecessors):
+        ready.append(events[i])
+    return ready
+
 class EventScheduler(EventSchedulerBase):
   '''An EventWatcher schedules events. It controls their admission and
   any post-event delay '''
 
   kwargs = set(['speedup', 'delay_input_events', 'initial_wait',
                 'epsilon_seconds', 'sleep_interval_seconds',
-                'sleep_continuation', 'select_continuation'])
+                'sleep_continuation', 'select_continuation', 'event_driven'])
 
   def __init__(self, simulation, speedup=1.0, delay_input_events=True,
                initial_wait=0.5, epsilon_seconds=0.5, sleep_interval_seconds=0.2,
-               sleep_continuation=None, select_continuation=None, assertion_checking=False):
+               sleep_continuation=None, select_continuation=None, assertion_checking=False,
+               event_driven=True):
+    '''
+    If event_driven is True, an internal event is retried as soon as the
+    OpenFlowBuffer, the sync callback or the BufferedPatchPanel report the
+    arrival of what it is waiting on, and otherwise only every
+    sleep_interval_seconds. If False, it is retried whenever select returns.
+    '''
     super(EventScheduler, self).__init__()
     self.simulation = simulation
     self.speedup = speedup
@@ -212,18 +335,83 @@ class EventScheduler(EventSchedulerBase):
     self.started = False
     self.stats = EventSchedulerStats()
     self.assertion_checking = assertion_checking
+    # If the simulation runs in virtual time, sleeps skip over idle periods
+    self.clock = self.simulation.clock
     self.sleep_continuation = sleep_continuation
     if sleep_continuation is None:
-      self.sleep_continuation = self.simulation.io_master.sleep
+      if self.clock is not None:
+        self.sleep_continuation = self.clock.sleep
+      else:
+        self.sleep_continuation = self.simulation.io_master.sleep
     self.select_continuation = select_continuation
     if select_continuation is None:
       self.select_continuation = self.simulation.io_master.select
+    self.event_driven = event_driven
+    # Arrival key of the event _poll_event() is waiting on
+    self._awaited_key = None
+    # When the awaited key first arrived
+    self._arrival_time = None
+    # Whether the awaited key arrived since the last proceed() attempt
+    self._woken = False
+    self._waiting_thread = None
+    # Arrival key kinds that some listener reports
+    self._notified_kinds = set()
+    self._listen_for_arrivals()
+    # If not None, a PartialOrder over the replayed DAG
+    self.partial_order = None
+    # Arrival keys of the events that may be matched ahead of the awaited one
+    self._alternate_keys = set()
+
+  def set_partial_order(self, partial_order):
+    self.partial_order = partial_order
+
+  def _listen_for_arrivals(self):
+    sources = [(self.simulation.openflow_buffer, PendingMessage,
+                self._handle_PendingMessage, ["receive", "send"]),
+               (self.simulation.controller_sync_callback, StateChange,
+                self._handle_StateChange, ["state_change"]),
+               (self.simulation.patch_panel, DpPacketOut,
+                self._handle_DpPacketOut, ["dataplane"])]
+    for source, event_type, handler, kinds in sources:
+      # Not all sync callbacks and patch panels raise events
+      if (isinstance(source, EventMixin) and
+          event_type in source._eventMixin_events):
+        source.addListener(event_type, handler)
+        self._notified_kinds.update(kinds)
+
+  def _handle_PendingMessage(self, event):
+    kind = "send" if event.send_event else "receive"
+    self._arrived((kind, event.pending_message))
+
+  def _handle_StateChange(self, event):
+    self._arrived(("state_change", event.pending_state_change))
+
+  def _handle_DpPacketOut(self, event):
+    self._arrived(("dataplane", event.fingerprint))
+
+  def _arrived(self, key):
+    if self._awaited_key is None:
+      return
+    if key != self._awaited_key:
+      if key not in self._alternate_keys:
+        return
+    elif self._arrival_time is None:
+      self._arrival_time = time.time()
+    self._woken = True
+    if (self.event_driven and
+        threading.current_thread() is not self._waiting_thread):
+      self.simulation.io_master.wakeup()
 
   def schedule(self, event):
     if not self.started:
       self.stats.start_replay(event)
       self.started = True
 
+    if (self.partial_order is not None and
+        self.partial_order.matched_early(event)):
+      # Already matched (and logged) while waiting on an earlier event
+      self.update_event_time(event)
+      return
     if isinstance(event, InputEvent):
       self.inject_input(event)
     elif isinstance(event, InternalEvent):
@@ -274,16 +462,37 @@ class EventScheduler(EventSchedulerBase):
 
   def _poll_event(self, event, end_time):
     proceed = False
-    while True:
-      now = time.time()
-      if event.proceed(self.simulation):
-        proceed = True
-        break
-      elif now > end_time:
-        break
-      self.select_continuation(self.sleep_interval_seconds)
+    start = time.time()
+    self._awaited_key = arrival_key(event)
+    if self._awaited_key is not None and self._awaited_key[0] not in self._notified_kinds:
+      self._awaited_key = None
+    self._arrival_time = None
+    self._waiting_thread = threading.current_thread()
+    try:
+      while True:
+        now = time.time()
+        self._woken = False
+        if event.proceed(self.simulation):
+          proceed = True
+          break
+        elif now > end_time:
+          break
+        if self.partial_order is not None and isinstance(event, InternalEvent):
+          self._match_independent_events(event)
+        if self.event_driven and self._awaited_key is not None:
+          self._wait_for_arrival(min(end_time, now + self.sleep_interval_seconds))
+        else:
+          self.select_continuation(self.sleep_interval_seconds)
+    finally:
+      self._awaited_key = None
+      self._alternate_keys = set()
+      self._waiting_thread = None
     if proceed:
       event.timed_out = False
+      matched = time.time()
+      self.stats.record_wait(event, matched - start,
+                             None if self._arrival_time is None
+                             else matched - self._arrival_time)
       self.stats.event_matched(event)
       self.update_event_time(event)
     else:
@@ -291,9 +500,46 @@ class EventScheduler(EventSchedulerBase):
       self.stats.event_timed_out(event)
     event.replay_time = SyncTime.now()
 
+  def _match_independent_events(self, event):
+    ''' Let through the events that the PartialOrder allows to be matched
+    ahead of event, and listen for the arrival of those still missing '''
+    self._alternate_keys = set()
+    progress = True
+    while progress:
+      progress = False
+      for successor in self.partial_order.ready_successors(event):
+        if successor.proceed(self.simulation):
+          successor.timed_out = False
+          successor.replay_time = SyncTime.now()
+          self.partial_order.record_match(successor)
+          self.stats.event_reordered(successor)
+          self.stats.event_matched(successor)
+          self._log_event(successor)
+          # Matching it may have made further successors ready
+          progress = True
+          break
+    for successor in self.partial_order.ready_successors(event):
+      key = arrival_key(successor)
+      if key is not None and key[0] in self._notified_kinds:
+        self._alternate_keys.add(key)
+
+  def _wait_for_arrival(self, until):
+    ''' select() until the awaited key arrives, or until the given time. I/O
+    that doesn't concern the awaited event doesn't end the wait. '''
+    while not self._woken:
+      remaining = until - time.time()
+      if remaining <= 0:
+        break
+      self.select_continuation(remaining)
+
+  def _now(self):
+    if self.clock is not None:
+      return self.clock.time()
+    return time.time()
+
   def update_event_time(self, event):
     """ update our bearing on where we currently our in the timeline """
-    self.last_real_time = time.time()
+    self.last_real_time = self._now()
     self.last_rec_time = event.time
 
   def wait_time(self, event):
@@ -302,7 +548,7 @@ class EventScheduler(EventSchedulerBase):
       return self.initial_wait
 
     rec_delta = (event.time.as_float() - self.last_rec_time.as_float()) / self.speedup
-    real_delta = time.time() - self.last_real_time
+    real_delta = self._now() - self.last_real_time
 
     to_wait = rec_delta - real_delta
     if self.assertion_checking and to_wait > 10000:
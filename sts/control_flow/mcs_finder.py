@@ -23,7 +23,9 @@ find the minimal causal sequence (MCS) of a failure.
 from sts.util.console import msg, color, Tee
 from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir
 from sts.util.rpc_forker import LocalForker, test_serialize_response
-from sts.util.precompute_cache import PrecomputeCache
+from sts.util.fork_pool import ForkPool
+from sts.util.precompute_cache import PrecomputeCache, ReplayOutcomeCache, MonotoneOutcomeIndex
+from sts.util.latency_histogram import ReplayLatencies
 from sts.replay_event import *
 from sts.event_dag import EventDag, split_list
 import sts.input_traces.log_parser as log_parser
@@ -35,6 +37,8 @@ from config.invariant_checks import name_to_invariant_check
 
 from collections import Counter
 import copy
+import functools
+import threading
 import sys
 import time
 import random
@@ -51,9 +55,56 @@ class MCSFinder(ControlFlow):
                optimized_filtering=False, forker=LocalForker(),
                replay_final_trace=True, strict_assertion_checking=False,
                no_violation_verification_runs=None,
+               num_replay_workers=1,
+               use_replay_cache=False, replay_cache_path=None,
+               assume_monotone=False, prebootstrap_replays=False,
+               resume_from_checkpoint=False, split_strategy=split_list,
+               adaptive_replay_deadline=False, replay_deadline_margin=0.5,
                **kwargs):
     ''' Note that you may pass in any keyword argument for Replayer to
-    MCSFinder, except 'bug_signature' and 'invariant_check_name' '''
+    MCSFinder, except 'bug_signature' and 'invariant_check_name'
+
+    If num_replay_workers > 1, all subsets and complements of each delta
+    debugging level are replayed at the same time, in up to
+    num_replay_workers forked children. The violating subset that is chosen
+    is the same as in sequential mode: subsets are preferred over
+    complements, and lower indices over higher indices.
+
+    If use_replay_cache is True, the outcome of every replay is stored on
+    disk in replay_cache_path, and later replays of the same subsequence
+    with the same replay configuration (e.g. after the MCS run is aborted
+    and restarted) are looked up rather than forked. replay_cache_path
+    defaults to a "replay_cache" directory next to the superlog, i.e. in the
+    results directory of the experiment that produced the trace.
+
+    If assume_monotone is True, delta debugging assumes that any superset of
+    a subsequence that reproduced the violation also reproduces it, and that
+    any subset of a subsequence that did not reproduce the violation does
+    not either. Subsequences whose outcome is implied this way are not
+    replayed.
+
+    If prebootstrap_replays is True, the controller-independent part of
+    bootstrapping (topology, patch panel, dataplane trace) is done once in
+    this process before any replays, and every forked replay starts from a
+    copy of it (see SimulationConfig.prebootstrap()). Only useful with
+    forkers whose children are fork()ed from this process.
+
+    The result of every replay is checkpointed to mcs_checkpoint.json in the
+    results directory. If resume_from_checkpoint is True (see simulator.py's
+    --resume), a previous run's checkpoint in the same results directory is
+    loaded, and the search continues after the last replay it completed
+    (see ReplayCheckpoint).
+
+    split_strategy is a function (inputs, split_ways) -> list of splits that
+    partitions inputs for delta debugging, e.g. split_list (contiguous
+    chunks), or a TopologyAwareSplitter (chunks of inputs affecting nearby
+    network elements).
+
+    If adaptive_replay_deadline is True, the wall-clock time until the
+    violation was detected is recorded for every replay that reproduced it,
+    and later replays are cut off once they run (1 + replay_deadline_margin)
+    times longer than the slowest of those (see ReplayDeadlineEstimator).
+    Every cutoff is recorded in the runtime stats (early_cutoffs). '''
     super(MCSFinder, self).__init__(simulation_cfg)
     # number of subsequences delta debugging has examined so far, for
     # distingushing runtime stats from different intermediate runs.
@@ -73,6 +124,7 @@ class MCSFinder(ControlFlow):
     self.invariant_check_name = invariant_check_name
     self.invariant_check = name_to_invariant_check[invariant_check_name]
 
+    self.superlog_path = None
     if type(superlog_path_or_dag) == str:
       self.superlog_path = superlog_path_or_dag
       # The dag is codefied as a list, where each element has
@@ -124,6 +176,28 @@ class MCSFinder(ControlFlow):
     self.forker = forker
     self.replay_final_trace = replay_final_trace
     self.strict_assertion_checking = strict_assertion_checking
+    if num_replay_workers < 1:
+      raise ValueError("num_replay_workers must be at least 1")
+    self.num_replay_workers = num_replay_workers
+    self._runtime_stats.set_num_replay_workers(num_replay_workers)
+    # Guards subsequence_id and replay_log_tracker, which are shared by all
+    # replay workers.
+    self._replay_lock = threading.Lock()
+    self.use_replay_cache = use_replay_cache
+    self.replay_cache_path = replay_cache_path
+    self.replay_cache = None
+    self.monotone_index = MonotoneOutcomeIndex() if assume_monotone else None
+    self.prebootstrap_replays = prebootstrap_replays
+    self.resume_from_checkpoint = resume_from_checkpoint
+    self.checkpoint = None
+    self.split_strategy = split_strategy
+    self.deadline_estimator = None
+    if adaptive_replay_deadline:
+      self.deadline_estimator = ReplayDeadlineEstimator(replay_deadline_margin)
+    # Internal events buffered at the end of the original run (see
+    # _load_original_buffered_receives()), or None if unknown
+    self._original_buffered_receives = None
+    self._original_buffered_receives_loaded = False
 
   def log(self, s):
     ''' Output a message to both self._log and self._extra_log '''
@@ -148,12 +222,18 @@ class MCSFinder(ControlFlow):
 
   def init_results(self, results_dir):
     ''' Precondition: results_dir exists, and is clean (preferably
-    initialized by experiments/setup.py).'''
+    initialized by experiments/setup.py), unless we are resuming from a
+    checkpoint in results_dir.'''
     if self._extra_log is None:
-      self._extra_log = open("%s/mcs_finder.log" % results_dir, "w")
+      self._extra_log = open("%s/mcs_finder.log" % results_dir,
+                             "a" if self.resume_from_checkpoint else "w")
     if self._runtime_stats.get_runtime_stats_path() is None:
       runtime_stats_path = "%s/runtime_stats.json" % results_dir
       self._runtime_stats.set_runtime_stats_path(runtime_stats_path)
+    if (self.resume_from_checkpoint and
+        os.path.exists(self._runtime_stats.get_runtime_stats_path())):
+      # The stats are rebuilt from the checkpoint, and written out again
+      os.remove(self._runtime_stats.get_runtime_stats_path())
     if self.mcs_trace_path is None:
       self.mcs_trace_path = "%s/mcs.trace" % results_dir
     # TODO(cs): assumes that transform dag is a peeker, not some other
@@ -163,6 +243,23 @@ class MCSFinder(ControlFlow):
                                          self._runtime_stats,
                                          self.simulation_cfg, peeker_exists)
     self.replay_log_tracker = ReplayLogTracker(results_dir)
+    if self.use_replay_cache:
+      if self.replay_cache_path is None:
+        if self.superlog_path is not None:
+          superlog_dir = os.path.dirname(os.path.abspath(self.superlog_path))
+        else:
+          superlog_dir = results_dir
+        self.replay_cache_path = os.path.join(superlog_dir, "replay_cache")
+      self.log("Using replay outcome cache %s" % self.replay_cache_path)
+      self.replay_cache = ReplayOutcomeCache(self.replay_cache_path)
+    run_id = ReplayOutcomeCache.make_key([ e.label for e in self.dag.input_events ],
+                                         self.invariant_check_name,
+                                         self.bug_signature)
+    self.checkpoint = ReplayCheckpoint(os.path.join(results_dir, "mcs_checkpoint.json"),
+                                       run_id, resume=self.resume_from_checkpoint)
+    if self.checkpoint.num_loaded > 0:
+      self.log("Resuming from checkpoint %s (%d completed replays)" %
+               (self.checkpoint.path, self.checkpoint.num_loaded))
 
   # N.B. only called in the parent process.
   def simulate(self, check_reproducibility=True):
@@ -177,6 +274,9 @@ class MCSFinder(ControlFlow):
     if len(self.dag) == 0:
       raise RuntimeError("No supported input types?")
 
+    if self.prebootstrap_replays:
+      self.simulation_cfg.prebootstrap()
+
     if check_reproducibility:
       # First, run through without pruning to verify that the violation exists
       self._runtime_stats.record_replay_start()
@@ -249,8 +349,8 @@ class MCSFinder(ControlFlow):
     #   http://www.st.cs.uni-saarland.de/papers/tse2002/tse2002.pdf,
     # Section 3.2
     # TODO(cs): we could do much better if we leverage domain knowledge (e.g.,
-    # start by pruning all LinkFailures, or splitting by nodes rather than
-    # time)
+    # start by pruning all LinkFailures). To split by nodes rather than time,
+    # pass split_strategy=TopologyAwareSplitter(...)
     if split_ways > len(dag.input_events):
       self.log("Done")
       return (dag, total_inputs_pruned)
@@ -259,8 +359,12 @@ class MCSFinder(ControlFlow):
     subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
     print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
 
-    subsets = split_list(dag.input_events, split_ways)
+    subsets = self.split_strategy(dag.input_events, split_ways)
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s) for i, s in enumerate(subsets)))
+    if self.num_replay_workers > 1:
+      return self._parallel_ddmin_level(dag, split_ways, subsets,
+                                        precompute_cache, label_prefix,
+                                        total_inputs_pruned)
     for i, subset in enumerate(subsets):
       label = local_label(i)
       new_dag = dag.input_subset(subset)
@@ -315,6 +419,12 @@ class MCSFinder(ControlFlow):
                            total_inputs_pruned=total_inputs_pruned)
 
     self.log_no_violation("No complements with violations.")
+    return self._increase_granularity(dag, split_ways, precompute_cache,
+                                      label_prefix, total_inputs_pruned)
+
+  # N.B. always called by the parent process.
+  def _increase_granularity(self, dag, split_ways, precompute_cache,
+                            label_prefix, total_inputs_pruned):
     if split_ways < len(dag.input_events):
       self.log("Increasing granularity.")
       return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
@@ -323,24 +433,138 @@ class MCSFinder(ControlFlow):
                          total_inputs_pruned=total_inputs_pruned)
     return (dag, total_inputs_pruned)
 
+  # N.B. always called by the parent process.
+  def _parallel_ddmin_level(self, dag, split_ways, subsets, precompute_cache,
+                            label_prefix, total_inputs_pruned):
+    ''' Same as one level of _ddmin(), except that all subsets and
+    complements are replayed at once. Ties are broken exactly as the
+    sequential version would: the first violating subset wins, then the first
+    violating complement. '''
+    local_label = lambda i, inv=False: "%s%d/%d" % ("~" if inv else "", i, split_ways)
+    subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
+    print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
+
+    # [(subset index, is complement, label, new_dag)], in tie-breaking order
+    candidates = []
+    for is_complement in [False, True]:
+      for i, subset in enumerate(subsets):
+        label = local_label(i, is_complement)
+        if is_complement:
+          new_dag = dag.input_complement(subset)
+        else:
+          new_dag = dag.input_subset(subset)
+        input_sequence = tuple(new_dag.input_events)
+        self.log("Queueing %s: %s" % ("complement" if is_complement else "subset",
+                                      print_subset(label, input_sequence)))
+        if precompute_cache.already_done(input_sequence):
+          self.log("Already computed. Skipping")
+          continue
+        precompute_cache.update(input_sequence)
+        if input_sequence == ():
+          self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                   subset_label(label))
+          continue
+        self._track_iteration_size(total_inputs_pruned)
+        candidates.append((i, is_complement, label, new_dag))
+
+    results = self._replay_candidates_parallel(
+                [ (new_dag, label) for (_, _, label, new_dag) in candidates ])
+
+    for (i, is_complement, label, new_dag), (bug_found, _) in zip(candidates, results):
+      if bug_found:
+        self.log_violation("Violation in %s %s" % ("complement" if is_complement else "subset",
+                                                   subset_label(label)))
+      else:
+        self.log_no_violation("No violation in %s %s" % ("complement" if is_complement else "subset",
+                                                         subset_label(label)))
+    winner = None
+    for candidate, (bug_found, iteration) in zip(candidates, results):
+      if bug_found:
+        winner = candidate
+        if iteration is not None:
+          self._runtime_stats.record_violation_found(iteration)
+        break
+
+    if winner is None:
+      self.log_no_violation("No subsets or complements with violations.")
+      return self._increase_granularity(dag, split_ways, precompute_cache,
+                                        label_prefix, total_inputs_pruned)
+
+    (i, is_complement, label, new_dag) = winner
+    self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+    self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
+                                                     subset_label(label), self)
+    total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+    return self._ddmin(new_dag, max(split_ways - 1, 2) if is_complement else 2,
+                       precompute_cache=precompute_cache,
+                       label_prefix=label_prefix + (label, ),
+                       total_inputs_pruned=total_inputs_pruned)
+
   # N.B. always called by the parent process.
   def _track_iteration_size(self, total_inputs_pruned):
     self._runtime_stats.record_iteration_size(len(self.dag.input_events) - total_inputs_pruned)
 
   # N.B. always called by the parent process.
-  def _check_violation(self, new_dag, subset_index, label):
-    ''' Check if there were violations '''
-    (bug_found, i) = self.replay_max_iterations(new_dag, label)
+  def _check_violation(self, new_dag, subset_index, label, replay_result=None):
+    ''' Check if there were violations. If replay_result is given, it is the
+    (bug found, iteration) tuple of a replay of new_dag that already
+    happened. '''
+    if replay_result is None:
+      implied = self._implied_outcome(new_dag, label)
+      if implied is not None:
+        replay_result = (implied, None)
+      else:
+        replay_result = self.replay_max_iterations(new_dag, label)
+        self._record_outcome(new_dag, replay_result[0])
+    (bug_found, i) = replay_result
     # Violation in the subset
     if bug_found:
       self.log_violation("Violation! Considering %d'th" % subset_index)
-      self._runtime_stats.record_violation_found(i)
+      if i is not None:
+        self._runtime_stats.record_violation_found(i)
       return True
     else:
       # No violation!
       self.log_no_violation("No violation in %d'th..." % subset_index)
       return False
 
+  # N.B. always called by the parent process.
+  def _implied_outcome(self, new_dag, label):
+    ''' If assume_monotone is set, return whether new_dag is already known
+    to reproduce the violation (True) or not (False) based on previous
+    replays. Otherwise, or if we don't know, return None. '''
+    if self.monotone_index is None:
+      return None
+    implied = self.monotone_index.implied_outcome(
+                [ e.label for e in new_dag.input_events ])
+    if implied is not None:
+      self.log("Outcome of %s implied by monotonicity (%s). Skipping replay" %
+               (label, "violation" if implied else "no violation"))
+      self._runtime_stats.record_replay_skipped_by_monotonicity()
+    return implied
+
+  # N.B. always called by the parent process.
+  def _record_outcome(self, new_dag, bug_found):
+    if self.monotone_index is not None:
+      self.monotone_index.update([ e.label for e in new_dag.input_events ],
+                                 bug_found)
+
+  # N.B. always called by the parent process.
+  def _replay_candidates_parallel(self, dags_and_labels):
+    ''' replay_max_iterations_parallel() for delta debugging candidates.
+    Candidates whose outcome is implied by monotonicity (if assume_monotone
+    is set) are not replayed; their iteration is None. '''
+    results = [ (self._implied_outcome(new_dag, label), None)
+                for new_dag, label in dags_and_labels ]
+    to_replay = [ idx for idx, (implied, _) in enumerate(results)
+                  if implied is None ]
+    replayed = self.replay_max_iterations_parallel([ dags_and_labels[idx]
+                                                     for idx in to_replay ])
+    for idx, result in zip(to_replay, replayed):
+      results[idx] = result
+      self._record_outcome(dags_and_labels[idx][0], result[0])
+    return results
+
   def replay_max_iterations(self, new_dag, label, ignore_runtime_stats=False):
     '''
     Attempt to reproduce the bug up to self.max_replays_per_subsequence
@@ -355,17 +579,165 @@ class MCSFinder(ControlFlow):
 
     for i in range(0, self.max_replays_per_subsequence):
       bug_found = self.replay(new_dag, label,
-                              ignore_runtime_stats=ignore_runtime_stats)
+                              ignore_runtime_stats=ignore_runtime_stats,
+                              attempt=i)
       if bug_found:
         break
     return (bug_found, i)
 
-  def replay(self, new_dag, label, ignore_runtime_stats=False):
+  def replay_max_iterations_parallel(self, dags_and_labels,
+                                     ignore_runtime_stats=False):
+    '''
+    Same as replay_max_iterations(), but for a list of (new_dag, label)
+    tuples, replayed concurrently by up to self.num_replay_workers children.
+
+    Returns a list of (bug found, 0-indexed iteration at which bug was found),
+    in the same order as dags_and_labels.
+    '''
+    if self.transform_dag:
+      log.info("Transforming dags")
+      dags_and_labels = [ (self.transform_dag(new_dag), label)
+                          for new_dag, label in dags_and_labels ]
+      log.info("Proceeding with normal replay")
+
+    def replay_job(new_dag, label, worker_id):
+      task_name = "play_forward_%d" % worker_id
+      attempts = []
+      for i in range(0, self.max_replays_per_subsequence):
+        attempts.append(self._fork_replay(new_dag, label, task_name=task_name,
+                                          attempt=i))
+        if attempts[-1][0]:
+          break
+      return attempts
+
+    pool = ForkPool(self.num_replay_workers)
+    pool_results = pool.map([ functools.partial(replay_job, new_dag, label)
+                              for new_dag, label in dags_and_labels ])
+
+    # Fold in the results in a deterministic order, regardless of the order in
+    # which the children finished.
+    results = []
+    first_violation = None
+    for (new_dag, _), pool_result in zip(dags_and_labels, pool_results):
+      self._runtime_stats.record_pool_replay(pool_result.worker_id,
+                                             pool_result.queue_wait_seconds,
+                                             pool_result.run_seconds)
+      for attempt in pool_result.value:
+        self._process_replay_result(new_dag, attempt,
+                                    ignore_runtime_stats=ignore_runtime_stats)
+      bug_found = pool_result.value[-1][0]
+      if bug_found and first_violation is None:
+        first_violation = (new_dag, pool_result.value[-1])
+      results.append((bug_found, len(pool_result.value) - 1))
+
+    if first_violation is not None:
+      # Timed out labels are stored on the shared events, so make sure that
+      # the ones that stick are from the subsequence delta debugging will
+      # choose, just as they would have been in sequential mode.
+      (new_dag, (_, _, timed_out_internal)) = first_violation
+      new_dag.set_events_as_timed_out(timed_out_internal)
+    return results
+
+  def replay(self, new_dag, label, ignore_runtime_stats=False, attempt=0):
+    ''' attempt is the 0-indexed number of times this subsequence has already
+    been replayed in the current replay_max_iterations() loop. '''
     # Run the simulation forward
+    result = self._fork_replay(new_dag, label, attempt=attempt)
+    return self._process_replay_result(new_dag, result,
+                                       ignore_runtime_stats=ignore_runtime_stats)
+
+  def _process_replay_result(self, new_dag, result, ignore_runtime_stats=False):
+    ''' Record the result of one replay returned by _fork_replay(). Returns
+    whether a violation was found. '''
+    (violation_found, client_runtime_stats, timed_out_internal) = result
+    new_dag.set_events_as_timed_out(timed_out_internal)
+    if client_runtime_stats is None:
+      # Served from the replay cache; nothing was replayed.
+      self._runtime_stats.record_replay_cache_hit()
+      return violation_found
+
+    if self.replay_cache is not None:
+      self._runtime_stats.record_replay_cache_miss()
     self._runtime_stats.record_replay_stats(len(new_dag.input_events))
 
+    # Replays that were cut off only tell us that the violation occurred
+    # some time before the deadline
+    if (violation_found and self.deadline_estimator is not None and
+        not client_runtime_stats.get('early_cutoffs')):
+      for seconds in client_runtime_stats.get('seconds_until_violation', {}).values():
+        self.deadline_estimator.record(seconds)
+
+    if not ignore_runtime_stats:
+      self._runtime_stats.merge_client_dict(client_runtime_stats)
+    elif client_runtime_stats.get('early_cutoffs'):
+      # Always account for cutoffs, since they may have changed the outcome
+      self._runtime_stats.merge_client_dict(
+        { 'early_cutoffs' : client_runtime_stats['early_cutoffs'] })
+
+    return violation_found
+
+  def _replay_cache_key(self, new_dag, attempt):
+    ''' Content hash of everything that determines the outcome of a replay:
+    the (label, fingerprint) of every event to be replayed, and the
+    replay-relevant configuration. '''
+    events = [ (e.label, dictify_fingerprint(e.fingerprint))
+               for e in new_dag.events ]
+    # Only include configuration values that have a stable representation
+    # (not e.g. object addresses).
+    replayer_kwargs = sorted((k, v if type(v) in (bool, int, long, float, str, unicode, type(None))
+                                  else type(v).__name__)
+                             for k, v in self.kwargs.iteritems())
+    config = (str(self.simulation_cfg), self.invariant_check_name,
+              self.bug_signature, replayer_kwargs)
+    return ReplayOutcomeCache.make_key(events, config, attempt)
+
+  def _fork_replay(self, new_dag, label, task_name="play_forward", attempt=0):
+    ''' Replay new_dag in a child process, and return the child's
+    (violation_found, client_runtime_stats, timed_out_internal) tuple.
+    If the outcome was found in the replay cache, client_runtime_stats is
+    None and no child is forked. If the result was found in the checkpoint,
+    it is returned without forking a child.
+
+    May be called concurrently from several threads, as long as each thread
+    uses a distinct task_name. '''
+    cache_key = None
+    if self.replay_cache is not None:
+      cache_key = self._replay_cache_key(new_dag, attempt)
+      cached = self.replay_cache.get(cache_key)
+      if cached is not None:
+        (violation_found, timed_out_internal) = cached
+        return (violation_found, None, timed_out_internal)
+
+    checkpoint_key = None
+    if self.checkpoint is not None:
+      checkpoint_key = ReplayCheckpoint.make_key(new_dag, label, attempt)
+      result = self.checkpoint.get(checkpoint_key)
+      if result is not None:
+        self.log("Result of %s restored from checkpoint" % label)
+        with self._replay_lock:
+          # Keep replay directories and subsequence ids the same as in the
+          # checkpointed run
+          self.replay_log_tracker.get_replay_logger_dir(label)
+          self.subsequence_id += 1
+          self._runtime_stats.record_replay_restored_from_checkpoint()
+        return result
+
+    (violation_found, client_runtime_stats,
+     timed_out_internal) = self._fork_replay_child(new_dag, label, task_name)
+    # Outcomes of replays that were cut off depend on the deadline, which
+    # isn't part of the cache key
+    if cache_key is not None and not client_runtime_stats.get('early_cutoffs'):
+      self.replay_cache.put(cache_key, violation_found, timed_out_internal)
+    if checkpoint_key is not None:
+      self.checkpoint.put(checkpoint_key, (violation_found, client_runtime_stats,
+                                           timed_out_internal))
+    return (violation_found, client_runtime_stats, timed_out_internal)
+
+  def _fork_replay_child(self, new_dag, label, task_name):
+    ''' Unconditionally fork a child that replays new_dag, and return its
+    (violation_found, client_runtime_stats, timed_out_internal) tuple. '''
     # N.B. this function is run as a child process.
-    def play_forward(results_dir, subsequence_id):
+    def play_forward(results_dir, subsequence_id, deadline_seconds):
       # TODO(cs): need to serialize the parameters to Replayer rather than
       # wrapping them in a closure... otherwise, can't use RemoteForker
       # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
@@ -378,16 +750,23 @@ class MCSFinder(ControlFlow):
 
       # Set up replayer.
       input_logger = InputLogger()
+      replayer_kwargs = dict(self.kwargs)
+      if deadline_seconds is not None:
+        replayer_kwargs['deadline_seconds'] = deadline_seconds
       replayer = Replayer(self.simulation_cfg, new_dag,
                           input_logger=input_logger,
                           bug_signature=self.bug_signature,
                           invariant_check_name=self.invariant_check_name,
-                          **self.kwargs)
+                          **replayer_kwargs)
       replayer.init_results(results_dir)
       self._runtime_stats = RuntimeStats(subsequence_id)
       simulation = None
       try:
         simulation = replayer.simulate()
+        self._runtime_stats.record_bootstrap(simulation.bootstrap_duration,
+                                             simulation.bootstrap_seconds_saved)
+        self._runtime_stats.record_replay_timing(replayer.violation_seconds,
+                                                 replayer.cutoff, label)
         self._track_new_internal_events(simulation, replayer)
       except SystemExit:
         # One of the invariant checks bailed early. Oddly, this is not an
@@ -398,27 +777,32 @@ class MCSFinder(ControlFlow):
       finally:
         input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
         if simulation is not None:
+          start = time.time()
           simulation.clean_up()
+          replayer.latencies.record_phase("cleanup", time.time() - start)
         tee.close()
+      self._runtime_stats.record_replay_latencies(replayer.latencies.to_dict())
       if self.strict_assertion_checking:
         test_serialize_response(violations, self._runtime_stats.client_dict())
       timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
       return (simulation.violation_found, self._runtime_stats.client_dict(), timed_out_internal)
 
-    # TODO(cs): once play_forward() is no longer a closure, register it only once
-    self.forker.register_task("play_forward", play_forward)
-    results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
-    self.subsequence_id += 1
-    (violation_found, client_runtime_stats,
-                 timed_out_internal) = self.forker.fork("play_forward",
-                                                        results_dir,
-                                                        self.subsequence_id)
-    new_dag.set_events_as_timed_out(timed_out_internal)
-
-    if not ignore_runtime_stats:
-      self._runtime_stats.merge_client_dict(client_runtime_stats)
-
-    return violation_found
+    with self._replay_lock:
+      self._load_original_buffered_receives()
+      # TODO(cs): once play_forward() is no longer a closure, register it only once
+      self.forker.register_task(task_name, play_forward)
+      results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
+      self.subsequence_id += 1
+      subsequence_id = self.subsequence_id
+      deadline_seconds = self._replay_deadline()
+    return self.forker.fork(task_name, results_dir, subsequence_id,
+                            deadline_seconds)
+
+  def _replay_deadline(self):
+    ''' Return the deadline_seconds for the next replay, or None '''
+    if self.deadline_estimator is None:
+      return None
+    return self.deadline_estimator.deadline()
 
   def _optimize_event_dag(self):
     ''' Employs domain knowledge of event classes to reduce the size of event
@@ -439,23 +823,35 @@ class MCSFinder(ControlFlow):
         self.log("\t** VIOLATION for pruning event type %s! Resizing original dag" % event_type)
         self.dag = pruned_dag
 
-  # N.B. always called within a child process.
-  def _track_new_internal_events(self, simulation, replayer):
-    ''' Pre: simulation must have been run through a replay'''
-    # We always check against internal events that were buffered at the end of
-    # the original run (don't want to overcount)
-    prev_buffered_receives = []
+  # N.B. always called by the parent process, before any replays are forked,
+  # so that children inherit the result rather than parsing it themselves.
+  def _load_original_buffered_receives(self):
+    ''' Parse the internal events that were buffered at the end of the
+    original run (the superlog's .unacked file) '''
+    if self._original_buffered_receives_loaded:
+      return
+    self._original_buffered_receives_loaded = True
+    if self.superlog_path is None:
+      return
     try:
       path = self.superlog_path + ".unacked"
       if not os.path.exists(path):
         log.warn("unacked internal events file from original run does not exist")
         return
-      prev_buffered_receives = set([ e.pending_receive for e in
+      self._original_buffered_receives = frozenset([ e.pending_receive for e in
                                      [ f for f in EventDag(log_parser.parse_path(path)).events
                                        if type(f) == ControlMessageReceive ] ])
     except ValueError as e:
       log.warn("unacked internal events is corrupt? %r" % e)
+
+  # N.B. always called within a child process.
+  def _track_new_internal_events(self, simulation, replayer):
+    ''' Pre: simulation must have been run through a replay'''
+    # We always check against internal events that were buffered at the end of
+    # the original run (don't want to overcount)
+    if self._original_buffered_receives is None:
       return
+    prev_buffered_receives = set(self._original_buffered_receives)
     buffered_message_receipts = []
     for p in simulation.openflow_buffer.pending_receives:
       if p not in prev_buffered_receives:
@@ -469,6 +865,8 @@ class MCSFinder(ControlFlow):
     self._runtime_stats.record_early_internal_events(replayer.early_state_changes)
     self._runtime_stats.record_timed_out_events(replayer.event_scheduler_stats.get_timeouts_dict())
     self._runtime_stats.record_matched_events(replayer.event_scheduler_stats.get_matches_dict())
+    self._runtime_stats.record_reordered_events(replayer.event_scheduler_stats.get_reordered_dict())
+    self._runtime_stats.record_event_wait_latencies(replayer.event_scheduler_stats.get_wait_latency_dict())
 
 
 # TODO(cs): Hack alert. Shouldn't be a subclass
@@ -498,23 +896,33 @@ class EfficientMCSFinder(MCSFinder):
       self.log("Base case %s" % str(dag.input_events))
       return (dag, total_inputs_pruned)
 
-    (left, right) = split_list(dag.atomic_input_events, 2)
+    (left, right) = self.split_strategy(dag.atomic_input_events, 2)
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s)
                                     for i, s in enumerate([left,right])))
     # This is: [dag.input_subset(left), dag.input_subset(right)]
-    left_right_dag = []
-
-    for i, subsequence in enumerate([left, right]):
+    left_right_dag = [ dag.atomic_input_subset(subsequence)
+                       for subsequence in [left, right] ]
+    # We test on subsequence U carryover_inputs
+    test_dags = [ new_dag.insert_atomic_inputs(carryover_inputs)
+                  for new_dag in left_right_dag ]
+    # If we have multiple replay workers, test both halves at once. The left
+    # half still takes precedence if both reproduce the violation.
+    replay_results = [None, None]
+    if self.num_replay_workers > 1:
+      for _ in test_dags:
+        self._track_iteration_size(total_inputs_pruned)
+      replay_results = self._replay_candidates_parallel(
+                         zip(test_dags, [local_label(0), local_label(1)]))
+
+    for i, new_dag in enumerate(left_right_dag):
       label = local_label(i)
       prefix = label_prefix + (label, )
-      new_dag = dag.atomic_input_subset(subsequence)
       self.log("Current subset: %s" % print_subset(label,
                                                    new_dag.atomic_input_events))
-      left_right_dag.append(new_dag)
-      # We test on subsequence U carryover_inputs
-      test_dag = new_dag.insert_atomic_inputs(carryover_inputs)
-      self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(test_dag, i, label)
+      if replay_results[i] is None:
+        self._track_iteration_size(total_inputs_pruned)
+      violation = self._check_violation(test_dags[i], i, label,
+                                        replay_result=replay_results[i])
       if violation:
         self.log("Violation found in %dth half. Recursing" % i)
         total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
@@ -558,6 +966,104 @@ class ReplayLogTracker(object):
     self.count += 1
     return dst
 
+class ReplayDeadlineEstimator(object):
+  ''' Learns how long replays of a trace take until the violation is
+  detected, and derives a wall-clock deadline beyond which later replays are
+  unlikely to reproduce it.
+
+  The deadline is (1 + margin) times the slowest time-until-violation
+  observed so far, or None (no deadline) until min_samples replays have
+  reproduced the violation. The first replay MCSFinder runs is of the full
+  trace, which is usually the slowest to reproduce the violation.
+  '''
+  def __init__(self, margin=0.5, min_samples=1):
+    if margin < 0:
+      raise ValueError("margin must be non-negative")
+    self.margin = margin
+    self.min_samples = min_samples
+    self.samples = []
+
+  def record(self, seconds_until_violation):
+    self.samples.append(seconds_until_violation)
+
+  def deadline(self):
+    if len(self.samples) < self.min_samples:
+      return None
+    return max(self.samples) * (1 + self.margin)
+
+class ReplayCheckpoint(object):
+  ''' Crash-safe, append-only journal of the result of every replay that
+  MCSFinder forks, kept in the results directory.
+
+  Delta debugging is deterministic given the outcomes of its replays, so the
+  journal is enough to restore the full search state (current subsequence,
+  EfficientMCSFinder's carryover inputs, precompute caches, RuntimeStats): a
+  resumed MCSFinder runs the search again from the start, and answers every
+  replay found in the journal without forking it.
+  '''
+  def __init__(self, path, run_id, resume=False):
+    ''' run_id identifies the MCS run, so that we don't resume from another
+    run's journal. '''
+    self.path = path
+    self._lock = threading.Lock()
+    # { key -> [results in the order they were journaled] }
+    self._results = {}
+    self.num_loaded = 0
+    if resume and os.path.exists(path):
+      self._load(run_id)
+      self._file = open(path, "a")
+    else:
+      self._file = open(path, "w")
+      self._append({'run_id' : run_id})
+
+  def _load(self, run_id):
+    valid_bytes = 0
+    with open(self.path) as journal:
+      for line in journal:
+        try:
+          entry = json.loads(line)
+        except ValueError:
+          # The last line may have been cut short by a crash.
+          break
+        if valid_bytes == 0:
+          if entry.get('run_id') != run_id:
+            raise ValueError("Checkpoint %s was written by a different MCS run" %
+                             self.path)
+        else:
+          self._results.setdefault(entry['key'], []).append(entry['result'])
+          self.num_loaded += 1
+        valid_bytes += len(line)
+    # Drop any partial line, so that our appends start on a fresh line
+    with open(self.path, "r+") as journal:
+      journal.truncate(valid_bytes)
+
+  def _append(self, entry):
+    self._file.write(json.dumps(entry) + "\n")
+    self._file.flush()
+    os.fsync(self._file.fileno())
+
+  @staticmethod
+  def make_key(new_dag, label, attempt):
+    return ReplayOutcomeCache.make_key(label, attempt,
+                                       [ e.label for e in new_dag.input_events ])
+
+  def get(self, key):
+    ''' Return a journaled (violation_found, client_runtime_stats,
+    timed_out_internal) tuple for key, or None. Each journaled result is
+    returned only once. '''
+    with self._lock:
+      results = self._results.get(key)
+      if not results:
+        return None
+      return tuple(results.pop(0))
+
+  def put(self, key, result):
+    with self._lock:
+      self._append({'key' : key, 'result' : result})
+
+  def close(self):
+    self._file.close()
+
 class MCSLogTracker(object):
   ''' Logs intermedate and final MCS results that are the outcome(s) of delta
   debugging'''
@@ -613,8 +1119,17 @@ class RuntimeStats(object):
 
   child_fields = ['new_internal_events',
                   'early_internal_events', 'timed_out_events',
-                  'matched_events', 'buffered_message_receipts']
+                  'matched_events', 'reordered_events',
+                  'buffered_message_receipts',
+                  'bootstrap_durations', 'bootstrap_seconds_saved',
+                  'seconds_until_violation', 'early_cutoffs',
+                  'event_wait_latencies', 'replay_latencies']
   child_counters = []
+  # child_fields of the form { replay iteration -> [string representations of
+  # events] }, which are sent to the parent grouped by event, as
+  # { replay iteration -> [[string representation, count]] }
+  grouped_child_fields = ['new_internal_events', 'early_internal_events',
+                          'buffered_message_receipts']
 
   def __init__(self, subsequence_id, runtime_stats_path=None):
     ''' runtime_stats_path should only be None if the stats of this replay run
@@ -636,6 +1151,27 @@ class RuntimeStats(object):
     self.timed_out_events = {}
     # { replay iteration -> { event type -> successful matches } }
     self.matched_events = {}
+    # { replay iteration -> { event type -> matches out of recorded order,
+    #                         with Replayer's partial_order } }
+    self.reordered_events = {}
+    # { replay iteration -> { event type -> wait latencies, as given by
+    #                         EventSchedulerStats.get_wait_latency_dict() } }
+    self.event_wait_latencies = {}
+    # { replay iteration -> latency histograms per event class and replay
+    #                       phase, as given by ReplayLatencies.to_dict() }
+    self.replay_latencies = {}
+    # { replay iteration -> seconds spent bootstrapping the simulation }
+    self.bootstrap_durations = {}
+    # { replay iteration -> seconds of bootstrapping skipped thanks to
+    #                       SimulationConfig.prebootstrap() }
+    self.bootstrap_seconds_saved = {}
+    # { replay iteration -> wall-clock seconds from the first scheduled event
+    #                       until the violation was detected }
+    self.seconds_until_violation = {}
+    # { replay iteration -> { "label", "deadline_seconds", "elapsed_seconds",
+    #                         "events_skipped" } } for replays that were cut
+    # off by MCSFinder's adaptive_replay_deadline
+    self.early_cutoffs = {}
     # -------------------- Stats set by parent process -------------------- #
     # { delta debugging subseqence # -> count of remaining events }
     self.iteration_size = {}
@@ -662,6 +1198,26 @@ class RuntimeStats(object):
     self.ambiguous_counts = {}
     # { class of event -> # occurences of ambiguity }
     self.ambiguous_events = {}
+    # Number of concurrent replay children (see MCSFinder.num_replay_workers)
+    self.num_replay_workers = 1
+    # { replay worker id -> [wall-clock seconds of each job run by the worker] }
+    self.replay_worker_durations = {}
+    # [seconds each parallel replay job waited before a worker picked it up]
+    self.replay_queue_wait_seconds = []
+    # Replays whose outcome was / was not found in the on-disk replay cache
+    self.replay_cache_hits = 0
+    self.replay_cache_misses = 0
+    # Replays that were skipped because their outcome was implied by
+    # monotonicity (see MCSFinder.assume_monotone)
+    self.replays_skipped_by_monotonicity = 0
+    # Replays whose result was restored from a checkpoint rather than forked
+    # (see MCSFinder.resume_from_checkpoint)
+    self.replays_restored_from_checkpoint = 0
+    # { string representation of new internal event -> # of times it was
+    #   observed, summed over all replays }
+    self.new_internal_event_counts = Counter()
+    # replay_latencies, merged over all replays
+    self.replay_latency_totals = ReplayLatencies().to_dict()
 
   def write_runtime_stats(self):
     # Now write contents to a file
@@ -736,6 +1292,29 @@ class RuntimeStats(object):
     self.iteration_size[self._iteration] = iteration_size
     self._iteration += 1
 
+  def set_num_replay_workers(self, num_replay_workers):
+    self.num_replay_workers = num_replay_workers
+
+  def record_pool_replay(self, worker_id, queue_wait_seconds, run_seconds):
+    ''' Should be invoked once for every job run by a parallel replay worker
+    (which may include several replays of the same subsequence) '''
+    if worker_id not in self.replay_worker_durations:
+      self.replay_worker_durations[worker_id] = []
+    self.replay_worker_durations[worker_id].append(run_seconds)
+    self.replay_queue_wait_seconds.append(queue_wait_seconds)
+
+  def record_replay_skipped_by_monotonicity(self):
+    self.replays_skipped_by_monotonicity += 1
+
+  def record_replay_restored_from_checkpoint(self):
+    self.replays_restored_from_checkpoint += 1
+
+  def record_replay_cache_hit(self):
+    self.replay_cache_hits += 1
+
+  def record_replay_cache_miss(self):
+    self.replay_cache_misses += 1
+
   def record_violation_found(self, verification_iteration):
     if type(self.violation_found_in_run) != Counter:
       self.violation_found_in_run = Counter(self.violation_found_in_run)
@@ -758,8 +1337,45 @@ class RuntimeStats(object):
   def record_matched_events(self, matched_events):
     self.matched_events[self.subsequence_id] = matched_events
 
+  def record_reordered_events(self, reordered_events):
+    self.reordered_events[self.subsequence_id] = reordered_events
+
+  def record_event_wait_latencies(self, event_wait_latencies):
+    self.event_wait_latencies[self.subsequence_id] = event_wait_latencies
+
+  def record_replay_latencies(self, replay_latencies):
+    self.replay_latencies[self.subsequence_id] = replay_latencies
+
+  def record_bootstrap(self, duration, seconds_saved):
+    self.bootstrap_durations[self.subsequence_id] = duration
+    self.bootstrap_seconds_saved[self.subsequence_id] = seconds_saved
+
+  def record_replay_timing(self, violation_seconds, cutoff, label):
+    if violation_seconds is not None:
+      self.seconds_until_violation[self.subsequence_id] = violation_seconds
+    if cutoff is not None:
+      cutoff = dict(cutoff)
+      cutoff["label"] = label
+      self.early_cutoffs[self.subsequence_id] = cutoff
+
   # -------------------- RPC helper methods -------------------- #
 
+  @staticmethod
+  def group_events(event_reprs):
+    ''' [string representations] -> [[string representation, count]], in
+    order of first occurrence '''
+    counts = Counter(event_reprs)
+    groups = []
+    for event_repr in event_reprs:
+      if event_repr in counts:
+        groups.append([event_repr, counts.pop(event_repr)])
+    return groups
+
+  @staticmethod
+  def ungroup_events(groups):
+    ''' Inverse of group_events() (up to the order of the events) '''
+    return [ event_repr for event_repr, count in groups for _ in xrange(count) ]
+
   def client_dict(self):
     ''' Return a serializable dict '''
     # Only include relevent fields for parent
@@ -769,6 +1385,8 @@ class RuntimeStats(object):
       # xmlrpclib doesn't allow non-string keys
       if type(v) == Counter:
         v = dict(v)
+      if field in RuntimeStats.grouped_child_fields:
+        v = dict((key, RuntimeStats.group_events(value)) for key, value in v.items())
       if type(v) == dict:
         v = dict((str(key), value) for key, value in v.items())
       d[field] = v
@@ -780,6 +1398,18 @@ class RuntimeStats(object):
         field = int(field)
       except:
         pass
+      if field in RuntimeStats.grouped_child_fields:
+        if field == 'new_internal_events':
+          for groups in value.itervalues():
+            for event_repr, count in groups:
+              self.new_internal_event_counts[event_repr] += count
+        value = dict((key, RuntimeStats.ungroup_events(groups))
+                     for key, groups in value.iteritems())
+      if field == 'replay_latencies':
+        totals = ReplayLatencies.from_dict(self.replay_latency_totals)
+        for latencies in value.itervalues():
+          totals.merge(ReplayLatencies.from_dict(latencies))
+        self.replay_latency_totals = totals.to_dict()
       if field in RuntimeStats.child_counters:
         for k, count in value.iteritems():
           getattr(self, field)[k] += count
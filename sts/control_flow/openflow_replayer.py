@@ -35,8 +35,7 @@ OpenFlow messages.
 '''
 
 from pox.openflow.libopenflow_01 import *
-from sts.event_dag import EventDag
-import sts.input_traces.log_parser as log_parser
+from sts.input_traces.trace_index import open_trace
 from sts.replay_event import ControlMessageReceive
 from sts.control_flow.replayer import Replayer
 from sts.control_flow.base import *
@@ -65,9 +64,13 @@ class OpenFlowReplayer(ControlFlow):
     self.sync_callback = ReplaySyncCallback()
     if type(superlog_path_or_dag) == str:
       superlog_path = superlog_path_or_dag
-      # The dag is codefied as a list, where each element has
-      # a list of its dependents.
-      self.event_list = EventDag(log_parser.parse_path(superlog_path)).events
+      # Only the ControlMessageReceives are replayed, so if the superlog has
+      # an index, don't decode anything else.
+      trace = open_trace(superlog_path)
+      try:
+        self.event_list = trace.select(classes=[ControlMessageReceive])
+      finally:
+        trace.close()
     else:
       self.event_list = superlog_path_or_dag.events
 
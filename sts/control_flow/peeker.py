@@ -542,7 +542,8 @@ def match_fingerprints(newly_inferred_events, expected_internal_events):
   # TODO(cs): we currently enforce something stronger than
   # happens-before: we enforce a total ordering of events (the serial order
   # recorded in the original trace). I wonder if enforcing a
-  # partial ordering would make replay more effective?
+  # partial ordering would make replay more effective? (Replayer's
+  # partial_order option relaxes the total order during replay.)
   # N.B. expected_internal_events are ordered, whereas newly_inferred_events
   # may not be.
   inferred_fingerprints = Counter([e.fingerprint for e in newly_inferred_events])
@@ -21,22 +21,27 @@ control flow for running the simulation forward.
 
 from sts.replay_event import InvariantViolation
 from sts.control_flow.interactive import Interactive
-from sts.control_flow.event_scheduler import EventScheduler
+from sts.control_flow.event_scheduler import EventScheduler, PartialOrder
 from sts.replay_event import *
 from sts.event_dag import EventDag
 import sts.input_traces.log_parser as log_parser
 from sts.util.console import color
-from sts.control_flow.base import ControlFlow, ReplaySyncCallback
+from sts.control_flow.base import ControlFlow, ReplaySyncCallback, StateChange
 from sts.util.convenience import find, find_index, base64_encode
 from sts.topology import BufferedPatchPanel
 from sts.entities import FuzzSoftwareSwitch
+from sts.openflow_buffer import PendingMessage
+from sts.util.virtual_clock import VirtualClock
+from sts.util.latency_histogram import ReplayLatencies
+from pox.openflow.software_switch import DpPacketOut
 from config.invariant_checks import name_to_invariant_check
 
+import bisect
 import signal
 import logging
 import time
 import sys
-from collections import defaultdict
+from collections import defaultdict, Counter
 
 log = logging.getLogger("Replayer")
 
@@ -61,7 +66,9 @@ class Replayer(ControlFlow):
                 'delay_flow_mods', 'invariant_check_name',
                 'bug_signature', 'end_wait_seconds',
                 'transform_dag', 'pass_through_sends', 'fail_fast',
-                'check_interval'])
+                'check_interval', 'deadline_seconds', 'virtual_time',
+                'incremental_message_window', 'partial_order',
+                'partial_order_window'])
 
   def __init__(self, simulation_cfg, superlog_path_or_dag, create_event_scheduler=None,
                print_buffers=True, wait_on_deterministic_values=False, default_dp_permit=False,
@@ -73,7 +80,9 @@ class Replayer(ControlFlow):
                delay_flow_mods=False, invariant_check_name="",
                bug_signature="", end_wait_seconds=0.5,
                transform_dag=None, pass_through_sends=False,
-               fail_fast=False, check_interval=5,
+               fail_fast=False, check_interval=5, deadline_seconds=None,
+               virtual_time=False, incremental_message_window=True,
+               partial_order=False, partial_order_window=16,
                **kwargs):
     '''
      - If invariant_check_name is not None, check it at the end for the
@@ -81,6 +90,23 @@ class Replayer(ControlFlow):
      - If bug_signature is not None, check whether this particular signature
        appears in the output of the invariant check at the end of the
        execution
+     - If deadline_seconds is not None, stop scheduling events (and waiting
+       at the end of the execution) once deadline_seconds of wall-clock time
+       have passed since the first event was scheduled, and check the
+       invariant immediately. The cutoff is recorded in self.cutoff.
+     - If virtual_time is True, the simulation runs on a VirtualClock:
+       recorded gaps between events, WaitTimes, and the wait at the end of
+       the execution are skipped over as soon as the simulation is quiet,
+       and the switches time out flow entries according to that clock.
+     - If incremental_message_window is True, allow_unexpected_messages
+       slides an ExpectedMessageWindow along the trace, rather than
+       rebuilding the expected fingerprints for every event.
+     - If partial_order is True, internal events only need to be matched in
+       happens-before order (per connection, switch, and controller; see
+       EventDag.happens_before()) rather than in the recorded total order:
+       while the scheduler waits on an internal event, causally independent
+       internal events up to partial_order_window events further along the
+       trace may be matched first.
     '''
     ControlFlow.__init__(self, simulation_cfg)
     # Label uniquely identifying this replay, set in init_results()
@@ -116,6 +142,17 @@ class Replayer(ControlFlow):
     self.print_buffers_flag = print_buffers
     self.fail_fast = fail_fast
     self.check_interval = check_interval
+    self.deadline_seconds = deadline_seconds
+    self.virtual_time = virtual_time
+    # Wall-clock time at which the first event was scheduled
+    self.replay_start = None
+    # Seconds from replay_start until the violation was detected, if it was
+    self.violation_seconds = None
+    # If the replay was cut off by deadline_seconds: a dict with the elapsed
+    # seconds and the number of events that were never scheduled
+    self.cutoff = None
+    # Latency histograms per class of event scheduled and per replay phase
+    self.latencies = ReplayLatencies()
 
     # compute interpolate to time to be just before first event
     self.compute_interpolated_time(self.dag.events[0])
@@ -131,6 +168,10 @@ class Replayer(ControlFlow):
     self._input_logger = input_logger
     self.allow_unexpected_messages = allow_unexpected_messages
     self.expected_message_round_window = expected_message_round_window
+    self.incremental_message_window = incremental_message_window
+    self.partial_order = partial_order
+    self.partial_order_window = partial_order_window
+    self._expected_message_window = None
     self.pass_through_whitelisted_messages = pass_through_whitelisted_messages
     self.pass_through_sends = pass_through_sends
     # How many logical rounds to peek ahead when deciding if a message is
@@ -165,7 +206,9 @@ class Replayer(ControlFlow):
       if self.default_dp_permit:
         # Tell EventScheduler to use call into us whenever it wants to sleep or
         # select, so that we can keep forwarding dataplane packets.
-        kwargs['sleep_continuation'] = self._sleep_with_dataplane_passthrough
+        if not self.virtual_time:
+          # (The VirtualClock selects through us instead)
+          kwargs['sleep_continuation'] = self._sleep_with_dataplane_passthrough
         kwargs['select_continuation'] = self._select_with_dataplane_passthrough
 
       self.create_event_scheduler = \
@@ -220,6 +263,20 @@ class Replayer(ControlFlow):
       self.dp_checker.check_dataplane(-1, self.simulation)
     return self.simulation.io_master.select(timeout_seconds)
 
+  def _use_virtual_time(self, simulation):
+    if self.default_dp_permit:
+      select = self._select_with_dataplane_passthrough
+    else:
+      select = simulation.io_master.select
+    clock = VirtualClock(select)
+    clock.watch(simulation.openflow_buffer, PendingMessage)
+    clock.watch(self.sync_callback, StateChange)
+    clock.watch(simulation.patch_panel, DpPacketOut)
+    for switch in simulation.topology.switches:
+      assert(isinstance(switch, FuzzSoftwareSwitch))
+      switch.use_clock(clock)
+    simulation.clock = clock
+
   def get_interpolated_time(self):
     '''
     During divergence, the controller may ask for the current time more or
@@ -262,7 +319,9 @@ class Replayer(ControlFlow):
       self.dag = self.transform_dag(self.dag)
       log.info("Proceeding with normal replay")
 
+    start = time.time()
     self.simulation = self.simulation_cfg.bootstrap(self.sync_callback)
+    self.latencies.record_phase("bootstrap", time.time() - start)
     assert(isinstance(self.simulation.patch_panel, BufferedPatchPanel))
     # TODO(aw): remove this hack
     self.simulation.fail_to_interactive = self.fail_to_interactive
@@ -276,6 +335,8 @@ class Replayer(ControlFlow):
       for switch in self.simulation.topology.switches:
         assert(isinstance(switch, FuzzSoftwareSwitch))
         switch.use_delayed_commands()
+    if self.virtual_time:
+      self._use_virtual_time(self.simulation)
     self.run_simulation_forward(post_bootstrap_hook)
     if self.print_buffers_flag:
       self._print_buffers()
@@ -293,6 +354,12 @@ class Replayer(ControlFlow):
     event_scheduler = self.create_event_scheduler(self.simulation)
     event_scheduler.set_input_logger(self._input_logger)
     self.event_scheduler_stats = event_scheduler.stats
+    if self.partial_order:
+      if not hasattr(event_scheduler, "set_partial_order"):
+        raise ValueError("partial_order requires an EventScheduler, not %s" %
+                         type(event_scheduler).__name__)
+      event_scheduler.set_partial_order(PartialOrder(self.dag,
+                                                     self.partial_order_window))
     if post_bootstrap_hook is not None:
       post_bootstrap_hook()
 
@@ -303,9 +370,14 @@ class Replayer(ControlFlow):
       raise KeyboardInterrupt()
     self.old_interrupt = signal.signal(signal.SIGINT, interrupt)
 
+    self.replay_start = time.time()
     try:
       for i, event in enumerate(self.dag.events):
+        if self._past_deadline():
+          self._cut_off(len(self.dag.events) - i)
+          break
         try:
+          start = time.time()
           self.compute_interpolated_time(event)
           if self.default_dp_permit:
             self.dp_checker.check_dataplane(i, self.simulation)
@@ -313,6 +385,7 @@ class Replayer(ControlFlow):
             self._check_early_state_changes(self.dag, i, event)
           self._check_new_state_changes(self.dag, i)
           self._check_unexpected_cp_messages(self.dag, i)
+          self.latencies.record_phase("checking", time.time() - start)
           # TODO(cs): quasi race-condition here. If unexpected state change
           # happens *while* we're waiting for event, we basically have a
           # deadlock (if controller logging is set to blocking) until the
@@ -322,7 +395,11 @@ class Replayer(ControlFlow):
           # with whether we would get better fidelity if we let them through.
           if self.fail_fast and (i % self.check_interval) == 0 and self._check_violation():
             return
+          start = time.time()
           event_scheduler.schedule(event)
+          seconds = time.time() - start
+          self.latencies.record_phase("scheduling", seconds)
+          self.latencies.record_event(event, seconds)
           if self.logical_time != event.round:
             self.logical_time = event.round
             self.increment_round()
@@ -342,46 +419,80 @@ class Replayer(ControlFlow):
         # Wait a bit in case the bug takes awhile to happen
         # TODO(cs): may be redundant with WaitTime events at the end of the
         # trace.
-        log.debug("Sleeping %d seconds after run" % self.end_wait_seconds)
-        if self.default_dp_permit:
-          self._sleep_with_dataplane_passthrough(self.end_wait_seconds)
+        end_wait_seconds = self.end_wait_seconds
+        if self.deadline_seconds is not None and self.cutoff is None:
+          remaining = self.deadline_seconds - (time.time() - self.replay_start)
+          if remaining < end_wait_seconds:
+            end_wait_seconds = max(remaining, 0)
+            self._cut_off(0)
+        log.debug("Sleeping %d seconds after run" % end_wait_seconds)
+        start = time.time()
+        if self.simulation.clock is not None:
+          self.simulation.clock.sleep(end_wait_seconds)
+        elif self.default_dp_permit:
+          self._sleep_with_dataplane_passthrough(end_wait_seconds)
         else:
-          time.sleep(self.end_wait_seconds)
+          time.sleep(end_wait_seconds)
+        self.latencies.record_phase("end_wait", time.time() - start)
 
         self._check_violation()
     finally:
+      self.latencies.record_phase("replay", time.time() - self.replay_start)
       if self.old_interrupt:
         signal.signal(signal.SIGINT, self.old_interrupt)
       msg.event(color.B_BLUE+"Event Stats: %s" % str(event_scheduler.stats))
       if self.default_dp_permit:
         msg.event(color.B_BLUE+"DataplaneDrop Stats: %s" % str(self.dp_checker.stats))
+      if self.simulation.clock is not None:
+        msg.event(color.B_BLUE+"Virtual time skipped: %.2f seconds" %
+                  self.simulation.clock.seconds_skipped)
     if self.end_in_interactive:
       interactive = Interactive(self.simulation_cfg, input_logger=self._input_logger)
       interactive.simulate(self.simulation, bound_objects=( ('replayer', self), ))
 
+  def _past_deadline(self):
+    return (self.deadline_seconds is not None and
+            time.time() - self.replay_start > self.deadline_seconds)
+
+  def _cut_off(self, events_skipped):
+    elapsed = time.time() - self.replay_start
+    log.info("Replay %s reached its deadline of %.2f seconds after %.2f seconds. "
+             "Skipping %d remaining events" % (self.replay_id,
+             self.deadline_seconds, elapsed, events_skipped))
+    self.cutoff = { "deadline_seconds" : self.deadline_seconds,
+                    "elapsed_seconds" : elapsed,
+                    "events_skipped" : events_skipped }
+
   def _check_violation(self):
     # TODO(cs): this does not verify whether the violation is persistent
     # or transient. Perhaps it should?
+    start = time.time()
     violations = self.invariant_check(self.simulation)
+    self.latencies.record_phase("invariant_check", time.time() - start)
     self.simulation.violation_found = False
     if violations != []:
       self._log_input_event(InvariantViolation(violations))
       msg.fail("Violations at end of trace: %s" % str(violations))
       if self.bug_signature:
         if self.bug_signature in violations:
-          self.simulation.violation_found = True
+          self._violation_found()
           msg.success("Violation found %s" % self.bug_signature)
           return True
         else:
           msg.fail("Violation does not match violation signature!")
           return False
       else:
-        self.simulation.violation_found = True
+        self._violation_found()
         return True
     else:
       msg.success("No correctness violations!")
       return False
 
+  def _violation_found(self):
+    self.simulation.violation_found = True
+    if self.replay_start is not None:
+      self.violation_seconds = time.time() - self.replay_start
+
   def _check_early_state_changes(self, dag, current_index, input):
     ''' Check whether any pending state change that were supposed to come
     *after* the current input have occured. If so, we have violated causality.'''
@@ -437,21 +548,20 @@ class Replayer(ControlFlow):
     # Currently it appears that this method is too liberal, and ends up
     # causing timouts as a result of letting messages through.
 
-    # First, build a set of expected ControlMessageSends/Receives fingerprints
+    # First, find the expected ControlMessageSends/Receives fingerprints
     # within the next expected_message_round_window rounds.
-    start_round = dag.events[current_index].round
-    expected_receive_fingerprints = set()
-    expected_send_fingerprints = set()
-    for i in xrange(current_index, len(dag.events)):
-      event = dag.events[i]
-      if event.round - start_round > self.expected_message_round_window:
-        break
-      if type(event) == ControlMessageReceive:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_receive_fingerprints.add((of_fingerprint, dpid, cid))
-      if type(event) == ControlMessageSend:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_send_fingerprints.add((of_fingerprint, dpid, cid))
+    if self.incremental_message_window:
+      if (self._expected_message_window is None or
+          self._expected_message_window.events is not dag.events):
+        self._expected_message_window = ExpectedMessageWindow(
+          dag.events, self.expected_message_round_window)
+      window = self._expected_message_window
+      window.advance(current_index)
+      expected_receive_fingerprints = window.receive_fingerprints
+      expected_send_fingerprints = window.send_fingerprints
+    else:
+      (expected_receive_fingerprints,
+       expected_send_fingerprints) = self._expected_message_fingerprints(dag, current_index)
 
     # Now check pending messages.
     for expected_fingerprints, messages in [
@@ -475,6 +585,85 @@ class Replayer(ControlFlow):
           self.passed_unexpected_messages.append(repr(log_event))
           self._log_input_event(log_event)
 
+  def _expected_message_fingerprints(self, dag, current_index):
+    ''' Return the sets of ControlMessageReceive and ControlMessageSend
+    fingerprints within the next expected_message_round_window rounds '''
+    start_round = dag.events[current_index].round
+    expected_receive_fingerprints = set()
+    expected_send_fingerprints = set()
+    for i in xrange(current_index, len(dag.events)):
+      event = dag.events[i]
+      if event.round - start_round > self.expected_message_round_window:
+        break
+      if type(event) == ControlMessageReceive:
+        (_, of_fingerprint, dpid, cid) = event.fingerprint
+        expected_receive_fingerprints.add((of_fingerprint, dpid, cid))
+      if type(event) == ControlMessageSend:
+        (_, of_fingerprint, dpid, cid) = event.fingerprint
+        expected_send_fingerprints.add((of_fingerprint, dpid, cid))
+    return (expected_receive_fingerprints, expected_send_fingerprints)
+
+class ExpectedMessageWindow(object):
+  ''' Multisets of the ControlMessageReceive and ControlMessageSend
+  fingerprints in a window of events that slides along the trace: from the
+  current event up to (but not including) the first subsequent event more
+  than round_window rounds after it. Moving the window forward only adds and
+  expires the events that enter and leave it. '''
+  def __init__(self, events, round_window):
+    self.events = events
+    self.round_window = round_window
+    # { (OFFingerprint, dpid, controller id) -> number of events in the window }
+    self.receive_fingerprints = Counter()
+    self.send_fingerprints = Counter()
+    # The window is self.events[head:tail]
+    self.head = 0
+    self.tail = 0
+    self.start_round = None
+
+  def _fingerprints_for(self, event):
+    if type(event) == ControlMessageReceive:
+      return self.receive_fingerprints
+    if type(event) == ControlMessageSend:
+      return self.send_fingerprints
+    return None
+
+  def _add(self, event):
+    fingerprints = self._fingerprints_for(event)
+    if fingerprints is not None:
+      (_, of_fingerprint, dpid, cid) = event.fingerprint
+      fingerprints[(of_fingerprint, dpid, cid)] += 1
+
+  def _expire(self, event):
+    fingerprints = self._fingerprints_for(event)
+    if fingerprints is not None:
+      (_, of_fingerprint, dpid, cid) = event.fingerprint
+      key = (of_fingerprint, dpid, cid)
+      fingerprints[key] -= 1
+      if fingerprints[key] == 0:
+        # So that `in` only finds fingerprints in the window
+        del fingerprints[key]
+
+  def advance(self, current_index):
+    ''' Move the window to start at current_index '''
+    start_round = self.events[current_index].round
+    if (current_index < self.head or
+        (self.start_round is not None and start_round < self.start_round)):
+      # The window may end earlier than before (only possible if rounds
+      # aren't monotonic in the trace): start over.
+      self.receive_fingerprints.clear()
+      self.send_fingerprints.clear()
+      self.head = self.tail = current_index
+    while self.head < current_index:
+      if self.head < self.tail:
+        self._expire(self.events[self.head])
+      self.head += 1
+    self.tail = max(self.tail, self.head)
+    self.start_round = start_round
+    while (self.tail < len(self.events) and
+           self.events[self.tail].round - start_round <= self.round_window):
+      self._add(self.events[self.tail])
+      self.tail += 1
+
 class AlwaysAllowDataplane(object):
   ''' A dataplane checker that always allows through events. Should not be
   used if there are any DataplaneDrops in the trace; in that case, use
@@ -511,13 +700,26 @@ class DataplaneChecker(object):
     # in the pruned run.
     self.events = list(event_dag.events)
     self.stats = DataplaneCheckerStats(self.events)
-    # The current sequence of dataplane events we expect within the current
-    # window
-    self.current_dp_fingerprints = []
-    # Mapping from fingerprint in current_dp_fingerprints to the index of the
-    # event in self.events
-    self.fingerprint_2_event_idx = {}
     self.slop_buffer = slop_buffer
+    # Events are referred to by their index in self.events. Expected dataplane
+    # events are flushed from the indexes below once they have been matched,
+    # so that we don't accidentally conflate distinct dp_events with the same
+    # fingerprint.
+    # { round -> sorted indices of the remaining events in that round }
+    self._round2indices = defaultdict(list)
+    # { (DPFingerprint, dpid, port) -> sorted indices of the remaining
+    #   DataplanePermits and DataplaneDrops with that fingerprint }
+    self._fingerprint2indices = defaultdict(list)
+    for i, event in enumerate(self.events):
+      self._round2indices[event.round].append(i)
+      if type(event) == DataplanePermit or type(event) == DataplaneDrop:
+        # Skip over the class name (first element of the tuple)
+        self._fingerprint2indices[event.fingerprint[1:]].append(i)
+    # The current window of dp_events we expect to see: the remaining
+    # expected dataplane events with indices in [head_idx, tail_idx). Empty
+    # until the first update_window().
+    self.head_idx = 0
+    self.tail_idx = 0
 
   def decide_drop(self, dp_event):
     ''' Returns True if this event should be dropped, False otherwise '''
@@ -528,19 +730,18 @@ class DataplaneChecker(object):
     dp_fingerprint = (DPFingerprint.from_pkt(dp_event.packet),
                       dp_event.node.dpid, dp_event.port.port_no)
 
-    # Skip over the class name (first element of the tuple)
-    event_fingerprint = find(lambda f: f[1:] == dp_fingerprint,
-                             self.current_dp_fingerprints)
-    if event_fingerprint is None:
+    # The first expected event with this fingerprint within the window
+    indices = self._fingerprint2indices.get(dp_fingerprint, [])
+    position = bisect.bisect_left(indices, self.head_idx)
+    if position == len(indices) or indices[position] >= self.tail_idx:
       # Default to permit if we didn't expect this dp event
       return False
-    # Flush this event from both our current window and our events list, so
-    # that we don't accidentally conflate distinct dp_events with the same
-    # fingerprint
-    self.current_dp_fingerprints.remove(event_fingerprint)
-    event_idx = self.fingerprint_2_event_idx[event_fingerprint].pop()
-    self.events.pop(event_idx)
+    event_idx = indices.pop(position)
+    event = self.events[event_idx]
+    round_indices = self._round2indices[event.round]
+    round_indices.pop(bisect.bisect_left(round_indices, event_idx))
     # First element of the tuple is the Event class name
+    event_fingerprint = event.fingerprint
     if event_fingerprint[0] == "DataplanePermit":
       return False
     self.stats.record_drop(event_fingerprint)
@@ -548,22 +749,13 @@ class DataplaneChecker(object):
 
   def update_window(self, current_round):
     ''' Update the current slop buffer ("the dp_events we expect to see") '''
-    self.current_dp_fingerprints = []
-    self.fingerprint_2_event_idx = defaultdict(list)
-    # TODO(cs): O(n) operation
-    head_idx = find_index(lambda e: e.round == current_round - self.slop_buffer,
-                          self.events)
-    head_idx = max(head_idx, 0)
-    tail_idx = find_index(lambda e: e.round == current_round + self.slop_buffer,
-                          self.events)
-    if tail_idx is None:
-      tail_idx = len(self.events)
-    for i in xrange(head_idx, tail_idx):
-      if (type(self.events[i]) == DataplanePermit or
-          type(self.events[i]) == DataplaneDrop):
-        fingerprint = self.events[i].fingerprint
-        self.current_dp_fingerprints.append(fingerprint)
-        self.fingerprint_2_event_idx[fingerprint].append(i)
+    # The window starts at the first remaining event of round
+    # current_round - slop_buffer (or at the beginning, if there is none), and
+    # ends before the first remaining event of round current_round + slop_buffer
+    head_indices = self._round2indices.get(current_round - self.slop_buffer)
+    self.head_idx = head_indices[0] if head_indices else 0
+    tail_indices = self._round2indices.get(current_round + self.slop_buffer)
+    self.tail_idx = tail_indices[0] if tail_indices else len(self.events)
 
   def check_dataplane(self, current_round, simulation):
     ''' Check dataplane events for before playing then next event.
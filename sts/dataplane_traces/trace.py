@@ -12,7 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+'''
+Dataplane traces come in two formats:
+
+ - pickle: a pickled list of DataplaneEvents, loaded whole by Trace.
+ - streaming: the line STREAM_MAGIC, then the length (an unsigned 32 bit
+   integer, big endian) and marshal of the list of the to_json() of every
+   interface that events are injected at, then one record per event:
+
+     interface index, packet length: two unsigned 32 bit integers, big endian
+     packet: the raw ethernet frame
+
+   StreamingTrace reads one record at a time, in constant memory.
+
+load_trace() picks the right reader for a file.
+'''
+
+import os
 import pickle
+import marshal
+import struct
 from pox.lib.util import assert_type
 from pox.lib.packet.ethernet import *
 from sts.entities import HostInterface
@@ -21,6 +40,11 @@ import base64
 import logging
 log = logging.getLogger("dataplane_trace")
 
+STREAM_MAGIC = "STS-DATAPLANE-TRACE 1\n"
+
+_length = struct.Struct("!I")
+_record = struct.Struct("!II")
+
 class DataplaneEvent (object):
   '''
   Encapsulates a packet injected at a (switch.dpid, port) pair in the network
@@ -47,47 +71,180 @@ class DataplaneEvent (object):
     return "Interface:%s Packet:%s" % (str(self.interface),
                                        str(self.packet))
 
-class Trace(object):
-  '''Encapsulates a sequence of dataplane events to inject into a simulated network.'''
+def is_streaming_trace(tracefile_path):
+  with open(tracefile_path, 'rb') as tracefile:
+    return tracefile.read(len(STREAM_MAGIC)) == STREAM_MAGIC
 
-  def __init__(self, tracefile_path, topology=None):
-    with file(tracefile_path, 'r') as tracefile:
-      self.dataplane_trace = pickle.load(tracefile)
+class TraceWriter(object):
+  '''Writes DataplaneEvents to a streaming trace, one at a time.'''
 
-    if topology is not None:
-      # Hashmap used to inject packets from the dataplane_trace
-      self.interface2host = {
-        interface: host
-        for host in topology.hosts
-        for interface in host.interfaces
-      }
+  def __init__(self, tracefile_path, interfaces):
+    '''
+    interfaces: all HostInterfaces that events will be injected at
+    '''
+    self.output = open(tracefile_path, 'wb')
+    self._interface2index = {}
+    for interface in interfaces:
+      self._interface2index.setdefault(interface, len(self._interface2index))
+    table = [None] * len(self._interface2index)
+    for interface, index in self._interface2index.iteritems():
+      table[index] = interface.to_json()
+    table = marshal.dumps(table)
+    self.output.write(STREAM_MAGIC + _length.pack(len(table)) + table)
 
-      self._type_check_dataplane_trace()
+  def encode(self, dp_event):
+    ''' Return the record of the event as a string '''
+    raw = dp_event.packet.pack()
+    return _record.pack(self._interface2index[dp_event.interface], len(raw)) + raw
 
-  def _type_check_dataplane_trace(self):
-    for dp_event in self.dataplane_trace:
-      if dp_event.interface not in self.interface2host:
+  def write(self, dp_event):
+    self.output.write(self.encode(dp_event))
+
+  def close(self):
+    self.output.close()
+
+def write_streaming_trace(dataplane_events, tracefile_path):
+  ''' Given a list of DataplaneEvents, write them out as a streaming trace '''
+  writer = TraceWriter(tracefile_path, [ e.interface for e in dataplane_events ])
+  for dp_event in dataplane_events:
+    writer.write(dp_event)
+  writer.close()
+
+class TraceBase(object):
+  ''' Injection of the events of a dataplane trace into a topology.
+  Subclasses provide _next_event(), _advance() and __iter__(). '''
+
+  def _set_topology(self, topology, interfaces):
+    # Hashmap used to inject packets from the dataplane_trace
+    self.interface2host = {
+      interface: host
+      for host in topology.hosts
+      for interface in host.interfaces
+    }
+    for interface in interfaces:
+      if interface not in self.interface2host:
         raise RuntimeError("Dataplane trace does not type check (%s)" %
-                           str(dp_event.interface))
+                           str(interface))
 
   def peek(self):
-    if len(self.dataplane_trace) == 0:
+    dp_event = self._next_event()
+    if dp_event is None:
       log.warn("No more trace inputs to inject!")
       return (None, None)
-    dp_event = self.dataplane_trace[0]
     host = self.interface2host[dp_event.interface]
     return (dp_event, host)
 
   def inject_trace_event(self):
-    if len(self.dataplane_trace) == 0:
+    dp_event = self._next_event()
+    if dp_event is None:
       log.warn("No more trace inputs to inject!")
       return
     else:
       log.info("Injecting trace input")
-      dp_event = self.dataplane_trace.pop(0)
+      self._advance()
       if dp_event.interface not in self.interface2host:
         log.warn("Interface %s not present" % str(dp_event.interface))
         return
       host = self.interface2host[dp_event.interface]
       host.send(dp_event.interface, dp_event.packet)
       return (dp_event, host)
+
+class Trace(TraceBase):
+  '''Encapsulates a sequence of dataplane events to inject into a simulated network.'''
+
+  def __init__(self, tracefile_path, topology=None):
+    with file(tracefile_path, 'r') as tracefile:
+      self.dataplane_trace = pickle.load(tracefile)
+    # Index of the next event to inject
+    self._position = 0
+
+    if topology is not None:
+      self._set_topology(topology, [ e.interface for e in self.dataplane_trace ])
+
+  def _next_event(self):
+    if self._position >= len(self.dataplane_trace):
+      return None
+    return self.dataplane_trace[self._position]
+
+  def _advance(self):
+    self._position += 1
+
+  def __iter__(self):
+    ''' Iterate over all events of the trace, injected or not '''
+    return iter(self.dataplane_trace)
+
+class StreamingTrace(TraceBase):
+  '''A sequence of dataplane events read from a streaming trace one at a time,
+  rather than loaded into memory up front.'''
+
+  def __init__(self, tracefile_path, topology=None):
+    self.tracefile_path = tracefile_path
+    with open(tracefile_path, 'rb') as tracefile:
+      (self.interfaces, self._start) = self._read_interfaces(tracefile)
+    # Offset of the next event to inject
+    self._offset = self._start
+    # The event at _offset, once read
+    self._next = None
+    # Opened lazily, in each process: a fork()ed child must not move the
+    # file offset of its parent (e.g. of a prebootstrapped template)
+    self._tracefile = None
+    self._tracefile_pid = None
+
+    if topology is not None:
+      self._set_topology(topology, self.interfaces)
+
+  def _read_interfaces(self, tracefile):
+    ''' Return the interface table, and the offset of the first record '''
+    if tracefile.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+      raise ValueError("%s is not a streaming dataplane trace" %
+                       self.tracefile_path)
+    (table_length,) = _length.unpack(tracefile.read(_length.size))
+    table = marshal.loads(tracefile.read(table_length))
+    return ([ HostInterface.from_json(j) for j in table ], tracefile.tell())
+
+  def _read_event(self, tracefile):
+    ''' Read the next record from tracefile. Returns None at the end. '''
+    header = tracefile.read(_record.size)
+    if header == "":
+      return None
+    if len(header) != _record.size:
+      raise ValueError("Truncated dataplane trace %s" % self.tracefile_path)
+    (index, packet_length) = _record.unpack(header)
+    raw = tracefile.read(packet_length)
+    if len(raw) != packet_length:
+      raise ValueError("Truncated dataplane trace %s" % self.tracefile_path)
+    return DataplaneEvent(self.interfaces[index], ethernet(raw=raw))
+
+  def _next_event(self):
+    if self._next is None:
+      if self._tracefile_pid != os.getpid():
+        self._tracefile = open(self.tracefile_path, 'rb')
+        self._tracefile.seek(self._offset)
+        self._tracefile_pid = os.getpid()
+      self._next = self._read_event(self._tracefile)
+    return self._next
+
+  def _advance(self):
+    self._next = None
+    self._offset = self._tracefile.tell()
+
+  def __iter__(self):
+    ''' Iterate over all events of the trace, injected or not '''
+    with open(self.tracefile_path, 'rb') as tracefile:
+      tracefile.seek(self._start)
+      for dp_event in iter(lambda: self._read_event(tracefile), None):
+        yield dp_event
+
+  def close(self):
+    if self._tracefile is not None and self._tracefile_pid == os.getpid():
+      self._tracefile.close()
+    self._tracefile = None
+    self._tracefile_pid = None
+    self._next = None
+
+def load_trace(tracefile_path, topology=None):
+  ''' Return a StreamingTrace or a Trace, depending on the format of the
+  file '''
+  if is_streaming_trace(tracefile_path):
+    return StreamingTrace(tracefile_path, topology)
+  return Trace(tracefile_path, topology)
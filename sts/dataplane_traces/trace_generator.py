@@ -23,9 +23,14 @@ from pox.lib.packet.ipv4 import *
 from pox.lib.packet.icmp import *
 from pox.lib.packet.arp import *
 import sts.topology as topo
-from collections import defaultdict
+import os
+import sys
+import random
+import shutil
 import pickle
-from sts.dataplane_traces.trace import DataplaneEvent
+import logging
+from sts.dataplane_traces.trace import DataplaneEvent, TraceWriter
+log = logging.getLogger("trace_generator")
 
 def write_trace_log(dataplane_events, filename):
   '''
@@ -134,36 +139,119 @@ def generate_example_trace_same_subnet(num_switches=2):
   write_trace_log(trace,
                   "dataplane_traces/ping_pong_same_subnet_%d_switches.trace" % num_switches)
 
-def generate_example_trace_fat_tree(num_pods=4):
-  # TODO(cs): highly redundant
+class FatTreePings(object):
+  '''
+  The records of a streaming trace in which, every round, each host pings a
+  random other host (no responses).
 
-  fat_tree = topo.FatTree(num_pods)
-  (_, _, hosts, access_links) = (fat_tree.switches,
-          fat_tree.network_links, fat_tree.hosts, fat_tree.access_links)
+  Each round's records only depend on the seed and the round number, so that
+  any range of rounds can be generated independently of the others.
+  '''
 
-  host2pings = defaultdict(lambda: [])
-  payload = "ping"
-  for access_link in access_links:
-    host = access_link.host
-    other_hosts = list((set(hosts) - set([access_link.host])))
-    for other_host in other_hosts:
-      eth = ethernet(src=access_link.host.interfaces[0].hw_addr,dst=other_host.interfaces[0].hw_addr,type=ethernet.IP_TYPE)
-      dst_ip_addr = other_host.interfaces[0].ips[0]
-      ipp = ipv4(protocol=ipv4.ICMP_PROTOCOL, srcip=access_link.host.interfaces[0].ips[0], dstip=dst_ip_addr)
-      ping = icmp(type=TYPE_ECHO_REQUEST, payload=payload)
-      ipp.payload = ping
+  # Bound on the number of distinct (source, destination) records kept around
+  max_cached_records = 100000
+
+  def __init__(self, writer, access_links, seed, payload="ping"):
+    self.writer = writer
+    self.access_links = access_links
+    self.seed = seed
+    self.payload = payload
+    self._records = {}
+
+  def _record(self, src_index, dst_index):
+    key = (src_index, dst_index)
+    if key not in self._records:
+      if len(self._records) >= self.max_cached_records:
+        self._records.clear()
+      access_link = self.access_links[src_index]
+      src = access_link.host.interfaces[0]
+      dst = self.access_links[dst_index].host.interfaces[0]
+      eth = ethernet(src=src.hw_addr, dst=dst.hw_addr, type=ethernet.IP_TYPE)
+      ipp = ipv4(protocol=ipv4.ICMP_PROTOCOL, srcip=src.ips[0], dstip=dst.ips[0])
+      # (pox otherwise numbers IP packets from a global, clock-seeded counter)
+      ipp.id = (src_index * len(self.access_links) + dst_index) & 0xffff
+      ipp.payload = icmp(type=TYPE_ECHO_REQUEST, payload=self.payload)
       eth.payload = ipp
-      host2pings[host].append(DataplaneEvent(access_link.interface, eth))
+      self._records[key] = self.writer.encode(DataplaneEvent(access_link.interface, eth))
+    return self._records[key]
 
-  # ping pong (no responses) between fake hosts
-  # (Some large number: TODO(cs): serialize a generator to disk)
-  # Trace is [one ping from every host to a random other host] * 50000
-  trace = []
-  for _ in range(50000):
-    for host, pings in host2pings.iteritems():
-      trace.append(random.choice(pings))
+  def round_records(self, round_number):
+    ''' Return the records of the given round as a string '''
+    rng = random.Random((self.seed << 32) + round_number)
+    num_hosts = len(self.access_links)
+    records = []
+    for src_index in xrange(num_hosts):
+      dst_index = rng.randrange(num_hosts - 1)
+      if dst_index >= src_index:
+        dst_index += 1
+      records.append(self._record(src_index, dst_index))
+    return "".join(records)
+
+  def write_rounds(self, output, first_round, end_round):
+    for round_number in xrange(first_round, end_round):
+      output.write(self.round_records(round_number))
+
+  def write_rounds_sharded(self, output, rounds, processes):
+    ''' Write rounds [0, rounds) to output, generating them in up to
+    processes fork()ed children. The output is the same as that of
+    write_rounds(output, 0, rounds). '''
+    processes = max(1, min(processes, rounds))
+    if processes == 1:
+      self.write_rounds(output, 0, rounds)
+      return
+    bounds = [ rounds * i / processes for i in xrange(processes + 1) ]
+    shard_paths = [ "%s.shard%d" % (output.name, i) for i in xrange(processes) ]
+    # N.B. otherwise the children would inherit (and could flush) its buffer
+    output.flush()
+    pids = []
+    try:
+      for i in xrange(processes):
+        pid = os.fork()
+        if pid == 0:
+          exit_code = 1
+          try:
+            with open(shard_paths[i], 'wb') as shard:
+              self.write_rounds(shard, bounds[i], bounds[i+1])
+            exit_code = 0
+          finally:
+            os._exit(exit_code)
+        pids.append(pid)
+      while pids:
+        (_, status) = os.waitpid(pids.pop(0), 0)
+        if status != 0:
+          raise RuntimeError("Trace generation shard failed (status %d)" % status)
+      for shard_path in shard_paths:
+        with open(shard_path, 'rb') as shard:
+          shutil.copyfileobj(shard, output)
+    finally:
+      for pid in pids:
+        os.waitpid(pid, 0)
+      for shard_path in shard_paths:
+        if os.path.exists(shard_path):
+          os.remove(shard_path)
 
-  write_trace_log(trace, "dataplane_traces/ping_pong_fat_tree.trace")
+def generate_example_trace_fat_tree(num_pods=4, rounds=50000, seed=None,
+                                    processes=1,
+                                    tracefile_path="dataplane_traces/ping_pong_fat_tree.trace"):
+  '''
+  Write a streaming trace of [one ping from every host to a random other
+  host] * rounds, in bounded memory. If processes > 1, rounds are generated
+  by that many fork()ed processes; the trace is the same either way.
+  '''
+  if seed is None:
+    seed = random.randint(0, sys.maxint)
+  log.info("Generating fat tree trace with seed %d" % seed)
+
+  fat_tree = topo.FatTree(num_pods)
+  access_links = sorted(fat_tree.access_links,
+                        key=lambda l: (l.host.hid, l.interface.hw_addr.toStr()))
+  writer = TraceWriter(tracefile_path, [ l.interface for l in access_links ])
+  try:
+    pings = FatTreePings(writer, access_links, seed)
+    pings.write_rounds_sharded(writer.output, rounds, processes)
+  finally:
+    writer.close()
+  return seed
 
 if __name__ == '__main__':
   generate_example_trace_same_subnet()
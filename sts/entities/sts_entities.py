@@ -43,6 +43,7 @@ import Queue
 import logging
 import pickle
 import random
+import sys
 import time
 
 
@@ -412,6 +413,17 @@ class FuzzSoftwareSwitch (NXSoftwareSwitch):
     assert(self.delay_flow_mods)
     return self.openflow_buffer.schedule(buffered_cmd_receipt)
 
+  def use_clock(self, clock):
+    ''' Timestamp and expire flow entries according to the given VirtualClock
+    rather than time.time() '''
+    if not clock.patch_module(sys.modules[self.table.__class__.__module__]):
+      self.log.warn("Flow table does not use time.time(); flow entry timestamps are not virtualized")
+    clock.add_tick_listener(self.expire_flows)
+
+  def expire_flows(self, now):
+    ''' Remove flow entries whose idle or hard timeout has passed at time now '''
+    self.table.remove_expired_entries(now=now)
+
   def show_flow_table(self):
     dl_types = { 0x0800: "IP",
                  0x0806: "ARP",
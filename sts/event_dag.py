@@ -44,6 +44,135 @@ def split_list(l, split_ways):
     start_idx = split_idx
   return splits
 
+def network_element(event):
+  ''' Return a hashable identifier of the network element (switch, link,
+  host, or controller) that the given input event (or AtomicInput) affects,
+  or None if it doesn't affect any particular element. '''
+  if type(event) == AtomicInput:
+    event = event.failure
+  if type(event) in [LinkFailure, LinkRecovery]:
+    return ("link", min(event.start_dpid, event.end_dpid),
+                    max(event.start_dpid, event.end_dpid))
+  if type(event) in [SwitchFailure, SwitchRecovery, ControlChannelBlock,
+                     ControlChannelUnblock]:
+    return ("switch", event.dpid)
+  if type(event) == DataplaneDrop and event.dpid is not None:
+    return ("switch", event.dpid)
+  if type(event) in [HostMigration, TrafficInjection, DataplaneDrop] and\
+     event.host_id is not None:
+    return ("host", event.host_id)
+  if type(event) in [ControllerFailure, ControllerRecovery, LinkDiscovery]:
+    return ("controller", event.controller_id)
+  return None
+
+def happens_before_channels(event):
+  ''' Return the channels along which the given internal event is ordered
+  with the other internal events of a trace: control messages on the same
+  connection (which is a FIFO), and permitted dataplane packets and
+  flow_mods processed at the same switch. Events on disjoint channels are
+  causally independent of each other, unless an input event or an event with
+  no channels (returned as None) lies between them. '''
+  if type(event) in [ControlMessageReceive, ControlMessageSend]:
+    return (("connection", event.dpid, event.controller_id),)
+  if type(event) == ProcessFlowMod:
+    return (("connection", event.dpid, event.controller_id),
+            ("switch", event.dpid))
+  if type(event) == DataplanePermit:
+    return (("switch", event.fingerprint[2]),)
+  if type(event) in [ControllerStateChange, DeterministicValue]:
+    return (("controller", event.controller_id),)
+  return None
+
+class TopologyAwareSplitter(object):
+  ''' Drop-in replacement for split_list that keeps inputs affecting the same
+  (or nearby) network elements in the same split.
+
+  Inputs are grouped by network_element(). Each group is anchored at a
+  switch (a link at its lower dpid, a host at its ingress switch), and groups
+  are ordered by a breadth-first traversal of the switch graph, so that
+  contiguous chunks of that ordering cover connected regions of the network.
+  Controller-wide inputs and inputs that don't affect any element come last.
+  Within each split, inputs retain their original order. '''
+  def __init__(self, topology=None):
+    ''' topology is optional; without it, the switch graph and host
+    locations are inferred from the inputs themselves. '''
+    self.topology = topology
+
+  def _switch_graph(self, inputs):
+    adjacency = defaultdict(set)
+    if self.topology is not None:
+      for link in self.topology.network_links:
+        start = link.start_software_switch.dpid
+        end = link.end_software_switch.dpid
+        adjacency[start].add(end)
+        adjacency[end].add(start)
+    for element in set(network_element(e) for e in inputs):
+      if element is not None and element[0] == "link":
+        adjacency[element[1]].add(element[2])
+        adjacency[element[2]].add(element[1])
+    return adjacency
+
+  def _host_locations(self, inputs):
+    hid2dpid = {}
+    if self.topology is not None:
+      for access_link in self.topology.access_links:
+        hid2dpid.setdefault(access_link.host.hid, access_link.switch.dpid)
+    for e in inputs:
+      if type(e) == HostMigration:
+        hid2dpid.setdefault(e.host_id, e.old_ingress_dpid)
+    return hid2dpid
+
+  def _anchor(self, element, hid2dpid):
+    if element is None or element[0] == "controller":
+      return None
+    if element[0] == "host":
+      return hid2dpid.get(element[1])
+    # Switches and links
+    return element[1]
+
+  def _bfs_rank(self, adjacency, anchors):
+    ''' Return a dict from dpid to its position in a breadth-first traversal
+    of the switch graph, starting from the lowest dpid of each component. '''
+    rank = {}
+    for root in sorted(set(adjacency.keys()) | anchors):
+      if root in rank:
+        continue
+      rank[root] = len(rank)
+      queue = [root]
+      while queue:
+        next_queue = []
+        for dpid in queue:
+          for neighbor in sorted(adjacency[dpid]):
+            if neighbor not in rank:
+              rank[neighbor] = len(rank)
+              next_queue.append(neighbor)
+        queue = next_queue
+    return rank
+
+  def __call__(self, inputs, split_ways):
+    if split_ways < 1:
+      raise ValueError("Split ways must be greater than 0")
+    hid2dpid = self._host_locations(inputs)
+    # element -> [first index, anchor, [(index, input)]]
+    groups = {}
+    for i, e in enumerate(inputs):
+      element = network_element(e)
+      if element is None:
+        # Don't lump together unrelated inputs
+        element = ("input", i)
+      if element not in groups:
+        groups[element] = [i, self._anchor(element, hid2dpid), []]
+      groups[element][2].append((i, e))
+
+    anchors = set(g[1] for g in groups.values() if g[1] is not None)
+    rank = self._bfs_rank(self._switch_graph(inputs), anchors)
+    no_rank = len(rank)
+    ordered = sorted(groups.values(),
+                     key=lambda g: (rank.get(g[1], no_rank), g[0]))
+    flattened = [ indexed for g in ordered for indexed in g[2] ]
+    return [ [ e for (_, e) in sorted(split) ]
+             for split in split_list(flattened, split_ways) ]
+
 class AtomicInput(object):
   def __init__(self, failure, recoveries):
     self.failure = failure
@@ -56,12 +185,90 @@ class AtomicInput(object):
   def __repr__(self):
     return "AtomicInput:%r%r" % (self.failure, self.recoveries)
 
+class EventIndex(object):
+  ''' Lookups over a list of events that the replayer would otherwise compute
+  with linear scans. Each lookup table is built on first use, and then
+  reused for the lifetime of the index.
+
+  Pre: the list of events is not modified after the index is created. '''
+  def __init__(self, events_list):
+    self._events_list = events_list
+    self._input_events = None
+    # [ first ControllerStateChange at or after index i ], plus a trailing None
+    self._next_state_changes = None
+    # { event type -> [indices of events of exactly that type] }
+    self._type2positions = None
+    # [ happens-before predecessors of the event at index i, see
+    #   happens_before() ]
+    self._predecessors = None
+
+  @property
+  def input_events(self):
+    ''' N.B. callers must not modify the returned list '''
+    if self._input_events is None:
+      self._input_events = [ e for e in self._events_list
+                             if isinstance(e, InputEvent) and e.prunable ]
+    return self._input_events
+
+  def next_state_change(self, index):
+    if self._next_state_changes is None:
+      next_state_changes = [None] * (len(self._events_list) + 1)
+      for i in xrange(len(self._events_list) - 1, -1, -1):
+        event = self._events_list[i]
+        if type(event) == ControllerStateChange:
+          next_state_changes[i] = event
+        else:
+          next_state_changes[i] = next_state_changes[i+1]
+      self._next_state_changes = next_state_changes
+    # Same semantics as slicing events[index:]
+    if index < 0:
+      index = max(0, len(self._events_list) + index)
+    return self._next_state_changes[min(index, len(self._events_list))]
+
+  def positions(self, event_type):
+    ''' Return the (ascending) indices of all events of exactly event_type '''
+    if self._type2positions is None:
+      type2positions = defaultdict(list)
+      for i, event in enumerate(self._events_list):
+        type2positions[type(event)].append(i)
+      self._type2positions = dict(type2positions)
+    return self._type2positions.get(event_type, [])
+
+  def happens_before(self, index):
+    ''' Return the indices of the latest earlier events on each of the
+    happens_before_channels() of the event at index, or None if the event is
+    totally ordered with respect to all other events (input events, and
+    internal events without channels). Predecessors are only tracked back to
+    the last totally ordered event, which itself happens before everything
+    after it. '''
+    if self._predecessors is None:
+      predecessors = []
+      # channel -> index of the latest event on it since the last totally
+      # ordered event
+      channel2last = {}
+      for i, event in enumerate(self._events_list):
+        channels = None
+        if isinstance(event, InternalEvent):
+          channels = happens_before_channels(event)
+        if channels is None:
+          predecessors.append(None)
+          channel2last.clear()
+          continue
+        predecessors.append(tuple(sorted(set(channel2last[channel]
+                                             for channel in channels
+                                             if channel in channel2last))))
+        for channel in channels:
+          channel2last[channel] = i
+      self._predecessors = predecessors
+    return self._predecessors[index]
+
 class EventDagView(object):
   def __init__(self, parent, events_list):
     ''' subset is a list '''
     self._parent = parent
     self._events_list = list(events_list)
     self._events_set = set(self._events_list)
+    self._index = EventIndex(self._events_list)
 
   @property
   def events(self):
@@ -70,8 +277,7 @@ class EventDagView(object):
 
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    return self._index.input_events
 
   @property
   def atomic_input_events(self):
@@ -95,7 +301,13 @@ class EventDagView(object):
     return self._parent.add_inputs(inputs, self._events_list)
 
   def next_state_change(self, index):
-    return self._parent.next_state_change(index, events=self.events)
+    return self._index.next_state_change(index)
+
+  def positions(self, event_type):
+    return self._index.positions(event_type)
+
+  def happens_before(self, index):
+    return self._index.happens_before(index)
 
   def get_original_index_for_event(self, event):
     return self._parent.get_original_index_for_event(event)
@@ -120,15 +332,25 @@ def migrations_per_host(events):
       host2migrations[e.host_id].append(e)
   return host2migrations
 
-def replace_migration(replacee, old_location, new_location, event_list):
+def migration_positions(event_list):
+  ''' Return a dict from each HostMigration in event_list to its index '''
+  return dict((e, i) for i, e in enumerate(event_list) if type(e) == HostMigration)
+
+def replace_migration(replacee, old_location, new_location, event_list,
+                      positions=None):
+  ''' positions is an optional migration_positions(event_list), which saves
+  a linear search for replacee '''
   # `replacee' is the migration to be replaced
   # Don't mutate replacee -- instead, replace it
   new_migration = HostMigration(old_location[0], old_location[1],
                                 new_location[0], new_location[1],
                                 host_id=replacee.host_id,
                                 time=replacee.time, label=replacee.label)
-  # TODO(cs): O(n^2)
-  index = event_list.index(replacee)
+  if positions is None:
+    index = event_list.index(replacee)
+  else:
+    index = positions.pop(replacee)
+    positions[new_migration] = index
   event_list[index] = new_migration
   return new_migration
 
@@ -161,6 +383,7 @@ class EventDag(object):
     self._prefix_trie = prefix_trie
     self._events_list = events
     self._events_set = set(self._events_list)
+    self._index = EventIndex(self._events_list)
     self._label2event = {
       event.label : event
       for event in self._events_list
@@ -183,8 +406,7 @@ class EventDag(object):
 
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    return self._index.input_events
 
   @property
   def atomic_input_events(self):
@@ -271,6 +493,8 @@ class EventDag(object):
     # a pruned HostMigration event
     # location is: (ingress dpid, ingress port no)
     currentloc2unprunedloc = {}
+    # Computed on the first replacement, if any
+    positions = None
 
     for m in [e for e in events_list if type(e) == HostMigration]:
       src = m.old_location
@@ -294,7 +518,9 @@ class EventDag(object):
           unpruned_loc = currentloc2unprunedloc[src]
           del currentloc2unprunedloc[src]
           new_loc = dst
-          replace_migration(m, unpruned_loc, new_loc, remaining)
+          if positions is None:
+            positions = migration_positions(remaining)
+          replace_migration(m, unpruned_loc, new_loc, remaining, positions)
 
   def _ignored_except_internals_and_recoveries(self, ignored_portion):
     # Note that dependent_labels only contains dependencies between input
@@ -344,13 +570,15 @@ class EventDag(object):
     trace
     '''
     host2migrations = migrations_per_host(remaining_events)
+    positions = migration_positions(remaining_events)
     for host, migrations in host2migrations.iteritems():
       # Prime the loop with the initial location
       previous_location = self._host2initial_location[host]
       for m in migrations:
         if m.old_location != previous_location:
           replacement = replace_migration(m, previous_location,
-                                          m.new_location, remaining_events)
+                                          m.new_location, remaining_events,
+                                          positions)
         else:
           replacement = m
         previous_location = replacement.new_location
@@ -369,24 +597,27 @@ class EventDag(object):
 
     if not all(e in self._event2idx for e in inputs):
       raise ValueError("Not all inputs present in original events list %s" %
-                       [e for e in input if e not in self._event2idx])
+                       [e for e in inputs if e not in self._event2idx])
     if not all(e in self._event2idx for e in events_list):
       raise ValueError("Not all events in original events list %s" %
                        [e for e in events_list if e not in self._event2idx])
 
     result = []
-    for _, successor in enumerate(events_list):
+    # Index of the next input to be inserted
+    next_input = 0
+    for successor in events_list:
       orig_successor_idx = self._event2idx[successor]
-      while len(inputs) > 0 and orig_successor_idx > self._event2idx[inputs[0]]:
+      while (next_input < len(inputs) and
+             orig_successor_idx > self._event2idx[inputs[next_input]]):
         # If the current successor did in fact come after the next input in the
         # original trace, insert next input here
-        input = inputs.pop(0)
-        result.append(input)
+        result.append(inputs[next_input])
+        next_input += 1
       result.append(successor)
 
     # Any remaining inputs should be appended at the end -- they had no
     # successors
-    result += inputs
+    result += inputs[next_input:]
     # Deal with newly added host migrations
     result = self._straighten_inserted_migrations(result)
     return EventDagView(self, result)
@@ -424,14 +655,22 @@ class EventDag(object):
   def next_state_change(self, index, events=None):
     ''' Return the next ControllerStateChange that occurs at or after
     index.'''
-    if events is None:
-      events = self.events
     # TODO(cs): for now, assumes a single controller
+    if events is None or events is self._events_list:
+      return self._index.next_state_change(index)
     for event in events[index:]:
       if type(event) == ControllerStateChange:
         return event
     return None
 
+  def positions(self, event_type):
+    ''' Return the (ascending) indices of all events of exactly event_type '''
+    return self._index.positions(event_type)
+
+  def happens_before(self, index):
+    ''' See EventIndex.happens_before() '''
+    return self._index.happens_before(index)
+
   def get_original_index_for_event(self, event):
     return self._event2idx[event]
 
@@ -441,9 +680,10 @@ class EventDag(object):
   def get_last_invariant_violation(self):
     if self._last_violation is not None:
       return self._last_violation
-    for event in reversed(self._events_list):
+    for i in reversed(self.positions(InvariantViolation)):
+      event = self._events_list[i]
       # Match on persistent violations in computing MCS
-      if type(event) == InvariantViolation and event.persistent:
+      if event.persistent:
         self._last_violation = event
         return event
     return None
@@ -37,16 +37,23 @@ def setup_experiment(args, config):
     # Note that argparse returns a list
     config.timestamp_results = args.timestamp_results
 
-  if hasattr(config, 'timestamp_results') and config.timestamp_results:
+  # When resuming, keep using (and don't wipe) the previous results directory
+  resume = getattr(args, "resume", False)
+
+  if hasattr(config, 'timestamp_results') and config.timestamp_results and not resume:
     now = timestamp_string()
     config.results_dir += "_" + str(now)
 
   # Set up results directory
   create_python_dir("./experiments")
-  create_clean_python_dir(config.results_dir)
+  if resume:
+    create_python_dir(config.results_dir)
+  else:
+    create_clean_python_dir(config.results_dir)
 
   # Copy stdout and stderr to a file "simulator.out"
-  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"), "w"))
+  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"),
+                 "a" if resume else "w"))
   tee.tee_stdout()
   tee.tee_stderr()
 
@@ -18,6 +18,7 @@ import abc
 
 class Fingerprint(object):
   __metaclass__ = abc.ABCMeta
+  __slots__ = ('_field2value',)
 
   # This should really be a protected constructor
   def __init__(self, field2value):
@@ -27,6 +28,13 @@ class Fingerprint(object):
         field2value[field] = tuple(value)
     self._field2value = field2value
 
+  def __getstate__(self):
+    # Needed for pickling, now that there is no __dict__
+    return { '_field2value' : self._field2value }
+
+  def __setstate__(self, state):
+    self._field2value = state['_field2value']
+
   def to_dict(self):
     flattened = {}
     for field, value in self._field2value.iteritems():
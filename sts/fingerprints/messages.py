@@ -58,6 +58,7 @@ def convert_match_to_human_readable_string(pkt):
 
 class OFFingerprint(Fingerprint):
   ''' Fingerprints for openflow messages '''
+  __slots__ = ()
   #  ofp_type -> fields to include in fingerprint
   # TODO(cs): I'm erring on the side of sparseness rather than completeness. We
   # may need to include more fields here to get an unambiguous fingerprint
@@ -168,6 +169,7 @@ class OFFingerprint(Fingerprint):
 
 class DPFingerprint(Fingerprint):
   ''' Fingerprints for dataplane messages '''
+  __slots__ = ()
   fields = ['dl_src', 'dl_dst', 'nw_src', 'nw_dst']
 
   def __init__(self, field2value):
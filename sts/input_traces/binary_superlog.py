@@ -0,0 +1,70 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Binary `superlog' format. Holds the same json hashes as the JSON lines
+format, but can be loaded without decoding every event.
+
+The file starts with the line MAGIC, followed by one record per event:
+
+  header length, body length: two unsigned 32 bit integers, big endian
+  header: marshal of (class name, label, dependent labels or None)
+  body:   marshal of the event's json hash
+
+The header holds what log_parser needs to check the trace and to construct
+each event. The body is only unmarshalled (and passed to the event class's
+from_json()) once a field of the event is accessed.
+'''
+
+import marshal
+import struct
+
+MAGIC = "STS-BINARY-SUPERLOG 1\n"
+
+_lengths = struct.Struct("!II")
+
+def is_binary_superlog(path):
+  with open(path, 'rb') as superlog:
+    return superlog.read(len(MAGIC)) == MAGIC
+
+def write_header(output):
+  output.write(MAGIC)
+
+def encode_record(json_hash):
+  ''' Return the record of the given json hash as a string '''
+  header = marshal.dumps((json_hash['class'], json_hash['label'],
+                          json_hash.get('dependent_labels')))
+  body = marshal.dumps(json_hash)
+  return _lengths.pack(len(header), len(body)) + header + body
+
+def write_record(output, json_hash):
+  output.write(encode_record(json_hash))
+
+def read_records(superlog):
+  ''' Given a binary superlog file positioned after MAGIC, yield
+  (class name, label, dependent labels or None, marshalled json hash) for
+  each record '''
+  while True:
+    lengths = superlog.read(_lengths.size)
+    if lengths == "":
+      return
+    if len(lengths) != _lengths.size:
+      raise ValueError("Truncated binary superlog record")
+    (header_length, body_length) = _lengths.unpack(lengths)
+    header = superlog.read(header_length)
+    body = superlog.read(body_length)
+    if len(header) != header_length or len(body) != body_length:
+      raise ValueError("Truncated binary superlog record")
+    (class_name, label, dependent_labels) = marshal.loads(header)
+    yield (class_name, label, dependent_labels, body)
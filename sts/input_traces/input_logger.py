@@ -15,11 +15,16 @@
 # limitations under the License.
 
 import os
+import copy
+import json
 import time
 import logging
 from sts.replay_event import WaitTime
+from sts.input_traces.log_parser import compact_strings
+import sts.input_traces.binary_superlog as binary_superlog
 from sts.syncproto.base import SyncTime
 from sts.util.convenience import timestamp_string
+import sts.util.background_writer as background_writer
 import sts.dataplane_traces.trace_generator as tg
 
 # N.B. invoking replay_config.py should not overwrite the original
@@ -105,7 +110,25 @@ log = logging.getLogger("input_logger")
 class InputLogger(object):
   '''Log input events injected by a control_flow.Fuzzer'''
 
-  def __init__(self):
+  def __init__(self, binary=False, background=False, flush_interval_seconds=1.0,
+               durability=background_writer.FLUSH):
+    '''
+    If binary is True, write the superlog (and the .unacked file) in the
+    binary format of sts.input_traces.binary_superlog rather than as JSON
+    lines. log_parser reads both.
+
+    If background is True, log_input_event() only takes a (shallow) copy of
+    each event; the events are serialized and written to the superlog in
+    order by a sts.util.background_writer.BackgroundWriter thread, which
+    flushes the superlog every flush_interval_seconds and syncs it as
+    durability (one of background_writer.DURABILITIES) asks for. close()
+    waits until all events have been written, as does an atexit handler if
+    close() is never reached.
+    '''
+    self.binary = binary
+    self.background = background
+    self.flush_interval_seconds = flush_interval_seconds
+    self.durability = durability
     self.last_time = SyncTime.now()
     self._disallow_timeouts = False
     self._events_after_close = []
@@ -121,7 +144,14 @@ class InputLogger(object):
       self.openflow_replay_cfg_path = results_dir + "/openflow_replay_config.py"
     else:
       raise ValueError("Default results_dir currently not supported")
-    self.output = open(self.output_path, 'w')
+    self.output = open(self.output_path, 'wb' if self.binary else 'w')
+    if self.binary:
+      binary_superlog.write_header(self.output)
+    if self.background:
+      self.output = background_writer.BackgroundWriter(
+        self.output, encode=self._encode_event,
+        flush_interval_seconds=self.flush_interval_seconds,
+        durability=self.durability)
 
   def disallow_timeouts(self):
     self._disallow_timeouts = True
@@ -129,13 +159,22 @@ class InputLogger(object):
   def allow_timeouts(self):
     self._disallow_timeouts = False
 
-  def _serialize_event(self, event, output):
+  def _prepare_event(self, event):
     if self._disallow_timeouts and hasattr(event, "disallow_timeouts"):
       event.timeout_disallowed = True
     self.last_time = event.time
-    json_hash = event.to_json()
     log.debug("logging event %r" % event)
-    output.write(json_hash + '\n')
+
+  def _encode_event(self, event):
+    ''' Return the event's line or record in the superlog '''
+    json_hash = event.to_json()
+    if self.binary:
+      return binary_superlog.encode_record(compact_strings(json.loads(json_hash)))
+    return json_hash + '\n'
+
+  def _serialize_event(self, event, output):
+    self._prepare_event(event)
+    output.write(self._encode_event(event))
 
   def log_input_event(self, event):
     '''
@@ -144,21 +183,35 @@ class InputLogger(object):
     if not self.output:
       raise Exception("Not opened -- call InputLogger.open")
     if not self.output.closed:
-      self._serialize_event(event, self.output)
+      if self.background:
+        self._prepare_event(event)
+        # Callers may go on to change the event (e.g. its round) before it is
+        # serialized
+        self.output.write(copy.copy(event))
+      else:
+        self._serialize_event(event, self.output)
     else:
       self._events_after_close.append(event)
 
+  def flush(self):
+    ''' Block until all events logged so far are in the superlog '''
+    if self.output and not self.output.closed:
+      self.output.flush()
+
   def dump_buffered_events(self, events):
     ''' If there were un-acknowledge message receives or state changes at the
     end of the run, dump them to a separate input trace ".unacked" '''
-    with open(self.output_path + ".unacked", 'w') as output:
+    with open(self.output_path + ".unacked", 'wb' if self.binary else 'w') as output:
+      if self.binary:
+        binary_superlog.write_header(output)
       for event in events + self._events_after_close:
         self._serialize_event(event, output)
 
   def close(self, control_flow, simulation_cfg, skip_mcs_cfg=False):
     # First, insert a WaitTime, in case there was a controller crash
     self.log_input_event(WaitTime(1.0, time=self.last_time))
-    # Flush the json input log
+    # Flush the json input log (in background mode: wait until all events have
+    # been written)
     self.output.close()
 
     # Write the config files
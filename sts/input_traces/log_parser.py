@@ -28,10 +28,16 @@ Hashes may have additional custom keys. For example, external input events
 must the following key:
   'dependent_labels': list of dependent labels (internal events that will not occur if this
                       event is pruned)
+
+Superlogs may also be stored in the binary format of
+sts.input_traces.binary_superlog, which parse() recognizes by its first line.
 '''
 
 import json
+import marshal
+import itertools
 import sts.replay_event as event
+import sts.input_traces.binary_superlog as binary_superlog
 import logging
 log = logging.getLogger("superlog_parser")
 
@@ -50,6 +56,34 @@ special_event_name_to_class = {
   for klass in event.all_special_events
 }
 
+def event_name_to_class(class_name):
+  for name_to_class in [input_name_to_class, internal_event_name_to_class,
+                        special_event_name_to_class]:
+    if class_name in name_to_class:
+      return name_to_class[class_name]
+  raise ValueError("Unknown class type %s" % class_name)
+
+def compact_strings(value):
+  ''' json.loads() returns every string as a separate unicode object, which
+  takes 4 bytes per character on UCS-4 builds. Convert ASCII strings to str,
+  interning short ones (field names, ids, class names) so that all events
+  share a single copy. '''
+  value_type = type(value)
+  if value_type == unicode:
+    try:
+      value = value.encode('ascii')
+    except UnicodeEncodeError:
+      return value
+    if len(value) <= 64:
+      return intern(value)
+    return value
+  if value_type == dict:
+    return dict((compact_strings(k), compact_strings(v))
+                for k, v in value.iteritems())
+  if value_type == list:
+    return [ compact_strings(v) for v in value ]
+  return value
+
 def check_unique_label(event_label, existing_event_labels):
   '''Check to make sure that event_label is not in existing_event_labels.
   Throw an exception if this invariant does not hold.
@@ -85,7 +119,7 @@ def parse_path(logfile_path):
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
-  with open(logfile_path) as logfile:
+  with open(logfile_path, 'rb') as logfile:
     return parse(logfile)
 
 def check_legacy_format(json_hash):
@@ -97,13 +131,39 @@ def check_legacy_format(json_hash):
     # Insert a dummy round number
     json_hash['round'] = -1
 
+def check_event_class(json_hash, event_labels, dependent_labels):
+  '''Sanity check the event given by json_hash (which need only hold its
+  'class', 'label', and, for input events, 'dependent_labels'), and return
+  its class, or None if the class is unknown.'''
+  check_unique_label(json_hash['label'], event_labels)
+  if json_hash['class'] in input_name_to_class:
+    sanity_check_external_input_event(event_labels,
+                                      dependent_labels,
+                                      json_hash)
+    return input_name_to_class[json_hash['class']]
+  elif json_hash['class'] in internal_event_name_to_class:
+    sanity_check_internal_event(event_labels, dependent_labels,
+                                json_hash)
+    return internal_event_name_to_class[json_hash['class']]
+  elif json_hash['class'] in special_event_name_to_class:
+    return special_event_name_to_class[json_hash['class']]
+  print "Warning: Unknown class type %s" % json_hash['class']
+  return None
+
 def parse(logfile):
-  '''Input: logfile.
+  '''Input: logfile, either in JSON lines or in binary format.
 
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
-
+  first_line = logfile.readline()
+  if first_line == binary_superlog.MAGIC:
+    return parse_binary(logfile)
+  if first_line == "":
+    return parse_json_lines([])
+  return parse_json_lines(itertools.chain([first_line], logfile))
+
+def parse_json_lines(lines):
   # the return value of the parsed log
   trace = []
   # a set of all event labels
@@ -111,27 +171,53 @@ def parse(logfile):
   # dependent labels that must be present somewhere in the log.
   dependent_labels = set()
 
-  for line in logfile:
-    json_hash = json.loads(line.rstrip())
-    check_unique_label(json_hash['label'], event_labels)
+  for line in lines:
+    json_hash = compact_strings(json.loads(line.rstrip()))
     check_legacy_format(json_hash)
-    if json_hash['class'] in input_name_to_class:
-      sanity_check_external_input_event(event_labels,
-                                        dependent_labels,
-                                        json_hash)
-      event = input_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in internal_event_name_to_class:
-      sanity_check_internal_event(event_labels, dependent_labels,
-                                  json_hash)
-      event = internal_event_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in special_event_name_to_class:
-      event = special_event_name_to_class[json_hash['class']].from_json(json_hash)
-    else:
-      print "Warning: Unknown class type %s" % json_hash['class']
+    event_class = check_event_class(json_hash, event_labels, dependent_labels)
+    if event_class is None:
+      continue
+    trace.append(event_class.from_json(json_hash))
+
+  # all the foward dependencies should be satisfied!
+  assert(len(dependent_labels) == 0)
+
+  return trace
+
+def parse_binary(logfile):
+  '''Input: binary superlog, positioned after binary_superlog.MAGIC.
+
+  Output: as for parse(), except that each event's fields (other than its
+  label) are only decoded once they are first accessed.'''
+  trace = []
+  event_labels = set()
+  dependent_labels = set()
+
+  for (class_name, label, dependents, body) in binary_superlog.read_records(logfile):
+    header = { 'class' : class_name, 'label' : label,
+               'dependent_labels' : dependents if dependents is not None else [] }
+    event_class = check_event_class(header, event_labels, dependent_labels)
+    if event_class is None:
       continue
-    trace.append(event)
+    trace.append(event_class.from_marshalled_json(label, body))
 
   # all the foward dependencies should be satisfied!
   assert(len(dependent_labels) == 0)
 
   return trace
+
+def json_to_binary(lines, output):
+  '''Write the JSON lines superlog given by lines to output in binary format.
+  The json hashes are stored as parse() would pass them to from_json().'''
+  binary_superlog.write_header(output)
+  for line in lines:
+    json_hash = compact_strings(json.loads(line.rstrip()))
+    check_legacy_format(json_hash)
+    binary_superlog.write_record(output, json_hash)
+
+def binary_to_json(logfile, output):
+  '''Write the binary superlog logfile to output in JSON lines format.'''
+  if logfile.readline() != binary_superlog.MAGIC:
+    raise ValueError("Not a binary superlog")
+  for (_, _, _, body) in binary_superlog.read_records(logfile):
+    output.write(json.dumps(marshal.loads(body)) + '\n')
@@ -0,0 +1,263 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Random access to the events of a `superlog'.
+
+build_index() writes a sidecar index next to a superlog (in either format)
+with the byte offset, label, class, round and dpid of each event. An
+IndexedTrace memory-maps the superlog and only decodes the events that are
+asked for. open_trace() returns an IndexedTrace if an up-to-date index
+exists, and otherwise a ParsedTrace over log_parser.parse_path(), which
+answers the same queries.
+'''
+
+import os
+import json
+import mmap
+import marshal
+import struct
+import logging
+import sts.replay_event as replay_events
+import sts.input_traces.log_parser as log_parser
+import sts.input_traces.binary_superlog as binary_superlog
+
+log = logging.getLogger("trace_index")
+
+INDEX_VERSION = 1
+
+def index_path(superlog_path):
+  return superlog_path + ".index"
+
+def _file_signature(path):
+  stat = os.stat(path)
+  return (stat.st_size, stat.st_mtime)
+
+def _event_dpid(json_hash):
+  ''' Return the dpid of the switch the event concerns, or None '''
+  if json_hash.get('dpid') is not None:
+    return json_hash['dpid']
+  if json_hash['class'] in ['DataplanePermit', 'DataplaneDrop']:
+    fingerprint = json_hash['fingerprint']
+    # (The class name may be missing, as the constructors allow)
+    if fingerprint[0] != json_hash['class']:
+      return fingerprint[1]
+    return fingerprint[2]
+  return None
+
+def _json_records(superlog):
+  ''' Yield (offset, json hash) for each line of a JSON lines superlog '''
+  offset = superlog.tell()
+  for line in iter(superlog.readline, ""):
+    json_hash = log_parser.compact_strings(json.loads(line.rstrip()))
+    log_parser.check_legacy_format(json_hash)
+    yield (offset, json_hash)
+    offset += len(line)
+
+def _binary_records(superlog):
+  ''' Yield (offset, json hash) for each record of a binary superlog '''
+  offset = superlog.tell()
+  for (class_name, label, dependents, body) in binary_superlog.read_records(superlog):
+    yield (offset, marshal.loads(body))
+    offset = superlog.tell()
+
+def build_index(superlog_path):
+  ''' Scan the superlog once, check it as log_parser.parse() would, and write
+  its index to index_path(superlog_path). Returns the index. '''
+  offsets = []
+  labels = []
+  classes = []
+  rounds = []
+  dpids = []
+  event_labels = set()
+  dependent_labels = set()
+  with open(superlog_path, 'rb') as superlog:
+    binary = superlog.readline() == binary_superlog.MAGIC
+    if binary:
+      records = _binary_records(superlog)
+    else:
+      superlog.seek(0)
+      records = _json_records(superlog)
+    for (offset, json_hash) in records:
+      if log_parser.check_event_class(json_hash, event_labels,
+                                      dependent_labels) is None:
+        continue
+      offsets.append(offset)
+      labels.append(json_hash['label'])
+      classes.append(json_hash['class'])
+      rounds.append(json_hash['round'])
+      dpids.append(_event_dpid(json_hash))
+  # all the foward dependencies should be satisfied!
+  assert(len(dependent_labels) == 0)
+  index = { 'version' : INDEX_VERSION,
+            'signature' : _file_signature(superlog_path),
+            'binary' : binary,
+            'offsets' : offsets, 'labels' : labels, 'classes' : classes,
+            'rounds' : rounds, 'dpids' : dpids }
+  with open(index_path(superlog_path), 'wb') as index_file:
+    marshal.dump(index, index_file)
+  return index
+
+def load_index(superlog_path):
+  ''' Return the index of the superlog, or None if there is none or if the
+  superlog has changed since it was built '''
+  path = index_path(superlog_path)
+  if not os.path.exists(path):
+    return None
+  with open(path, 'rb') as index_file:
+    try:
+      index = marshal.load(index_file)
+    except (EOFError, ValueError, TypeError):
+      log.warn("Ignoring unreadable index %s" % path)
+      return None
+  if (index.get('version') != INDEX_VERSION or
+      tuple(index['signature']) != _file_signature(superlog_path)):
+    log.warn("Ignoring out of date index %s" % path)
+    return None
+  return index
+
+class TraceQueries(object):
+  ''' Queries shared by IndexedTrace and ParsedTrace. Subclasses provide
+  __len__, event(position), and the per-position _labels, _classes, _rounds
+  and _dpids lists. '''
+  def __getitem__(self, position):
+    if position < 0:
+      position += len(self)
+    if not 0 <= position < len(self):
+      raise IndexError("trace index out of range")
+    return self.event(position)
+
+  def __iter__(self):
+    for position in xrange(len(self)):
+      yield self.event(position)
+
+  def events(self, positions):
+    return [ self.event(position) for position in positions ]
+
+  def positions(self, rounds=None, classes=None, dpids=None, inputs_only=False):
+    ''' Return the (ascending) positions of the events that satisfy all of
+    the given constraints:
+     - rounds: (first, last) round, inclusive
+     - classes: event classes (exact types)
+     - dpids: switch dpids
+     - inputs_only: only input events '''
+    class_names = None
+    if classes is not None:
+      class_names = set(klass.__name__ for klass in classes)
+    if inputs_only:
+      input_names = set(log_parser.input_name_to_class.keys())
+      class_names = input_names if class_names is None else class_names & input_names
+    if dpids is not None:
+      dpids = set(dpids)
+    positions = []
+    for position in xrange(len(self)):
+      if (rounds is not None and
+          not rounds[0] <= self._rounds[position] <= rounds[1]):
+        continue
+      if class_names is not None and self._classes[position] not in class_names:
+        continue
+      if dpids is not None and self._dpids[position] not in dpids:
+        continue
+      positions.append(position)
+    return positions
+
+  def select(self, **constraints):
+    ''' Return the events that satisfy the constraints of positions() '''
+    return self.events(self.positions(**constraints))
+
+  def find(self, label):
+    ''' Return the event with the given label '''
+    return self.event(self._label2position()[label])
+
+  def _label2position(self):
+    if getattr(self, "_label2position_cache", None) is None:
+      self._label2position_cache = { label : position for position, label
+                                     in enumerate(self._labels) }
+    return self._label2position_cache
+
+class IndexedTrace(TraceQueries):
+  ''' Reads the events of a superlog at the positions given by its index.
+  Events are decoded on each access; callers should hold on to them. '''
+  def __init__(self, superlog_path, index):
+    self.superlog_path = superlog_path
+    self._binary = index['binary']
+    self._offsets = index['offsets']
+    self._labels = index['labels']
+    self._classes = index['classes']
+    self._rounds = index['rounds']
+    self._dpids = index['dpids']
+    self._label2position_cache = None
+    self._file = open(superlog_path, 'rb')
+    if os.path.getsize(superlog_path) > 0:
+      self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+      self._mmap = ""
+
+  def __len__(self):
+    return len(self._offsets)
+
+  def event(self, position):
+    offset = self._offsets[position]
+    klass = log_parser.event_name_to_class(self._classes[position])
+    if self._binary:
+      (header_length, body_length) = struct.unpack_from("!II", self._mmap, offset)
+      start = offset + 8 + header_length
+      return klass.from_marshalled_json(self._labels[position],
+                                        self._mmap[start:start + body_length])
+    end = self._mmap.find("\n", offset)
+    if end == -1:
+      end = len(self._mmap)
+    json_hash = log_parser.compact_strings(json.loads(self._mmap[offset:end]))
+    log_parser.check_legacy_format(json_hash)
+    return klass.from_json(json_hash)
+
+  def close(self):
+    if not isinstance(self._mmap, str):
+      self._mmap.close()
+    self._file.close()
+
+class ParsedTrace(TraceQueries):
+  ''' Answers the same queries as IndexedTrace over a fully parsed trace '''
+  def __init__(self, events):
+    self._events = events
+    self._labels = [ e.label for e in events ]
+    self._classes = [ type(e).__name__ for e in events ]
+    self._rounds = [ e.round for e in events ]
+    self._dpids = [ self._dpid(e) for e in events ]
+    self._label2position_cache = None
+
+  @staticmethod
+  def _dpid(event):
+    if getattr(event, "dpid", None) is not None:
+      return event.dpid
+    if type(event) in [replay_events.DataplanePermit, replay_events.DataplaneDrop]:
+      return event.fingerprint[2]
+    return None
+
+  def __len__(self):
+    return len(self._events)
+
+  def event(self, position):
+    return self._events[position]
+
+  def close(self):
+    pass
+
+def open_trace(superlog_path):
+  ''' Return an IndexedTrace if the superlog has an up-to-date index, and
+  otherwise a ParsedTrace of the whole superlog '''
+  index = load_index(superlog_path)
+  if index is not None:
+    return IndexedTrace(superlog_path, index)
+  return ParsedTrace(log_parser.parse_path(superlog_path))
@@ -63,13 +63,28 @@ def dictify_fingerprint(fingerprint):
   return tuple(mutable)
 
 class Event(object):
-  ''' Superclass for all event types. '''
+  '''
+  Superclass for all event types.
+
+  Traces hold hundreds of thousands of events, so events keep their
+  attributes in __slots__ rather than in a per-instance __dict__. Subclasses
+  must list the attributes they set in their own __slots__ (or not define
+  __slots__ at all, in which case they get a __dict__ as usual).
+
+  Events loaded from a binary superlog (see from_marshalled_json()) only
+  have their label set until any other attribute is accessed.
+  '''
   __metaclass__ = abc.ABCMeta
+  __slots__ = ('label', 'round', 'time', 'dependent_labels', 'prunable',
+               'timed_out', 'timeout_disallowed', 'replay_time',
+               '_marshalled_json')
 
   # Create unique labels for events
   _label_gen = itertools.count(1)
   # Ensure globally unique labels
   _all_label_ids = set()
+  # class -> names of the slots of the class and all of its ancestors
+  _class2slot_names = {}
 
   def __init__(self, prefix="e", label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
@@ -99,6 +114,74 @@ class Event(object):
   def label_id(self):
     return int(self.label[1:])
 
+  @classmethod
+  def from_marshalled_json(cls, label, marshalled_json):
+    ''' Return an event of this class with the given label, whose other
+    fields are decoded from marshalled_json (the marshal of the json hash
+    that from_json() expects) when they are first accessed. '''
+    event = cls.__new__(cls)
+    event.label = label
+    Event._all_label_ids.add(int(label[1:]))
+    event._marshalled_json = marshalled_json
+    return event
+
+  def _decode_marshalled_json(self):
+    marshalled_json = self._marshalled_json
+    del self._marshalled_json
+    decoded = type(self).from_json(marshal.loads(marshalled_json))
+    self.__setstate__(decoded._fields())
+
+  def __getattr__(self, name):
+    # Only invoked for attributes that have not been set
+    if name != '_marshalled_json':
+      try:
+        self._marshalled_json
+      except AttributeError:
+        pass
+      else:
+        self._decode_marshalled_json()
+        return getattr(self, name)
+    raise AttributeError("'%s' object has no attribute '%s'" %
+                         (type(self).__name__, name))
+
+  @classmethod
+  def _slot_names(cls):
+    if cls not in Event._class2slot_names:
+      names = []
+      for klass in reversed(cls.__mro__):
+        slots = klass.__dict__.get('__slots__', ())
+        if isinstance(slots, basestring):
+          slots = (slots,)
+        names.extend(slot for slot in slots if slot not in names)
+      Event._class2slot_names[cls] = tuple(names)
+    return Event._class2slot_names[cls]
+
+  def _fields(self):
+    ''' Return { attribute -> value } for all attributes that have been set,
+    i.e. what __dict__ would hold without __slots__ '''
+    try:
+      self._marshalled_json
+    except AttributeError:
+      pass
+    else:
+      self._decode_marshalled_json()
+    fields = {}
+    for name in self._slot_names():
+      try:
+        fields[name] = getattr(self, name)
+      except AttributeError:
+        pass
+    if hasattr(self, '__dict__'):
+      fields.update(self.__dict__)
+    return fields
+
+  def __getstate__(self):
+    return self._fields()
+
+  def __setstate__(self, state):
+    for name, value in state.iteritems():
+      setattr(self, name, value)
+
   @property
   def fingerprint(self):
     ''' All events must have a fingerprint. Fingerprints are used to compute
@@ -114,9 +197,9 @@ class Event(object):
 
   def to_json(self):
     ''' Convert the event to json format '''
-    fields = dict(self.__dict__)
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
-    # fingerprints are accessed through @property, not in __dict__:
+    # fingerprints are accessed through @property, not in _fields():
     fields['fingerprint'] = dictify_fingerprint(self.fingerprint)
     if '_fingerprint' in fields:
       del fields['_fingerprint']
@@ -151,6 +234,7 @@ class InternalEvent(Event):
   '''An InternalEvent is one that happens within the controller(s) under
   simulation. Derivatives of this class verify that the internal event has
   occured during replay in its proceed method before it returns.'''
+  __slots__ = ()
   def __init__(self, label=None, round=-1, time=None, timeout_disallowed=False,
                prunable=False):
     super(InternalEvent, self).__init__(prefix='i', label=label, round=round, time=time,
@@ -176,6 +260,7 @@ class InputEvent(Event):
 
   `InputEvents' may also be referred to as 'external
   events', elsewhere in documentation or code.'''
+  __slots__ = ()
   def __init__(self, label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     super(InputEvent, self).__init__(prefix='e', label=label, round=round, time=time,
@@ -204,6 +289,7 @@ class ConnectToControllers(InputEvent):
   ''' Logged at the beginning of the execution. Causes all switches to open
   TCP connections their their parent controller(s).
   '''
+  __slots__ = ()
   def __init__(self, label=None, round=-1, time=None,
                timeout_disallowed=True):
     super(ConnectToControllers, self).__init__(label=label, round=round, time=time)
@@ -225,6 +311,7 @@ class ConnectToControllers(InputEvent):
 class SwitchFailure(InputEvent):
   ''' Crashes a switch, by disconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -259,6 +346,7 @@ class SwitchFailure(InputEvent):
 class SwitchRecovery(InputEvent):
   ''' Recovers a crashed switch, by reconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -309,6 +397,7 @@ class LinkFailure(InputEvent):
   ''' Cuts a link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). All packets forwarded over
   this link will be dropped until a LinkRecovery occurs.'''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -358,6 +447,7 @@ class LinkFailure(InputEvent):
 class LinkRecovery(InputEvent):
   ''' Recovers a failed link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). '''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -407,6 +497,7 @@ class LinkRecovery(InputEvent):
 
 class ControllerFailure(InputEvent):
   ''' Kills a controller process with `kill -9`'''
+  __slots__ = ('controller_id',)
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -441,6 +532,7 @@ class ControllerFailure(InputEvent):
 class ControllerRecovery(InputEvent):
   ''' Reboots a crashed controller by reinvoking its original command line
   parameters'''
+  __slots__ = ('controller_id',)
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -476,6 +568,8 @@ class HostMigration(InputEvent):
   ''' Migrates a host from one location in network to another. Creates a new
   virtual port on the new switch, and takes down the old port on the old switch.
   '''
+  __slots__ = ('old_ingress_dpid', 'old_ingress_port_no', 'new_ingress_dpid',
+               'new_ingress_port_no', 'host_id')
   def __init__(self, old_ingress_dpid, old_ingress_port_no,
                new_ingress_dpid, new_ingress_port_no, host_id, label=None, round=-1, time=None):
     '''
@@ -547,6 +641,7 @@ class HostMigration(InputEvent):
 
 class PolicyChange(InputEvent):
   ''' Not currently supported '''
+  __slots__ = ('request_type',)
   def __init__(self, request_type, label=None, round=-1, time=None):
     super(PolicyChange, self).__init__(label=label, round=round, time=time)
     self.request_type = request_type
@@ -564,6 +659,7 @@ class PolicyChange(InputEvent):
 
 class TrafficInjection(InputEvent):
   ''' Injects a dataplane packet into the network at the given host's access link '''
+  __slots__ = ('dp_event', 'host_id')
   def __init__(self, label=None, dp_event=None, host_id=None, round=-1, time=None, prunable=True):
     '''
     Parameters:
@@ -608,7 +704,7 @@ class TrafficInjection(InputEvent):
 
   def to_json(self):
     fields = {}
-    fields = dict(self.__dict__)
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['dp_event'] = self.dp_event.to_json()
     fields['fingerprint'] = (self.__class__.__name__, self.dp_event.to_json(), self.host_id)
@@ -632,6 +728,7 @@ class TrafficInjection(InputEvent):
 class WaitTime(InputEvent):
   ''' Causes the simulation to sleep for the specified number of seconds.
   Controller processes continue running during this time.'''
+  __slots__ = ('wait_time',)
   def __init__(self, wait_time, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -648,7 +745,10 @@ class WaitTime(InputEvent):
 
   def proceed(self, simulation):
     log.info("WaitTime: pausing simulation for %f seconds" % (self.wait_time))
-    time.sleep(self.wait_time)
+    if simulation.clock is not None:
+      simulation.clock.sleep(self.wait_time)
+    else:
+      time.sleep(self.wait_time)
     return True
 
   @staticmethod
@@ -661,6 +761,8 @@ class WaitTime(InputEvent):
 class CheckInvariants(InputEvent):
   ''' Causes the simulation to pause itself and check the given invariant before
   proceeding. '''
+  __slots__ = ('legacy_invariant_check', 'invariant_check',
+               'invariant_check_name')
   def __init__(self, label=None, round=-1, time=None,
                invariant_check_name="InvariantChecker.check_correspondence"):
     '''
@@ -714,7 +816,7 @@ class CheckInvariants(InputEvent):
     return True
 
   def to_json(self):
-    fields = dict(self.__dict__)
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     if self.legacy_invariant_check:
       fields['invariant_check'] = marshal.dumps(self.invariant_check.func_code)\
@@ -746,6 +848,7 @@ class ControlChannelBlock(InputEvent):
   queuing all messages sent on the switch<->controller TCP connection. No
   messages will be sent over the connection until a ControlChannelUnblock
   occurs. '''
+  __slots__ = ('dpid', 'controller_id')
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -789,6 +892,7 @@ class ControlChannelBlock(InputEvent):
 class ControlChannelUnblock(InputEvent):
   ''' Unblocks the control channel delay triggered by a ControlChannelUnblock.
   All queued messages will be sent.'''
+  __slots__ = ('dpid', 'controller_id')
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -831,6 +935,7 @@ class ControlChannelUnblock(InputEvent):
 class DataplaneDrop(InputEvent):
   ''' Removes an in-flight dataplane packet with the given fingerprint from
   the network. '''
+  __slots__ = ('_fingerprint', 'passive', 'host_id', 'dpid')
   def __init__(self, fingerprint, label=None, host_id=None, dpid=None, round=-1, time=None, passive=True):
     '''
     Parameters:
@@ -890,7 +995,7 @@ class DataplaneDrop(InputEvent):
     return DataplaneDrop(fingerprint, round=round, label=label, time=time)
 
   def to_json(self):
-    fields = dict(self.__dict__)
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
@@ -899,6 +1004,7 @@ class DataplaneDrop(InputEvent):
 
 class BlockControllerPair(InputEvent):
   ''' '''
+  __slots__ = ('cid1', 'cid2')
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(BlockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -931,6 +1037,7 @@ class BlockControllerPair(InputEvent):
     return BlockControllerPair(cid1, cid2, round=round, label=label, time=time)
 
 class UnblockControllerPair(InputEvent):
+  __slots__ = ('cid1', 'cid2')
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(UnblockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -965,6 +1072,7 @@ class UnblockControllerPair(InputEvent):
 # TODO(cs): Temporary hack until we figure out determinism
 class LinkDiscovery(InputEvent):
   ''' Deprecated '''
+  __slots__ = ('_fingerprint', 'controller_id', 'link_attrs')
   def __init__(self, controller_id, link_attrs, label=None, round=-1, time=None):
     super(LinkDiscovery, self).__init__(label=label, round=round, time=time)
     self._fingerprint = (self.__class__.__name__,
@@ -991,6 +1099,7 @@ class LinkDiscovery(InputEvent):
 
 class NOPInput(InputEvent):
   ''' Does nothing. Useful for fenceposting. '''
+  __slots__ = ()
   def proceed(self, simulation):
     return True
 
@@ -1028,6 +1137,8 @@ class ControlMessageBase(InternalEvent):
   Logged whenever an OpenFlowBuffer decides to explicitly fail an OpenFlow packet, or
   allow a switch to receive or send an openflow packet.
   '''
+  __slots__ = ('dpid', 'controller_id', 'b64_packet', '_fingerprint',
+               'ignore_whitelisted_packets', 'pass_through_sends', '_packet')
   def __init__(self, dpid, controller_id, fingerprint, b64_packet="", label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1061,15 +1172,31 @@ class ControlMessageBase(InternalEvent):
     self.pass_through_sends = False
 
   def get_packet(self):
-    # Avoid serialization exceptions, but we still want to memoize.
-    if not hasattr(self, "_packet"):
-      self._packet = base64_decode_openflow(self.b64_packet)
-    return self._packet
+    ''' Return the decoded OpenFlow message.
 
-  def to_json(self):
-    if hasattr(self, "_packet"):
-      delattr(self, "_packet")
-    return super(ControlMessageBase, self).to_json()
+    The decoded message is memoized on the event together with the
+    b64_packet it was decoded from, so the same event is decoded at most once
+    across all replays that share it, and is decoded afresh if b64_packet is
+    reassigned. '''
+    try:
+      (b64_packet, packet) = self._packet
+      if b64_packet is self.b64_packet or b64_packet == self.b64_packet:
+        return packet
+    except AttributeError:
+      pass
+    packet = base64_decode_openflow(self.b64_packet)
+    self._packet = (self.b64_packet, packet)
+    return packet
+
+  def is_flow_mod(self):
+    return type(self.get_packet()) == ofp_flow_mod
+
+  def _fields(self):
+    # Avoid serialization exceptions: the memoized packet is neither written to
+    # JSON nor pickled, but (unlike before) stays cached after to_json().
+    fields = super(ControlMessageBase, self)._fields()
+    fields.pop('_packet', None)
+    return fields
 
   @property
   def fingerprint(self):
@@ -1084,11 +1211,12 @@ class ControlMessageReceive(ControlMessageBase):
   Logged whenever the GodScheduler decides to allow a switch to receive an
   openflow message.
   '''
+  __slots__ = ()
   def proceed(self, simulation):
     pending_receive = self.pending_receive
     message_waiting = simulation.openflow_buffer.message_receipt_waiting(pending_receive)
     if message_waiting:
-      if log.getEffectiveLevel() == logging.DEBUG and type(base64_decode_openflow(self.b64_packet)) == ofp_flow_mod:
+      if log.getEffectiveLevel() == logging.DEBUG and self.is_flow_mod():
         show_flow_tables(simulation)
       simulation.openflow_buffer.schedule(pending_receive)
       return True
@@ -1129,6 +1257,7 @@ class ControlMessageSend(ControlMessageBase):
   Logged whenever the GodScheduler decides to allow a switch to send an
   openflow message.
   '''
+  __slots__ = ()
   def proceed(self, simulation):
     pending_send = self.pending_send
     message_waiting = simulation.openflow_buffer.message_send_waiting(pending_send)
@@ -1208,6 +1337,7 @@ class ControllerStateChange(InternalEvent):
   mastership change). Visibility into controller state changes is obtained
   via syncproto.
   '''
+  __slots__ = ('controller_id', '_fingerprint', 'name', 'value')
   def __init__(self, controller_id, fingerprint, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1289,6 +1419,7 @@ class DeterministicValue(InternalEvent):
   Logged whenever the controller asks for a deterministic value (e.g.
   gettimeofday()
   '''
+  __slots__ = ('controller_id', 'name', 'value')
   def __init__(self, controller_id, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1338,6 +1469,7 @@ class DataplanePermit(InternalEvent):
   dataplane. We basically just keep this around for bookkeeping purposes. During
   replay, this let's us know which packets to let through, and which to drop.
   '''
+  __slots__ = ('_fingerprint', 'passive')
   def __init__(self, fingerprint, label=None, round=-1, time=None,
                passive=True):
     '''
@@ -1393,7 +1525,7 @@ class DataplanePermit(InternalEvent):
     return DataplanePermit(fingerprint, label=label, round=round, time=time)
 
   def to_json(self):
-    fields = dict(self.__dict__)
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
@@ -1403,6 +1535,7 @@ class DataplanePermit(InternalEvent):
 class ProcessFlowMod(ControlMessageBase):
   ''' Logged whenever the network-wide OpenFlowBuffer decides to allow buffered (local
   to each switch) OpenFlow flow_mod message through and be processed by the switch '''
+  __slots__ = ()
   # TODO(jl): Update visualization tool to recognize this replay event
 
   def proceed(self, simulation):
@@ -1442,11 +1575,13 @@ all_internal_events = [ControlMessageReceive, ControlMessageSend,
 # Special events:
 
 class SpecialEvent(Event):
+  __slots__ = ()
   def proceed(self, _):
     raise RuntimeError("Should never be called!")
 
 class InvariantViolation(SpecialEvent):
   ''' Class for logging violations as json dicts '''
+  __slots__ = ('violations', 'persistent')
   def __init__(self, violations, label=None, round=-1, time=None, persistent=False):
     '''
     Parameters:
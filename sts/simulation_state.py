@@ -23,7 +23,7 @@ Encapsulates the state of the simulation, including:
 '''
 
 from sts.util.io_master import IOMaster
-from sts.dataplane_traces.trace import Trace
+from sts.dataplane_traces.trace import load_trace
 from entities import DeferredOFConnection
 from sts.controller_manager import ControllerManager, UserSpaceControllerPatchPanel
 from sts.util.deferred_io import DeferredIOWorker
@@ -42,6 +42,7 @@ import select
 import socket
 import logging
 import time
+import os
 
 log = logging.getLogger("simulation")
 
@@ -65,6 +66,21 @@ def revert_select_monkeypatch():
   if hasattr(select, "_old_select"):
     select.select = select._old_select
 
+class BootstrapTemplate(object):
+  ''' The controller-independent pieces of a Simulation (see
+  SimulationConfig.prebootstrap()) '''
+  def __init__(self, io_master, topology, patch_panel, dataplane_trace,
+               build_seconds):
+    self.io_master = io_master
+    self.topology = topology
+    self.patch_panel = patch_panel
+    self.dataplane_trace = dataplane_trace
+    # How long it took to build the template, i.e. how much time each
+    # bootstrap() that uses it saves
+    self.build_seconds = build_seconds
+    # The process that built the template, which never uses it
+    self.owner_pid = os.getpid()
+
 class SimulationConfig(object):
   """
   Maintains the configuration for:
@@ -94,7 +110,8 @@ class SimulationConfig(object):
                            constructor, specified just as you would type them within
                            the parens.
       patch_panel_class => a sts.topology.PatchPanel class (not object!)
-      dataplane_trace   => a path to a dataplane trace file
+      dataplane_trace   => a path to a dataplane trace file, pickled or
+                           streaming (see sts.dataplane_traces.trace)
                            (e.g. dataplane_traces/ping_pong_same_subnet.trace)
       violation_persistence_threshold => number of logical time units to observe a
                                          violation before we declare that it is
@@ -133,6 +150,58 @@ class SimulationConfig(object):
       # TODO(cs): also remove "sts.util.socket_mux.pox_monkeypatcher" from start_cmd and
       #           set SimulationConfig.multiplex_sockets = False?
       self.interpose_on_controllers = False
+    self._bootstrap_template = None
+
+  def prebootstrap(self):
+    ''' Build the controller-independent parts of bootstrap() -- the
+    IOMaster, topology, patch panel, and dataplane trace -- once, ahead of
+    time, without booting any controllers.
+
+    The result is a warm template for fork()ed children of this process: the
+    first bootstrap() in each child starts from its own (copy-on-write) copy
+    of the template rather than building those parts from scratch. The
+    process that called prebootstrap() never uses the template itself, so
+    that it stays pristine for later children. '''
+    start = time.time()
+    io_master = IOMaster()
+    (topology, patch_panel, dataplane_trace) = \
+      self._build_network(io_master.create_worker_for_socket)
+    self._bootstrap_template = BootstrapTemplate(io_master, topology,
+                                                 patch_panel, dataplane_trace,
+                                                 time.time() - start)
+    log.info("Prebootstrapped simulation in %.3f seconds" %
+             self._bootstrap_template.build_seconds)
+    return self._bootstrap_template
+
+  def _take_bootstrap_template(self):
+    template = self._bootstrap_template
+    if template is None or template.owner_pid == os.getpid():
+      return None
+    # The first simulation will modify the template's state, so later
+    # bootstrap()s in this process must start from scratch.
+    self._bootstrap_template = None
+    return template
+
+  def _instantiate_topology(self, create_io_worker):
+    '''construct a clean topology object from topology_class and
+    topology_params'''
+    log.info("Creating topology...")
+    # If you want to shoot yourself in the foot, feel free :)
+    comma = "" if self._topology_params == "" else ","
+    topology = eval("%s(%s%screate_io_worker=create_io_worker)" %
+                    (self._topology_class.__name__,
+                     self._topology_params, comma))
+    return topology
+
+  def _build_network(self, create_io_worker):
+    ''' Construct the topology, patch panel, and dataplane trace '''
+    topology = self._instantiate_topology(create_io_worker)
+    patch_panel = self._patch_panel_class(topology.switches, topology.hosts,
+                                          topology.get_connected_port)
+    dataplane_trace = None
+    if self._dataplane_trace_path is not None:
+      dataplane_trace = load_trace(self._dataplane_trace_path, topology)
+    return (topology, patch_panel, dataplane_trace)
 
   def bootstrap(self, sync_callback=None, boot_controllers=default_boot_controllers):
     '''Return a simulation object encapsulating the state of
@@ -142,12 +211,14 @@ class SimulationConfig(object):
 
        May be invoked multiple times!
     '''
+    start = time.time()
     if sync_callback is None:
       sync_callback = ReplaySyncCallback(None)
+    # N.B. only set within fork()ed children of a prebootstrap()ed process
+    template = self._take_bootstrap_template()
 
-    def initialize_io_loop():
+    def initialize_io_loop(_io_master):
       ''' boot the IOLoop (needed for the controllers) '''
-      _io_master = IOMaster()
       # monkey patch time.sleep for all our friends
       _io_master.monkey_time_sleep()
       # tell sts.console to use our io_master
@@ -166,17 +237,6 @@ class SimulationConfig(object):
           patch_panel.register_controller(c.cid, c.guest_eth_addr, c.host_device)
       return patch_panel
 
-    def instantiate_topology(create_io_worker):
-      '''construct a clean topology object from topology_class and
-      topology_params'''
-      log.info("Creating topology...")
-      # If you want to shoot yourself in the foot, feel free :)
-      comma = "" if self._topology_params == "" else ","
-      topology = eval("%s(%s%screate_io_worker=create_io_worker)" %
-                      (self._topology_class.__name__,
-                       self._topology_params, comma))
-      return topology
-
     def monkeypatch_select(multiplex_sockets, controller_manager):
       mux_select = None
       demuxers = []
@@ -201,7 +261,10 @@ class SimulationConfig(object):
 
     # Instantiate the pieces needed for Simulation's constructor
     revert_select_monkeypatch()
-    io_master = initialize_io_loop()
+    if template is not None:
+      io_master = initialize_io_loop(template.io_master)
+    else:
+      io_master = initialize_io_loop(IOMaster())
     sync_connection_manager = STSSyncConnectionManager(io_master,
                                                        sync_callback)
     controller_manager = boot_controllers(self.controller_configs,
@@ -210,13 +273,14 @@ class SimulationConfig(object):
                                           multiplex_sockets=self.multiplex_sockets)
     controller_patch_panel = wire_controller_patch_panel(controller_manager,
                                                          io_master.create_worker_for_socket)
-    topology = instantiate_topology(io_master.create_worker_for_socket)
-    patch_panel = self._patch_panel_class(topology.switches, topology.hosts,
-                                          topology.get_connected_port)
+    if template is not None:
+      (topology, patch_panel, dataplane_trace) = (template.topology,
+                                                  template.patch_panel,
+                                                  template.dataplane_trace)
+    else:
+      (topology, patch_panel, dataplane_trace) = \
+        self._build_network(io_master.create_worker_for_socket)
     openflow_buffer = OpenFlowBuffer()
-    dataplane_trace = None
-    if self._dataplane_trace_path is not None:
-      dataplane_trace = Trace(self._dataplane_trace_path, topology)
     if self._violation_persistence_threshold is not None:
       violation_tracker = ViolationTracker(self._violation_persistence_threshold)
     else:
@@ -232,12 +296,17 @@ class SimulationConfig(object):
                             violation_tracker, self._kill_controllers_on_exit)
     if self.ignore_interposition:
       simulation.set_pass_through()
+    simulation.bootstrap_duration = time.time() - start
+    if template is not None:
+      simulation.bootstrap_seconds_saved = template.build_seconds
     self.current_simulation = simulation
     return simulation
 
   def set_dataplane_trace_path(self, path):
     if self._dataplane_trace_path is None:
       self._dataplane_trace_path = path
+      # Any prebootstrap()ed template was built without the trace
+      self._bootstrap_template = None
 
   def __str__(self):
     return ('''SimulationConfig(controller_configs=%s,\n'''
@@ -281,6 +350,12 @@ class Simulation(object):
     self.mux_select = mux_select
     self.multiplex_sockets = mux_select is not None
     self.demuxers = demuxers
+    # Wall-clock time spent in SimulationConfig.bootstrap(), and how much of
+    # it was skipped thanks to SimulationConfig.prebootstrap()
+    self.bootstrap_duration = 0
+    self.bootstrap_seconds_saved = 0
+    # VirtualClock, if this simulation runs in virtual time
+    self.clock = None
 
   def set_exit_code(self, code):
     self.exit_code = code
@@ -324,6 +399,9 @@ class Simulation(object):
     if self._io_master is not None:
       self._io_master.close_all()
 
+    if self.clock is not None:
+      self.clock.restore()
+
   @property
   def io_master(self):
     return self._io_master
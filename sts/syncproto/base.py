@@ -37,6 +37,9 @@ MILLION = 1000000
 class SyncTime(collections.namedtuple('SyncTime', ('seconds', 'microSeconds'))):
   last_returned_time_usec = 0
   """ ValueObject that models the microsecond timestamps used in STS Sync Messages """
+  # No per-instance __dict__: every Event holds a SyncTime
+  __slots__ = ()
+
   def __new__(cls, seconds, microSeconds):
     return super(cls, SyncTime).__new__(cls, seconds, microSeconds)
 
@@ -0,0 +1,232 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Write to a file from a background thread.
+
+BackgroundWriter takes items off of the caller's thread, encodes them to
+strings and writes them (in batches, and in the order they were given) from a
+single daemon thread. Every BackgroundWriter that is still open when the
+interpreter exits (normally, through an uncaught exception, or through
+sys.exit() from a signal handler) is drained and closed by an atexit handler.
+'''
+
+import atexit
+import os
+import sys
+import threading
+import time
+import Queue
+import logging
+log = logging.getLogger("background_writer")
+
+# How much of what has been written survives a crash, beyond what is written
+# on close():
+#  - NONE: whatever the file object happened to flush by itself.
+#  - FLUSH: everything written more than flush_interval_seconds ago is handed
+#    to the OS, so it survives the process dying (e.g. SIGKILL), but not the
+#    machine.
+#  - FSYNC: as FLUSH, but also fsync()ed, so it survives the machine going
+#    down.
+NONE = "none"
+FLUSH = "flush"
+FSYNC = "fsync"
+DURABILITIES = [NONE, FLUSH, FSYNC]
+
+# Upper bound on the number of items encoded and written in one batch
+MAX_BATCH = 1024
+
+class _Barrier(object):
+  ''' Queued behind the items written so far. The writer thread sets done
+  once it has written (and synced) all of them. '''
+  def __init__(self, close=False):
+    self.close = close
+    self.done = threading.Event()
+
+# BackgroundWriters that have not been closed yet, closed at exit
+_open_writers = []
+_open_writers_lock = threading.Lock()
+
+def _close_open_writers():
+  with _open_writers_lock:
+    writers = list(_open_writers)
+  for writer in writers:
+    try:
+      writer.close()
+    except Exception as e:
+      log.error("Could not close %s at exit: %s" % (writer.name, e))
+
+atexit.register(_close_open_writers)
+
+class BackgroundWriter(object):
+  '''
+  A write-only, file-like wrapper around output, whose write() returns
+  immediately.
+  '''
+  def __init__(self, output, encode=str, flush_interval_seconds=1.0,
+               durability=FLUSH):
+    '''
+     - output: the (open) file to write to. It is closed by close().
+     - encode: invoked on the writer thread to turn each item passed to
+       write() into the string to write. Items must not be changed after they
+       are written.
+     - flush_interval_seconds: how often to flush (and fsync) output, if
+       durability is FLUSH or FSYNC. 0 means after every batch.
+     - durability: one of DURABILITIES, see above.
+    '''
+    if durability not in DURABILITIES:
+      raise ValueError("Unknown durability %s, must be one of %s" %
+                       (durability, DURABILITIES))
+    if flush_interval_seconds < 0:
+      raise ValueError("flush_interval_seconds must not be negative")
+    self.output = output
+    self.name = getattr(output, "name", repr(output))
+    self.encode = encode
+    self.flush_interval_seconds = flush_interval_seconds
+    self.durability = durability
+    self._queue = Queue.Queue()
+    # sys.exc_info() of the first exception raised on the writer thread
+    self._error = None
+    self._closed = False
+    # N.B. a fork()ed child gets a copy of this object, but not the writer
+    # thread
+    self._pid = os.getpid()
+    self._thread = threading.Thread(target=self._run,
+                                    name="background_writer(%s)" % self.name)
+    # Daemonic, so that exiting is not held up before the atexit handler runs
+    self._thread.daemon = True
+    with _open_writers_lock:
+      _open_writers.append(self)
+    self._thread.start()
+
+  @property
+  def closed(self):
+    return self._closed
+
+  def write(self, item):
+    if self._closed:
+      raise ValueError("write to closed BackgroundWriter %s" % self.name)
+    self._raise_error()
+    self._queue.put(item)
+
+  def flush(self):
+    ''' Block until everything written so far has been flushed (and, if
+    durability is FSYNC, fsync()ed) '''
+    if self._closed:
+      raise ValueError("flush of closed BackgroundWriter %s" % self.name)
+    self._wait(_Barrier())
+    self._raise_error()
+
+  def close(self):
+    ''' Write out everything written so far, close output, and stop the writer
+    thread. Re-raises the first exception of the writer thread, if any. '''
+    if self._closed:
+      return
+    self._closed = True
+    with _open_writers_lock:
+      if self in _open_writers:
+        _open_writers.remove(self)
+    if os.getpid() != self._pid:
+      # The parent process owns output
+      return
+    self._wait(_Barrier(close=True))
+    while self._thread.is_alive():
+      self._thread.join(0.1)
+    self._raise_error()
+
+  def _wait(self, barrier):
+    self._queue.put(barrier)
+    # N.B. wait() without a timeout would block signal delivery to the main
+    # thread (e.g. ^C).
+    while not barrier.done.is_set():
+      barrier.done.wait(0.1)
+
+  def _raise_error(self):
+    # N.B. nothing is written after the first error, so that the file never
+    # has gaps
+    if self._error is not None:
+      raise self._error[0], self._error[1], self._error[2]
+
+  # ------- Writer thread ---------
+
+  def _run(self):
+    periodic = self.durability != NONE and self.flush_interval_seconds > 0
+    next_sync = time.time() + self.flush_interval_seconds
+    while True:
+      batch = []
+      try:
+        if periodic:
+          batch.append(self._queue.get(timeout=max(0.0, next_sync - time.time())))
+        else:
+          batch.append(self._queue.get())
+        while len(batch) < MAX_BATCH:
+          batch.append(self._queue.get_nowait())
+      except Queue.Empty:
+        pass
+
+      chunks = []
+      for item in batch:
+        if isinstance(item, _Barrier):
+          self._write(chunks)
+          chunks = []
+          self._sync()
+          next_sync = time.time() + self.flush_interval_seconds
+          if item.close:
+            self._close_output()
+          item.done.set()
+          if item.close:
+            return
+        elif self._error is None:
+          try:
+            chunks.append(self.encode(item))
+          except Exception:
+            self._write(chunks)
+            chunks = []
+            self._record_error()
+      self._write(chunks)
+      if self.durability != NONE:
+        if not periodic:
+          self._sync()
+        elif time.time() >= next_sync:
+          self._sync()
+          next_sync = time.time() + self.flush_interval_seconds
+
+  def _record_error(self):
+    if self._error is None:
+      log.error("Error writing to %s" % self.name)
+      self._error = sys.exc_info()
+
+  def _write(self, chunks):
+    if chunks and self._error is None:
+      try:
+        self.output.write("".join(chunks))
+      except Exception:
+        self._record_error()
+
+  def _sync(self):
+    ''' Flush output, and fsync it if durability is FSYNC '''
+    if self._error is not None:
+      return
+    try:
+      self.output.flush()
+      if self.durability == FSYNC:
+        os.fsync(self.output.fileno())
+    except Exception:
+      self._record_error()
+
+  def _close_output(self):
+    try:
+      self.output.close()
+    except Exception:
+      self._record_error()
@@ -150,6 +150,9 @@ def base64_decode_openflow(data):
   return msg
 
 def is_flow_mod(receive_event):
+  if hasattr(receive_event, "get_packet"):
+    # Reuse the packet memoized on the event rather than decoding it again
+    return type(receive_event.get_packet()) == ofp_flow_mod
   return type(base64_decode_openflow(receive_event.b64_packet)) == ofp_flow_mod
 
 class IPAddressSpace(object):
@@ -0,0 +1,96 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Run several blocking Forker.fork() invocations at the same time.
+
+Each job handed to ForkPool blocks (in a parent-side worker thread) on its own
+child process, so a pool of N workers keeps up to N replay children busy at
+once.
+'''
+
+from collections import namedtuple
+import threading
+import Queue
+import time
+import sys
+import logging
+log = logging.getLogger("fork_pool")
+
+class PoolResult(namedtuple('PoolResult', ['value', 'worker_id',
+                                           'queue_wait_seconds',
+                                           'run_seconds'])):
+  ''' Return value of one job, along with which worker ran it and how long it
+  waited in the queue / ran for. '''
+  pass
+
+class ForkPool(object):
+  ''' A fixed number of worker threads that pull jobs off of a shared queue.
+
+  Jobs are functions taking a single parameter: the integer id of the worker
+  that is running them (0 <= worker_id < num_workers). Two jobs with the same
+  worker_id never run at the same time, so jobs may use worker_id to name
+  per-worker resources (e.g. Forker task names).
+  '''
+  def __init__(self, num_workers):
+    if num_workers < 1:
+      raise ValueError("num_workers must be at least 1")
+    self.num_workers = num_workers
+
+  def map(self, jobs):
+    ''' Run all jobs, and block until they have completed.
+
+    Returns a list of PoolResults in the same order as jobs. If any job raised
+    an exception, the exception of the first such job (in job order) is
+    re-raised after all other jobs have finished. '''
+    work_queue = Queue.Queue()
+    submit_time = time.time()
+    for idx, job in enumerate(jobs):
+      work_queue.put((idx, job))
+    results = [None] * len(jobs)
+    errors = [None] * len(jobs)
+
+    def work(worker_id):
+      while True:
+        try:
+          (idx, job) = work_queue.get_nowait()
+        except Queue.Empty:
+          return
+        start = time.time()
+        try:
+          value = job(worker_id)
+        except Exception:
+          log.warn("Job %d raised an exception on worker %d" % (idx, worker_id))
+          errors[idx] = sys.exc_info()
+          continue
+        results[idx] = PoolResult(value, worker_id, start - submit_time,
+                                  time.time() - start)
+
+    threads = []
+    for worker_id in range(min(self.num_workers, len(jobs))):
+      thread = threading.Thread(target=work, args=(worker_id,),
+                                name="fork_pool_%d" % worker_id)
+      thread.daemon = True
+      thread.start()
+      threads.append(thread)
+    for thread in threads:
+      # N.B. join() without a timeout would block signal delivery to the
+      # main thread (e.g. ^C).
+      while thread.is_alive():
+        thread.join(0.1)
+
+    for error in errors:
+      if error is not None:
+        raise error[0], error[1], error[2]
+    return results
@@ -129,6 +129,10 @@ class IOMaster(object):
     if self.pinger:
       self.pinger.ping()
 
+  def wakeup(self):
+    ''' Make a select() blocked in another thread return now '''
+    self._ping()
+
   def close_all(self):
     if self._in_select > 0:
       self._close_requested = True
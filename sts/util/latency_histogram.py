@@ -0,0 +1,145 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+class LatencyHistogram(object):
+  '''
+  Histogram of durations with power-of-two buckets: bucket 0 holds durations
+  below base_seconds, and bucket i > 0 holds durations in
+  [base_seconds * 2**(i-1), base_seconds * 2**i).
+
+  The buckets are fixed, so histograms recorded in different processes can
+  be merged by adding up their counts.
+  '''
+  base_seconds = 1e-6
+
+  def __init__(self):
+    # { bucket -> count }
+    self.buckets = {}
+    self.count = 0
+    self.total_seconds = 0.0
+    self.max_seconds = 0.0
+
+  @staticmethod
+  def bucket(seconds):
+    if seconds < LatencyHistogram.base_seconds:
+      return 0
+    return math.frexp(seconds / LatencyHistogram.base_seconds)[1]
+
+  @staticmethod
+  def bucket_bounds(bucket):
+    ''' Return the [lower, upper) seconds of the given bucket '''
+    if bucket == 0:
+      return (0.0, LatencyHistogram.base_seconds)
+    return (LatencyHistogram.base_seconds * 2 ** (bucket - 1),
+            LatencyHistogram.base_seconds * 2 ** bucket)
+
+  def record(self, seconds):
+    bucket = self.bucket(seconds)
+    self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+    self.count += 1
+    self.total_seconds += seconds
+    if seconds > self.max_seconds:
+      self.max_seconds = seconds
+
+  def merge(self, other):
+    for bucket, count in other.buckets.iteritems():
+      self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+    self.count += other.count
+    self.total_seconds += other.total_seconds
+    self.max_seconds = max(self.max_seconds, other.max_seconds)
+
+  def mean_seconds(self):
+    if self.count == 0:
+      return 0.0
+    return self.total_seconds / self.count
+
+  def percentile_seconds(self, percentile):
+    ''' Upper bound of the bucket holding the given percentile (0-100) '''
+    if self.count == 0:
+      return 0.0
+    rank = percentile / 100.0 * self.count
+    seen = 0
+    for bucket in sorted(self.buckets.keys()):
+      seen += self.buckets[bucket]
+      if seen >= rank:
+        return min(self.bucket_bounds(bucket)[1], self.max_seconds)
+    return self.max_seconds
+
+  def to_dict(self):
+    # xmlrpclib (and JSON) only allow string keys
+    return { "buckets" : dict((str(b), c) for b, c in self.buckets.iteritems()),
+             "count" : self.count,
+             "total_seconds" : self.total_seconds,
+             "max_seconds" : self.max_seconds }
+
+  @staticmethod
+  def from_dict(d):
+    histogram = LatencyHistogram()
+    histogram.buckets = dict((int(b), c) for b, c in d["buckets"].iteritems())
+    histogram.count = d["count"]
+    histogram.total_seconds = d["total_seconds"]
+    histogram.max_seconds = d["max_seconds"]
+    return histogram
+
+class ReplayLatencies(object):
+  '''
+  Latency histograms of a replay (or of several replays, once merged):
+  one per class of event scheduled, and one per phase of the replay, e.g.
+  "bootstrap", "scheduling", "checking", "cleanup".
+
+  Recording a latency costs a dict lookup and a few arithmetic operations,
+  so Replayer always keeps track of them.
+  '''
+  def __init__(self):
+    # { event class name -> LatencyHistogram }
+    self.events = {}
+    # { phase name -> LatencyHistogram }
+    self.phases = {}
+
+  @staticmethod
+  def _record(histograms, key, seconds):
+    histogram = histograms.get(key)
+    if histogram is None:
+      histogram = LatencyHistogram()
+      histograms[key] = histogram
+    histogram.record(seconds)
+
+  def record_event(self, event, seconds):
+    self._record(self.events, type(event).__name__, seconds)
+
+  def record_phase(self, phase, seconds):
+    self._record(self.phases, phase, seconds)
+
+  def merge(self, other):
+    for (histograms, other_histograms) in [(self.events, other.events),
+                                           (self.phases, other.phases)]:
+      for key, histogram in other_histograms.iteritems():
+        if key not in histograms:
+          histograms[key] = LatencyHistogram()
+        histograms[key].merge(histogram)
+
+  def to_dict(self):
+    return { "events" : dict((k, h.to_dict()) for k, h in self.events.iteritems()),
+             "phases" : dict((k, h.to_dict()) for k, h in self.phases.iteritems()) }
+
+  @staticmethod
+  def from_dict(d):
+    latencies = ReplayLatencies()
+    for (histograms, key) in [(latencies.events, "events"),
+                              (latencies.phases, "phases")]:
+      for k, h in d.get(key, {}).iteritems():
+        histograms[k] = LatencyHistogram.from_dict(h)
+    return latencies
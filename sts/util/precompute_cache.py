@@ -13,8 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
+from collections import defaultdict, Counter
 import itertools
+import hashlib
+import json
+import os
+import errno
+import threading
 
 class PrecomputePowerSetCache(object):
   sequence_id = itertools.count(1)
@@ -38,4 +43,139 @@ class PrecomputeCache(object):
   def update(self, input_sequence):
     self.done_sequences.add(input_sequence)
 
+class MonotoneOutcomeIndex(object):
+  ''' Dominance index over sets of input labels, for delta debugging under
+  the assumption that violations are monotone: if a set of inputs reproduces
+  the violation, so does every superset, and if a set does not reproduce the
+  violation, neither does any subset.
 
+  Rather than comparing a candidate against every recorded set, each
+  recorded set is indexed by its elements (like PrecomputePowerSetCache), so
+  a query only touches the recorded sets that share elements with the
+  candidate.
+  '''
+  def __init__(self):
+    self._set_ids = itertools.count(1)
+    # element -> ids of recorded violating sets containing that element
+    self._violating_element2ids = defaultdict(set)
+    # id of a recorded violating set -> number of distinct elements in it
+    self._violating_set_sizes = {}
+    self._empty_set_violates = False
+    # element -> ids of recorded non-violating sets containing that element
+    self._passing_element2ids = defaultdict(set)
+    self._any_passing = False
+
+  def update(self, input_sequence, violation):
+    ''' Record the outcome of replaying input_sequence. '''
+    elements = set(input_sequence)
+    set_id = self._set_ids.next()
+    if violation:
+      if len(elements) == 0:
+        self._empty_set_violates = True
+      self._violating_set_sizes[set_id] = len(elements)
+      for elem in elements:
+        self._violating_element2ids[elem].add(set_id)
+    else:
+      self._any_passing = True
+      for elem in elements:
+        self._passing_element2ids[elem].add(set_id)
+
+  def implies_violation(self, input_sequence):
+    ''' Whether some recorded violating set is a subset of input_sequence '''
+    if self._empty_set_violates:
+      return True
+    # A recorded set is a subset iff all of its elements were hit
+    hits = Counter()
+    for elem in set(input_sequence):
+      for set_id in self._violating_element2ids.get(elem, ()):
+        hits[set_id] += 1
+        if hits[set_id] == self._violating_set_sizes[set_id]:
+          return True
+    return False
+
+  def implies_no_violation(self, input_sequence):
+    ''' Whether input_sequence is a subset of some recorded non-violating set '''
+    if not self._any_passing:
+      return False
+    # Intersect the sets containing each element, rarest elements first so
+    # that we can bail out early.
+    id_sets = []
+    for elem in set(input_sequence):
+      ids = self._passing_element2ids.get(elem)
+      if not ids:
+        return False
+      id_sets.append(ids)
+    id_sets.sort(key=len)
+    candidates = None
+    for ids in id_sets:
+      candidates = set(ids) if candidates is None else candidates & ids
+      if not candidates:
+        return False
+    return True
+
+  def implied_outcome(self, input_sequence):
+    ''' Return True if input_sequence is implied to reproduce the violation,
+    False if it is implied not to, and None if we don't know. '''
+    if self.implies_violation(input_sequence):
+      return True
+    if self.implies_no_violation(input_sequence):
+      return False
+    return None
+
+class ReplayOutcomeCache(object):
+  ''' Durable cache of replay outcomes, shared across MCS runs.
+
+  Each entry is stored in its own small JSON file under cache_dir, named by
+  the key. Entries are written to a temporary file and then rename()'ed into
+  place, so several processes (or threads) may share one cache directory
+  without any locking: readers only ever see complete entries, and if two
+  writers race on the same key, one complete entry wins.
+  '''
+  _tmp_id = itertools.count(1)
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    try:
+      os.makedirs(cache_dir)
+    except OSError as e:
+      if e.errno != errno.EEXIST or not os.path.isdir(cache_dir):
+        raise
+
+  @staticmethod
+  def make_key(*components):
+    ''' Return a content hash of components, which must be JSON
+    serializable (non-serializable leaves are converted with str()). '''
+    serialized = json.dumps(components, sort_keys=True, default=str)
+    return hashlib.sha1(serialized).hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key + ".json")
+
+  def get(self, key):
+    ''' Return (violation_found, timed_out_labels), or None if absent. '''
+    try:
+      with open(self._path(key)) as entry:
+        json_hash = json.load(entry)
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return None
+      raise
+    except ValueError:
+      # Should not happen given atomic renames, but don't let a corrupt
+      # entry (e.g. a truncated file after a disk-full) wedge the search.
+      return None
+    return (json_hash['violation_found'], json_hash['timed_out_labels'])
+
+  def put(self, key, violation_found, timed_out_labels):
+    tmp_path = "%s.tmp.%d.%d.%d" % (self._path(key), os.getpid(),
+                                    threading.current_thread().ident,
+                                    self._tmp_id.next())
+    with open(tmp_path, "w") as entry:
+      json.dump({'violation_found' : bool(violation_found),
+                 'timed_out_labels' : list(timed_out_labels)}, entry)
+      entry.flush()
+      os.fsync(entry.fileno())
+    os.rename(tmp_path, self._path(key))
+
+  def __contains__(self, key):
+    return os.path.exists(self._path(key))
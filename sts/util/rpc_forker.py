@@ -2,11 +2,20 @@
 from abc import *
 import os
 from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+import SocketServer
 import xmlrpclib
+import httplib
+import socket
 import sys
 import marshal
 import signal
-from sts.util.convenience import find_port
+import threading
+import collections
+import types
+import time
+import errno
+import struct
+from sts.util.convenience import find_port, true_random
 from pox.lib.util import connect_with_backoff
 import logging
 log = logging.getLogger("rpc_forker")
@@ -64,6 +73,12 @@ class Forker(object):
   #  - parent returns result to caller.
   __metaclass__ = ABCMeta
 
+  # Ports handed out to children that have not yet exited. Several threads
+  # may fork() at the same time (see sts.util.fork_pool), so find_port() alone
+  # is not enough to keep two children from choosing the same port.
+  _port_lock = threading.Lock()
+  _reserved_ports = set()
+
   def __init__(self, strict_assertion_checking=False):
     self._task_registry = TaskRegistry()
     self.strict_assertion_checking = strict_assertion_checking
@@ -89,9 +104,18 @@ class Forker(object):
   def _new_child_url(self, ip='localhost', port=None):
     # Called within the parent process
     if port is None:
-      port = find_port(xrange(3000,6000))
+      with Forker._port_lock:
+        port = find_port(xrange(3000,6000))
+        while port in Forker._reserved_ports:
+          port = find_port(xrange(3000,6000))
+        Forker._reserved_ports.add(port)
     return (ip, port)
 
+  def _release_child_url(self, ip, port):
+    # Called within the parent process, after the child has exited
+    with Forker._port_lock:
+      Forker._reserved_ports.discard(port)
+
   def _invoke_child_rpc(self, ip, port, task_name, *args):
     # Called within the parent process
     child_url = "http://" + str(ip) + ":" + str(port) + "/"
@@ -154,27 +178,345 @@ class LocalForker(Forker):
       LocalForker._active_pids.add(pid)
       child_return = self._invoke_child_rpc(ip, port,
                                             task_name, *args, **kws)
-      LocalForker._active_pids.remove(pid)
+      LocalForker._active_pids.discard(pid)
 
       os.waitpid(pid, 0)
+      self._release_child_url(ip, port)
       return child_return
 
+def _to_wire(value):
+  ''' Convert value to the types that an XML-RPC round trip would have
+  returned (lists instead of tuples, plain dicts instead of dict subclasses),
+  so that PipeForker results are interchangeable with LocalForker results. '''
+  if isinstance(value, (list, tuple)):
+    return [ _to_wire(v) for v in value ]
+  if isinstance(value, dict):
+    return dict((k, _to_wire(v)) for k, v in value.iteritems())
+  return value
+
+def _write_all(fd, data):
+  while data:
+    try:
+      written = os.write(fd, data)
+    except OSError as e:
+      if e.errno != errno.EINTR:
+        raise
+      continue
+    data = data[written:]
+
+def _read_all(fd):
+  chunks = []
+  while True:
+    try:
+      chunk = os.read(fd, 65536)
+    except OSError as e:
+      if e.errno != errno.EINTR:
+        raise
+      continue
+    if chunk == "":
+      return "".join(chunks)
+    chunks.append(chunk)
+
+class PipeForker(LocalForker):
+  ''' LocalForker that sends the child's result back over an inherited pipe
+  rather than through an RPC server in the child, so no ports need to be
+  allocated and the parent never has to poll for the child to come up.
+
+  Results are marshal()ed, so they may only contain the types that
+  LocalForker's XML-RPC transport supports. '''
+  # Wire format: one status byte, the payload length, and the payload
+  _header = struct.Struct("!cI")
+  _RESULT = "R"
+  _ERROR = "E"
+
+  def fork(self, task_name, *args, **kws):
+    # N.B. get_task raises an exception if task_name is not registered
+    task = self._task_registry.get_task(task_name)
+    if self.strict_assertion_checking:
+      test_serialize_request(task_name, *args)
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0: # Child
+      # Send parents interrupts to the child
+      os.setsid()
+      os.close(read_fd)
+      try:
+        (status, payload) = (self._RESULT, marshal.dumps(_to_wire(task(*args))))
+      except:
+        import traceback
+        (status, payload) = (self._ERROR, traceback.format_exc())
+      try:
+        _write_all(write_fd, self._header.pack(status, len(payload)) + payload)
+        sys.stdout.flush()
+        sys.stderr.flush()
+      finally:
+        os._exit(0)
+    else: # Parent
+      os.close(write_fd)
+      LocalForker._active_pids.add(pid)
+      try:
+        data = _read_all(read_fd)
+      finally:
+        os.close(read_fd)
+        LocalForker._active_pids.discard(pid)
+        os.waitpid(pid, 0)
+      if len(data) < self._header.size:
+        raise ReplayException("The child replay process exited without returning a result")
+      (status, length) = self._header.unpack_from(data)
+      payload = data[self._header.size:self._header.size+length]
+      if len(payload) != length:
+        raise ReplayException("The child replay process returned a truncated result")
+      if status == self._ERROR:
+        raise ReplayException("An Exception occured in the child replay process: %s" %
+                              payload)
+      return marshal.loads(payload)
+
+def serialize_task(code_block):
+  ''' Encode a function so that it can be sent across the wire to a
+  ForkerDaemon. Only the function's code, default arguments, and the name of
+  the module holding its globals are sent, so the function must not depend on
+  its closure, and its module must be importable on the daemon's side. '''
+  if code_block.func_closure:
+    raise ValueError("Task %s depends on its closure, and cannot be sent to "
+                     "a remote Forker" % code_block.__name__)
+  if code_block.__module__ == "__main__":
+    raise ValueError("Task %s is defined in __main__, and cannot be sent to "
+                     "a remote Forker" % code_block.__name__)
+  return marshal.dumps((code_block.__module__, code_block.func_code,
+                        code_block.func_defaults)).encode('base64')
+
+def deserialize_task(serialized_task):
+  ''' Inverse of serialize_task(). Called within the daemon process. '''
+  (module_name, code, defaults) = marshal.loads(serialized_task.decode('base64'))
+  __import__(module_name)
+  return types.FunctionType(code, sys.modules[module_name].__dict__,
+                            code.co_name, defaults)
+
+class JobTimeout(ReplayException):
+  pass
+
+class _DaemonDied(Exception):
+  pass
+
+class _TimeoutTransport(xmlrpclib.Transport):
+  ''' xmlrpclib.Transport with a socket timeout (None for no timeout) '''
+  def __init__(self, timeout):
+    xmlrpclib.Transport.__init__(self)
+    self.timeout = timeout
+
+  def make_connection(self, host):
+    connection = xmlrpclib.Transport.make_connection(self, host)
+    connection.timeout = self.timeout
+    return connection
+
+class _ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class ForkerDaemon(object):
+  ''' Long-lived worker process that runs jobs on behalf of a RemoteForker.
+
+  Each job runs in its own LocalForker child, so jobs never see each other's
+  state. RPC methods:
+    - ping(): health check. Returns an id that changes whenever the daemon
+      restarts, so that clients know to register their tasks again.
+    - register_task(task_name, serialized_task)
+    - run_task(task_name, args): block until the task completes, and return
+      its return value.
+    - abort(): kill the children of any running jobs.
+  '''
+  def __init__(self, ip='localhost', port=7000):
+    self.instance_id = "%s:%d:%d:%f" % (ip, port, os.getpid(), time.time())
+    self._forker = LocalForker()
+    self.server = _ThreadedXMLRPCServer((ip, port), DebuggableHandler,
+                                        allow_none=True, logRequests=False)
+    self.server.register_function(self.ping, "ping")
+    self.server.register_function(self.register_task, "register_task")
+    self.server.register_function(self.run_task, "run_task")
+    self.server.register_function(self.abort, "abort")
+
+  def ping(self):
+    return self.instance_id
+
+  def register_task(self, task_name, serialized_task):
+    self._forker.register_task(task_name, deserialize_task(serialized_task))
+    return True
+
+  def run_task(self, task_name, args):
+    log.info("Running task %s" % task_name)
+    daemon_pid = os.getpid()
+    try:
+      return self._forker.fork(task_name, *args)
+    except SystemExit:
+      if os.getpid() != daemon_pid:
+        # We are the LocalForker child, which inherited this RPC handler
+        # thread. Don't let the exit unwind into the daemon's RPC machinery,
+        # which would send a bogus fault over the inherited client socket.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+      raise
+
+  def abort(self):
+    log.info("Aborting running tasks")
+    LocalForker.kill_all()
+    return True
+
+  def serve_forever(self):
+    # Daemons started by fork()ing a common parent would otherwise all choose
+    # the same ports for their children.
+    true_random.seed()
+    try:
+      self.server.serve_forever()
+    finally:
+      LocalForker.kill_all()
+      self.server.server_close()
+
+class _RemoteServer(object):
+  ''' RemoteForker's bookkeeping for one ForkerDaemon '''
+  def __init__(self, ip, port):
+    self.ip = ip
+    self.port = port
+    self.url = "http://%s:%d/" % (ip, port)
+    self.instance_id = None
+    self.dead = False
+    self.last_checked = None
+    # task name -> serialized task most recently sent to this daemon instance
+    self.registered_tasks = {}
+
+  def proxy(self, timeout):
+    return xmlrpclib.ServerProxy(self.url, transport=_TimeoutTransport(timeout),
+                                 allow_none=True)
+
+  def __str__(self):
+    return "%s:%d" % (self.ip, self.port)
+
 class RemoteForker(Forker):
-  def __init__(self, server_info_list):
-    ''' cycles through server_info_list for each invocation of fork() '''
-    pass
+  ''' Runs each fork()ed task on one of several ForkerDaemons, possibly on
+  other machines (see tools/forker_daemon.py).
+
+  Each daemon runs at most one of our jobs at a time; fork() blocks until a
+  daemon is free, so several threads may fork() at once (e.g. through
+  sts.util.fork_pool). Daemons are health checked before use, at most once
+  every health_check_interval seconds while they are up. Jobs that were lost
+  because their daemon died are re-run on another daemon, up to max_attempts
+  times. If job_timeout is not None, jobs that run for longer than
+  job_timeout seconds are aborted, and fork() raises JobTimeout.
+
+  Registered tasks must not depend on their closure (see serialize_task()).
+  '''
+  def __init__(self, server_info_list, job_timeout=None,
+               health_check_timeout=5.0, health_check_interval=30.0,
+               max_attempts=3, strict_assertion_checking=False):
+    ''' server_info_list is a list of (ip, port) tuples, which are cycled
+    through for each invocation of fork() '''
+    super(RemoteForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if len(server_info_list) == 0:
+      raise ValueError("RemoteForker needs at least one server")
+    self.servers = [ _RemoteServer(ip, port) for (ip, port) in server_info_list ]
+    self.job_timeout = job_timeout
+    self.health_check_timeout = health_check_timeout
+    self.health_check_interval = health_check_interval
+    self.max_attempts = max_attempts
+    self._idle_servers = collections.deque(self.servers)
+    self._num_busy = 0
+    self._servers_changed = threading.Condition()
 
   def register_task(self, task_name, code_block):
     # Serialize the code_block so we can send it across the wire to the child
-    serialized_code = marshal.dumps(code_block.func_code)\
-                             .encode('base64')
-    self._task_registry.register_task(task_name, serialized_code)
+    self._task_registry.register_task(task_name, serialize_task(code_block))
 
   def fork(self, task_name, *args, **kws):
-    # TODO(cs): Need to define a main() method for the child process, tell child what URL
-    # to bind to via command line arguments, and have child boot
-    # up an RPC server. Then send over the TaskRegistry's task code over the wire,
-    # have the child deserialize the base64 encoded func object, and have the
-    # child register the tasks as RPC stubs.
-    task = self._task_registry.get_task(task_name)
-    pass
+    # N.B. get_task raises an exception if task_name is not registered
+    serialized_task = self._task_registry.get_task(task_name)
+    if self.strict_assertion_checking:
+      test_serialize_request(task_name, *args)
+    for attempt in xrange(self.max_attempts):
+      server = self._acquire_server()
+      try:
+        return self._run_task(server, task_name, serialized_task, args)
+      except _DaemonDied as e:
+        log.warn("Daemon %s died while running task %s (%s). Re-queueing" %
+                 (str(server), task_name, str(e)))
+        server.dead = True
+      finally:
+        self._release_server(server)
+    raise ReplayException("Task %s was lost %d times. Giving up" %
+                          (task_name, self.max_attempts))
+
+  def _acquire_server(self):
+    ''' Block until a daemon that passes its health check is free, and
+    return it. Raises ReplayException if all daemons are down. '''
+    while True:
+      with self._servers_changed:
+        server = None
+        while server is None:
+          candidates = [ s for s in self._idle_servers
+                         if not s.dead or self._due_for_health_check(s) ]
+          if candidates != []:
+            server = candidates[0]
+            self._idle_servers.remove(server)
+          elif self._num_busy == 0:
+            raise ReplayException("All daemons are down: %s" %
+                                  ", ".join(str(s) for s in self.servers))
+          else:
+            # N.B. wait() with a timeout so that we can still be interrupted
+            self._servers_changed.wait(0.1)
+        self._num_busy += 1
+      if self._check_health(server):
+        return server
+      self._release_server(server)
+
+  def _release_server(self, server):
+    with self._servers_changed:
+      self._num_busy -= 1
+      self._idle_servers.append(server)
+      self._servers_changed.notify_all()
+
+  def _due_for_health_check(self, server):
+    return (server.last_checked is None or
+            time.time() - server.last_checked >= self.health_check_interval)
+
+  def _check_health(self, server):
+    if not server.dead and not self._due_for_health_check(server):
+      return True
+    server.last_checked = time.time()
+    try:
+      instance_id = server.proxy(self.health_check_timeout).ping()
+    except (socket.error, httplib.HTTPException, xmlrpclib.Error) as e:
+      log.warn("Daemon %s failed its health check (%s)" % (str(server), str(e)))
+      server.dead = True
+      return False
+    if instance_id != server.instance_id:
+      # The daemon was (re)started, and does not know about any of our tasks
+      server.instance_id = instance_id
+      server.registered_tasks = {}
+    server.dead = False
+    return True
+
+  def _run_task(self, server, task_name, serialized_task, args):
+    log.debug("Invoking task %s on daemon %s" % (task_name, str(server)))
+    proxy = server.proxy(self.job_timeout)
+    try:
+      if server.registered_tasks.get(task_name) != serialized_task:
+        proxy.register_task(task_name, serialized_task)
+        server.registered_tasks[task_name] = serialized_task
+      child_return = proxy.run_task(task_name, list(args))
+    except xmlrpclib.Fault as e:
+      raise ReplayException("An Exception (code %d) occured in the child replay process on %s: %s" %
+                            (e.faultCode, str(server), e.faultString))
+    except socket.timeout:
+      self._abort(server)
+      raise JobTimeout("Task %s did not complete on %s within %s seconds" %
+                       (task_name, str(server), str(self.job_timeout)))
+    except (socket.error, httplib.HTTPException, xmlrpclib.ProtocolError) as e:
+      raise _DaemonDied(str(e))
+    log.debug("Completed task %s on daemon %s" % (task_name, str(server)))
+    return child_return
+
+  def _abort(self, server):
+    try:
+      server.proxy(self.health_check_timeout).abort()
+    except (socket.error, httplib.HTTPException, xmlrpclib.Error) as e:
+      log.warn("Could not abort task on daemon %s (%s)" % (str(server), str(e)))
+      server.dead = True
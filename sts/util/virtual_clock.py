@@ -0,0 +1,116 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+class ClockTimeModule(object):
+  ''' Stands in for the time module in modules that take their time from a
+  VirtualClock '''
+  def __init__(self, clock):
+    self._clock = clock
+
+  def time(self):
+    return self._clock.time()
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+class VirtualClock(object):
+  '''
+  A clock owned by STS. It runs at the speed of the wall clock, except that
+  sleep() jumps it forward once the simulation has gone quiet, rather than
+  waiting out the rest of the sleep in real time.
+
+  While skipping ahead, the clock advances in steps of at most
+  resolution_seconds, calling each tick listener with the new time after
+  every step, so that timeouts (e.g. flow expiries) fire in order. Skipping
+  stops as soon as there is activity again, e.g. because an expiry caused a
+  message to be sent.
+  '''
+  def __init__(self, select, settle_seconds=0.02, resolution_seconds=0.1):
+    '''
+     - select: invoked with a timeout to process I/O for up to that many
+       seconds, e.g. IOMaster.select
+     - settle_seconds: how long the simulation must be quiet before the clock
+       skips ahead
+    '''
+    self.select = select
+    self.settle_seconds = settle_seconds
+    self.resolution_seconds = resolution_seconds
+    # virtual time - wall-clock time
+    self.offset = 0.0
+    self.seconds_skipped = 0.0
+    # Bumped whenever a watched source raises an event
+    self.activity = 0
+    self._tick_listeners = []
+    # module -> its original time attribute
+    self._patched_modules = {}
+
+  def time(self):
+    return time.time() + self.offset
+
+  def watch(self, source, event_type):
+    ''' Treat events of event_type raised by source as activity '''
+    source.addListener(event_type, self._handle_activity)
+
+  def _handle_activity(self, _):
+    self.activity += 1
+
+  def add_tick_listener(self, listener):
+    self._tick_listeners.append(listener)
+
+  def patch_module(self, module):
+    ''' Make module's references to the time module, or to time.time(), use
+    this clock instead. Return whether module was patched. '''
+    if module in self._patched_modules:
+      return True
+    original = getattr(module, "time", None)
+    if original is time:
+      module.time = ClockTimeModule(self)
+    elif original is time.time:
+      module.time = self.time
+    else:
+      return False
+    self._patched_modules[module] = original
+    return True
+
+  def restore(self):
+    ''' Undo patch_module() '''
+    for module, original in self._patched_modules.iteritems():
+      module.time = original
+    self._patched_modules = {}
+
+  def sleep(self, seconds):
+    ''' Let seconds pass on this clock, processing I/O '''
+    end = self.time() + seconds
+    while True:
+      remaining = end - self.time()
+      if remaining <= 0:
+        break
+      activity = self.activity
+      self.select(min(remaining, self.settle_seconds))
+      if self.activity == activity:
+        self._skip_until(end)
+
+  def _skip_until(self, end):
+    activity = self.activity
+    while self.activity == activity:
+      step = min(end - self.time(), self.resolution_seconds)
+      if step <= 0:
+        break
+      self.offset += step
+      self.seconds_skipped += step
+      now = self.time()
+      for listener in self._tick_listeners:
+        listener(now)
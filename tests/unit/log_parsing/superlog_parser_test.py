@@ -17,10 +17,13 @@
 import unittest
 import sys
 import os
+import json
+from StringIO import StringIO
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 import sts.input_traces.log_parser as log_parser
+import sts.input_traces.binary_superlog as binary_superlog
 from sts.replay_event import LinkFailure, LinkRecovery
 
 class superlog_parser_test(unittest.TestCase):
@@ -49,5 +52,55 @@ class superlog_parser_test(unittest.TestCase):
       if name is not None:
         os.unlink(name)
 
+  def test_binary(self):
+    try:
+      self.open_simple_superlog()
+      with open(self.tmpfile) as superlog:
+        lines = superlog.readlines()
+      binary = StringIO()
+      log_parser.json_to_binary(lines, binary)
+      self.assertTrue(binary.getvalue().startswith(binary_superlog.MAGIC))
+      with open(self.tmpfile, 'wb') as superlog:
+        superlog.write(binary.getvalue())
+      self.assertTrue(binary_superlog.is_binary_superlog(self.tmpfile))
+      events = log_parser.parse_path(self.tmpfile)
+      self.assertEqual([LinkFailure, LinkRecovery], [ type(e) for e in events ])
+      # Only the label is decoded until another field is accessed
+      self.assertEqual("e1", events[0].label)
+      self.assertFalse(events[0]._marshalled_json is None)
+      self.assertEqual(2, events[0].end_dpid)
+      self.assertRaises(AttributeError, getattr, events[0], '_marshalled_json')
+      self.assertEqual(["e2"], events[0].dependent_labels)
+      parsed = log_parser.parse(StringIO("".join(lines)))
+      self.assertEqual(json.loads(parsed[1].to_json()),
+                       json.loads(events[1].to_json()))
+    finally:
+      os.unlink(self.tmpfile)
+
+  def test_binary_round_trip(self):
+    try:
+      self.open_simple_superlog()
+      with open(self.tmpfile) as superlog:
+        lines = superlog.readlines()
+      binary = StringIO()
+      log_parser.json_to_binary(lines, binary)
+      binary.seek(0)
+      converted = StringIO()
+      log_parser.binary_to_json(binary, converted)
+      self.assertEqual([ json.loads(line) for line in lines ],
+                       [ json.loads(line) for line in converted.getvalue().splitlines() ])
+      again = StringIO()
+      log_parser.json_to_binary(converted.getvalue().splitlines(), again)
+      binary.seek(0)
+      again.seek(0)
+      self.assertEqual([ e.to_json() for e in log_parser.parse(binary) ],
+                       [ e.to_json() for e in log_parser.parse(again) ])
+    finally:
+      os.unlink(self.tmpfile)
+
+  def test_empty(self):
+    self.assertEqual([], log_parser.parse(StringIO("")))
+    self.assertEqual([], log_parser.parse(StringIO(binary_superlog.MAGIC)))
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.trace_index import *
+from sts.replay_event import *
+from sts.syncproto.base import SyncTime
+
+dp_fingerprint = { 'dl_src' : "00:00:00:00:00:01", 'dl_dst' : "00:00:00:00:00:02",
+                   'nw_src' : "10.0.0.1", 'nw_dst' : "10.0.0.2" }
+
+def sample_events():
+  t = SyncTime(5, 6)
+  return [ SwitchFailure(1, round=1, time=t),
+           ControlMessageReceive(2, "c1", { 'class' : "ofp_echo_request" },
+                                 b64_packet="AQIACAAAAAA=", round=1, time=t),
+           DataplanePermit(["DataplanePermit", dict(dp_fingerprint), 2, 1],
+                           round=2, time=t),
+           SwitchRecovery(1, round=2, time=t),
+           ControllerStateChange("c1", "fmt %s", "fmt %s", ["v"], round=3, time=t),
+           ControlMessageSend(1, "c1", { 'class' : "ofp_echo_request" },
+                              b64_packet="AQIACAAAAAA=", round=3, time=t) ]
+
+class TraceIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "events.trace")
+    self.events = sample_events()
+    self.lines = [ e.to_json() + "\n" for e in self.events ]
+    with open(self.path, 'w') as superlog:
+      superlog.writelines(self.lines)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def labels(self, events):
+    return [ e.label for e in events ]
+
+  def check_queries(self, trace):
+    self.assertEqual(len(self.events), len(trace))
+    self.assertEqual(self.labels(self.events), self.labels(trace))
+    self.assertEqual(self.labels(self.events[1:3]),
+                     self.labels(trace.select(rounds=(1, 2), classes=[ControlMessageReceive,
+                                                                      DataplanePermit])))
+    self.assertEqual(self.labels(self.events[2:4]),
+                     self.labels(trace.select(rounds=(2, 2))))
+    self.assertEqual(self.labels([self.events[0], self.events[3], self.events[5]]),
+                     self.labels(trace.select(dpids=[1])))
+    self.assertEqual(self.labels([self.events[0], self.events[3]]),
+                     self.labels(trace.select(inputs_only=True)))
+    self.assertEqual(self.events[4].label, trace.find(self.events[4].label).label)
+    self.assertEqual(self.events[-1].label, trace[-1].label)
+    self.assertEqual(2, trace.select(classes=[ControlMessageReceive])[0].dpid)
+
+  def test_no_index(self):
+    trace = open_trace(self.path)
+    self.assertEqual(ParsedTrace, type(trace))
+    self.check_queries(trace)
+
+  def test_json_index(self):
+    build_index(self.path)
+    trace = open_trace(self.path)
+    self.assertEqual(IndexedTrace, type(trace))
+    self.check_queries(trace)
+    trace.close()
+
+  def test_binary_index(self):
+    with open(self.path, 'rb') as superlog:
+      lines = superlog.readlines()
+    with open(self.path, 'wb') as superlog:
+      log_parser.json_to_binary(lines, superlog)
+    build_index(self.path)
+    trace = open_trace(self.path)
+    self.assertEqual(IndexedTrace, type(trace))
+    self.check_queries(trace)
+    trace.close()
+
+  def test_stale_index(self):
+    build_index(self.path)
+    with open(self.path, 'a') as superlog:
+      superlog.write(WaitTime(1.0, time=SyncTime(5, 6)).to_json() + "\n")
+    trace = open_trace(self.path)
+    self.assertEqual(ParsedTrace, type(trace))
+    self.assertEqual(len(self.events) + 1, len(trace))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.replayer import DataplaneChecker
+from sts.event_dag import EventDag
+from sts.fingerprints.messages import DPFingerprint
+from sts.replay_event import DataplanePermit, DataplaneDrop, SwitchFailure
+from sts.util.convenience import find, find_index
+
+class MockPacket(object):
+  ''' Fingerprinted by its ethernet type alone '''
+  def __init__(self, eth_type):
+    self.type = eth_type
+    self.next = "payload"
+
+class MockNode(object):
+  def __init__(self, dpid):
+    self.dpid = dpid
+
+class MockPort(object):
+  def __init__(self, port_no):
+    self.port_no = port_no
+
+class MockDpPacketOut(object):
+  def __init__(self, eth_type, dpid, port_no):
+    self.packet = MockPacket(eth_type)
+    self.node = MockNode(dpid)
+    self.port = MockPort(port_no)
+
+def dp_event(event_type, eth_type, dpid, port_no, round):
+  return event_type(({'dl_type' : eth_type}, dpid, port_no), round=round)
+
+class LinearScanDataplaneChecker(DataplaneChecker):
+  ''' The window and matching logic of DataplaneChecker before it was indexed,
+  except that matched events are flushed by identity rather than by
+  (possibly stale) list index '''
+  def __init__(self, event_dag, slop_buffer=10):
+    super(LinearScanDataplaneChecker, self).__init__(event_dag, slop_buffer)
+    self.current_dp_events = []
+
+  def decide_drop(self, dp_event):
+    dp_fingerprint = (DPFingerprint.from_pkt(dp_event.packet),
+                      dp_event.node.dpid, dp_event.port.port_no)
+    event = find(lambda e: e.fingerprint[1:] == dp_fingerprint,
+                 self.current_dp_events)
+    if event is None:
+      return False
+    self.current_dp_events.remove(event)
+    self.events.remove(event)
+    if event.fingerprint[0] == "DataplanePermit":
+      return False
+    self.stats.record_drop(event.fingerprint)
+    return True
+
+  def update_window(self, current_round):
+    head_idx = find_index(lambda e: e.round == current_round - self.slop_buffer,
+                          self.events)
+    head_idx = max(head_idx, 0)
+    tail_idx = find_index(lambda e: e.round == current_round + self.slop_buffer,
+                          self.events)
+    if tail_idx is None:
+      tail_idx = len(self.events)
+    self.current_dp_events = [ e for e in self.events[head_idx:tail_idx]
+                               if type(e) in [DataplanePermit, DataplaneDrop] ]
+
+class DataplaneCheckerTest(unittest.TestCase):
+  def test_window(self):
+    events = [ dp_event(DataplaneDrop, 1, 1, 1, 0),
+               SwitchFailure(1, round=5),
+               dp_event(DataplanePermit, 1, 1, 1, 10),
+               dp_event(DataplaneDrop, 2, 1, 1, 25) ]
+    checker = DataplaneChecker(EventDag(events), slop_buffer=10)
+    # Nothing is expected before the window is set
+    self.assertFalse(checker.decide_drop(MockDpPacketOut(1, 1, 1)))
+    checker.update_window(15)
+    # The window is [first event of round 5, first event of round 25)
+    self.assertFalse(checker.decide_drop(MockDpPacketOut(2, 1, 1)))
+    self.assertFalse(checker.decide_drop(MockDpPacketOut(1, 1, 1)))
+    # The permit was flushed, and the drop at round 0 is outside the window
+    self.assertFalse(checker.decide_drop(MockDpPacketOut(1, 1, 1)))
+    checker.update_window(5)
+    self.assertTrue(checker.decide_drop(MockDpPacketOut(1, 1, 1)))
+    self.assertFalse(checker.decide_drop(MockDpPacketOut(1, 1, 1)))
+    checker.update_window(20)
+    self.assertTrue(checker.decide_drop(MockDpPacketOut(2, 1, 1)))
+    self.assertEqual(2, len(checker.stats.actual_drops))
+
+  def test_same_as_linear_scan(self):
+    rng = random.Random(0)
+    for _ in range(20):
+      events = []
+      for i in range(300):
+        round = i / 3
+        if rng.random() < 0.2:
+          events.append(SwitchFailure(1, round=round))
+        else:
+          event_type = DataplaneDrop if rng.random() < 0.5 else DataplanePermit
+          events.append(dp_event(event_type, rng.randint(1, 4),
+                                 rng.randint(1, 2), 1, round))
+      slop_buffer = rng.randint(1, 10)
+      checker = DataplaneChecker(EventDag(events), slop_buffer)
+      reference = LinearScanDataplaneChecker(EventDag(events), slop_buffer)
+      for current_round in range(-1, 120):
+        if current_round != -1:
+          checker.update_window(current_round)
+          reference.update_window(current_round)
+        for _ in range(rng.randint(0, 4)):
+          packet = MockDpPacketOut(rng.randint(1, 4), rng.randint(1, 2), 1)
+          self.assertEqual(reference.decide_drop(packet),
+                           checker.decide_drop(packet))
+      self.assertEqual(reference.stats.actual_drops, checker.stats.actual_drops)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,221 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.revent import EventMixin
+from sts.control_flow.base import StateChange
+from sts.control_flow.event_scheduler import EventScheduler, PartialOrder, arrival_key
+from sts.event_dag import EventDag
+from sts.openflow_buffer import PendingMessage, PendingReceive, PendingSend
+from sts.replay_event import ControllerStateChange, ControlMessageReceive
+
+class MockSyncCallback(EventMixin):
+  _eventMixin_events = set([StateChange])
+
+  def __init__(self):
+    self.pending = []
+    self.acked = []
+    self.proceed_checks = 0
+
+  def arrive(self, pending_state_change):
+    self.pending.append(pending_state_change)
+    self.raiseEvent(StateChange(pending_state_change))
+
+  def state_change_pending(self, pending_state_change):
+    self.proceed_checks += 1
+    return pending_state_change in self.pending
+
+  def ack_pending_state_change(self, pending_state_change):
+    self.pending.remove(pending_state_change)
+    self.acked.append(pending_state_change)
+
+class MockIOMaster(object):
+  def __init__(self):
+    self.woken = threading.Event()
+
+  def wakeup(self):
+    self.woken.set()
+
+class MockSimulation(object):
+  def __init__(self, sync_callback):
+    self.openflow_buffer = None
+    self.controller_sync_callback = sync_callback
+    self.patch_panel = None
+    self.io_master = MockIOMaster()
+    self.clock = None
+
+def state_change(fingerprint, controller_id="c1"):
+  return ControllerStateChange(controller_id, fingerprint, "name", ["value"])
+
+class EventSchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.sync_callback = MockSyncCallback()
+    self.simulation = MockSimulation(self.sync_callback)
+    self.selects = 0
+
+  def scheduler(self, arrivals, **kwargs):
+    ''' Each select() delivers the next of arrivals '''
+    def select(timeout):
+      self.selects += 1
+      if arrivals:
+        self.sync_callback.arrive(arrivals.pop(0))
+    return EventScheduler(self.simulation, initial_wait=30,
+                          select_continuation=select,
+                          sleep_continuation=lambda seconds: None, **kwargs)
+
+  def test_event_driven(self):
+    event = state_change("awaited")
+    arrivals = [ state_change("other %d" % i).pending_state_change
+                 for i in range(3) ] + [ event.pending_state_change ]
+    scheduler = self.scheduler(arrivals)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual(4, self.selects)
+    # Unrelated arrivals don't cause retries
+    self.assertEqual(2, self.sync_callback.proceed_checks)
+    latency = scheduler.stats.get_wait_latency_dict()["ControllerStateChange"]
+    self.assertEqual(1, latency["matched"])
+    self.assertEqual(1, latency["observed_arrivals"])
+
+  def test_polling(self):
+    event = state_change("awaited")
+    arrivals = [ state_change("other %d" % i).pending_state_change
+                 for i in range(3) ] + [ event.pending_state_change ]
+    scheduler = self.scheduler(arrivals, event_driven=False)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual(4, self.selects)
+    self.assertEqual(5, self.sync_callback.proceed_checks)
+    latency = scheduler.stats.get_wait_latency_dict()["ControllerStateChange"]
+    self.assertEqual(1, latency["observed_arrivals"])
+
+  def test_no_arrival_notifications(self):
+    # Without a listener to tell us about arrivals, retry after every select()
+    class SilentSyncCallback(MockSyncCallback):
+      _eventMixin_events = set()
+      def arrive(self, pending_state_change):
+        self.pending.append(pending_state_change)
+    self.sync_callback = SilentSyncCallback()
+    self.simulation = MockSimulation(self.sync_callback)
+    event = state_change("awaited")
+    arrivals = [ state_change("other").pending_state_change,
+                 event.pending_state_change ]
+    scheduler = self.scheduler(arrivals)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual(3, self.sync_callback.proceed_checks)
+    latency = scheduler.stats.get_wait_latency_dict()["ControllerStateChange"]
+    self.assertEqual(0, latency["observed_arrivals"])
+
+  def test_arrival_from_other_thread(self):
+    event = state_change("awaited")
+    def select(timeout):
+      self.simulation.io_master.woken.wait(timeout)
+      self.simulation.io_master.woken.clear()
+    scheduler = EventScheduler(self.simulation, initial_wait=30,
+                               sleep_interval_seconds=30,
+                               select_continuation=select,
+                               sleep_continuation=lambda seconds: None)
+    arrival = threading.Timer(0.05, self.sync_callback.arrive,
+                              [event.pending_state_change])
+    arrival.start()
+    start = time.time()
+    scheduler.schedule(event)
+    arrival.join()
+    self.assertFalse(event.timed_out)
+    self.assertTrue(time.time() - start < 5)
+
+  def test_arrival_key(self):
+    receive = ControlMessageReceive(1, "c1", ("ControlMessageReceive",
+                                              "flow_mod", 1, "c1"))
+    self.assertEqual(("receive", PendingReceive(1, "c1", "flow_mod")),
+                     arrival_key(receive))
+    scheduler = self.scheduler([])
+    scheduler._awaited_key = arrival_key(receive)
+    # A send with the same fingerprint isn't what we're waiting on
+    scheduler._handle_PendingMessage(
+      PendingMessage(PendingSend(1, "c1", "flow_mod"), "", send_event=True))
+    self.assertFalse(scheduler._woken)
+    scheduler._handle_PendingMessage(
+      PendingMessage(PendingReceive(1, "c1", "flow_mod"), ""))
+    self.assertTrue(scheduler._woken)
+
+class PartialOrderTest(unittest.TestCase):
+  def setUp(self):
+    self.sync_callback = MockSyncCallback()
+    self.simulation = MockSimulation(self.sync_callback)
+    # Recorded in this order, but c1's state change only happens in the replay
+    # once c2's has been acked
+    self.first = state_change("first", "c1")
+    self.second = state_change("second", "c2")
+    self.dag = EventDag([self.first, self.second])
+
+  def scheduler(self, **kwargs):
+    def select(timeout):
+      if self.second.pending_state_change not in self.sync_callback.acked:
+        if self.second.pending_state_change not in self.sync_callback.pending:
+          self.sync_callback.arrive(self.second.pending_state_change)
+      elif self.first.pending_state_change not in self.sync_callback.pending:
+        self.sync_callback.arrive(self.first.pending_state_change)
+    return EventScheduler(self.simulation, initial_wait=0, epsilon_seconds=0.2,
+                          sleep_interval_seconds=0.01,
+                          select_continuation=select,
+                          sleep_continuation=lambda seconds: None, **kwargs)
+
+  def test_total_order_times_out(self):
+    scheduler = self.scheduler()
+    scheduler.schedule(self.first)
+    scheduler.schedule(self.second)
+    self.assertTrue(self.first.timed_out)
+    self.assertFalse(self.second.timed_out)
+    self.assertEqual({ "ControllerStateChange" : 1 },
+                     scheduler.stats.get_timeouts_dict())
+
+  def test_partial_order(self):
+    scheduler = self.scheduler()
+    scheduler.set_partial_order(PartialOrder(self.dag))
+    scheduler.schedule(self.first)
+    self.assertFalse(self.first.timed_out)
+    self.assertFalse(self.second.timed_out)
+    self.assertEqual([self.second.pending_state_change,
+                      self.first.pending_state_change], self.sync_callback.acked)
+    # Already matched
+    scheduler.schedule(self.second)
+    self.assertEqual(2, len(self.sync_callback.acked))
+    self.assertEqual({}, scheduler.stats.get_timeouts_dict())
+    self.assertEqual({ "ControllerStateChange" : 2 },
+                     scheduler.stats.get_matches_dict())
+    self.assertEqual({ "ControllerStateChange" : 1 },
+                     scheduler.stats.get_reordered_dict())
+
+  def test_same_channel_stays_ordered(self):
+    self.second = state_change("second", "c1")
+    self.dag = EventDag([self.first, self.second])
+    partial_order = PartialOrder(self.dag)
+    self.assertEqual([], partial_order.ready_successors(self.first))
+    scheduler = self.scheduler()
+    scheduler.set_partial_order(partial_order)
+    scheduler.schedule(self.first)
+    self.assertTrue(self.first.timed_out)
+    self.assertEqual({}, scheduler.stats.get_reordered_dict())
+
+if __name__ == '__main__':
+  unittest.main()
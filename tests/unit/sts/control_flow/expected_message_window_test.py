@@ -0,0 +1,80 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.replayer import ExpectedMessageWindow
+from sts.replay_event import ControlMessageReceive, ControlMessageSend, SwitchFailure
+
+def expected_fingerprints(events, current_index, round_window):
+  ''' The fingerprint sets Replayer used to rebuild for every event '''
+  start_round = events[current_index].round
+  receives = set()
+  sends = set()
+  for event in events[current_index:]:
+    if event.round - start_round > round_window:
+      break
+    if type(event) == ControlMessageReceive:
+      receives.add(event.fingerprint[1:])
+    if type(event) == ControlMessageSend:
+      sends.add(event.fingerprint[1:])
+  return (receives, sends)
+
+def random_trace(rng, num_events, monotonic_rounds):
+  events = []
+  round = 0
+  for _ in range(num_events):
+    if monotonic_rounds:
+      round += rng.randint(0, 2)
+    else:
+      round = max(0, round + rng.randint(-3, 3))
+    r = rng.random()
+    if r < 0.2:
+      events.append(SwitchFailure(1, round=round))
+    else:
+      event_type = ControlMessageReceive if r < 0.6 else ControlMessageSend
+      dpid = rng.randint(1, 3)
+      fingerprint = (event_type.__name__, "ofp %d" % rng.randint(1, 4), dpid, "c1")
+      events.append(event_type(dpid, "c1", fingerprint, round=round))
+  return events
+
+class ExpectedMessageWindowTest(unittest.TestCase):
+  def check_same_as_rebuilding(self, events, round_window, indices):
+    window = ExpectedMessageWindow(events, round_window)
+    for i in indices:
+      window.advance(i)
+      (receives, sends) = expected_fingerprints(events, i, round_window)
+      self.assertEqual(receives, set(window.receive_fingerprints))
+      self.assertEqual(sends, set(window.send_fingerprints))
+
+  def test_same_as_rebuilding(self):
+    rng = random.Random(0)
+    for monotonic_rounds in [True, False]:
+      for round_window in [0, 1, 3, 10]:
+        events = random_trace(rng, 200, monotonic_rounds)
+        self.check_same_as_rebuilding(events, round_window, range(len(events)))
+
+  def test_jumps(self):
+    rng = random.Random(1)
+    events = random_trace(rng, 200, True)
+    indices = [ rng.randrange(len(events)) for _ in range(100) ]
+    self.check_same_as_rebuilding(events, 5, indices)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.packet.ipv4 import ipv4
+from pox.lib.packet.icmp import icmp, TYPE_ECHO_REQUEST
+from sts.entities import HostInterface
+from sts.dataplane_traces.trace import *
+from sts.dataplane_traces.trace_generator import write_trace_log
+
+class MockHost(object):
+  def __init__(self, interface):
+    self.interfaces = [interface]
+    self.sent = []
+
+  def send(self, interface, packet):
+    self.sent.append((interface, packet.pack()))
+
+class MockTopology(object):
+  def __init__(self, hosts):
+    self.hosts = hosts
+
+def ping(src, dst, payload):
+  eth = ethernet(src=src.hw_addr, dst=dst.hw_addr, type=ethernet.IP_TYPE)
+  ipp = ipv4(protocol=ipv4.ICMP_PROTOCOL, srcip=src.ips[0], dstip=dst.ips[0])
+  ipp.payload = icmp(type=TYPE_ECHO_REQUEST, payload=payload)
+  eth.payload = ipp
+  return eth
+
+class DataplaneTraceTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.interfaces = [ HostInterface(EthAddr("12:34:56:78:01:0%d" % i),
+                                      IPAddr("123.123.1.%d" % i), name="eth%d" % i)
+                        for i in [1, 2] ]
+    (a, b) = self.interfaces
+    self.events = [ DataplaneEvent(a, ping(a, b, "ping%d" % i)) if i % 2 == 0
+                    else DataplaneEvent(b, ping(b, a, "pong%d" % i))
+                    for i in xrange(10) ]
+    self.pickle_path = os.path.join(self.tmpdir, "pickle.trace")
+    self.streaming_path = os.path.join(self.tmpdir, "streaming.trace")
+    write_trace_log(self.events, self.pickle_path)
+    write_streaming_trace(self.events, self.streaming_path)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def expected(self):
+    return [ (e.interface, e.packet.pack()) for e in self.events ]
+
+  def play(self, trace, hosts):
+    sent = []
+    while True:
+      (dp_event, host) = trace.peek()
+      if dp_event is None:
+        break
+      (injected, injected_host) = trace.inject_trace_event()
+      self.assertEqual(dp_event.packet.pack(), injected.packet.pack())
+      self.assertTrue(host is injected_host)
+      sent.append(host.sent[-1])
+    self.assertEqual(None, trace.inject_trace_event())
+    return sent
+
+  def test_load_trace(self):
+    self.assertFalse(is_streaming_trace(self.pickle_path))
+    self.assertTrue(is_streaming_trace(self.streaming_path))
+    self.assertEqual(Trace, type(load_trace(self.pickle_path)))
+    self.assertEqual(StreamingTrace, type(load_trace(self.streaming_path)))
+
+  def test_playback(self):
+    for path in [self.pickle_path, self.streaming_path]:
+      hosts = [ MockHost(interface) for interface in self.interfaces ]
+      trace = load_trace(path, MockTopology(hosts))
+      self.assertEqual(self.expected(), self.play(trace, hosts))
+      # Iteration covers the whole trace, injected or not
+      self.assertEqual(self.expected(),
+                       [ (e.interface, e.packet.pack()) for e in trace ])
+
+  def test_type_check(self):
+    hosts = [ MockHost(self.interfaces[0]) ]
+    for path in [self.pickle_path, self.streaming_path]:
+      self.assertRaises(RuntimeError, load_trace, path, MockTopology(hosts))
+
+  def test_forked_child(self):
+    hosts = [ MockHost(interface) for interface in self.interfaces ]
+    trace = StreamingTrace(self.streaming_path, MockTopology(hosts))
+    trace.inject_trace_event()
+    pid = os.fork()
+    if pid == 0:
+      # Play back the rest of the trace in the child
+      try:
+        while trace.inject_trace_event() is not None:
+          pass
+      finally:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    # The child did not move the parent's position
+    (dp_event, _) = trace.peek()
+    self.assertEqual(self.events[1].packet.pack(), dp_event.packet.pack())
+
+  def test_truncated(self):
+    with open(self.streaming_path, 'rb') as tracefile:
+      contents = tracefile.read()
+    with open(self.streaming_path, 'wb') as tracefile:
+      tracefile.write(contents[:-1])
+    trace = StreamingTrace(self.streaming_path)
+    self.assertRaises(ValueError, list, trace)
+
+if __name__ == '__main__':
+  unittest.main()
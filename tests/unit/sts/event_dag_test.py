@@ -161,6 +161,260 @@ class event_dag_test(unittest.TestCase):
     fingerprint = ('HostMigration',1,1,2,2,"host1")
     self.assertEqual(fingerprint, new_dag.events[1].fingerprint)
 
+class MockSwitch(object):
+  def __init__(self, dpid):
+    self.dpid = dpid
+
+class MockLink(object):
+  def __init__(self, start_dpid, end_dpid):
+    self.start_software_switch = MockSwitch(start_dpid)
+    self.end_software_switch = MockSwitch(end_dpid)
+
+class MockTopology(object):
+  def __init__(self, network_links, access_links=[]):
+    self.network_links = network_links
+    self.access_links = access_links
+
+class TopologyAwareSplitterTest(unittest.TestCase):
+  def test_network_element(self):
+    self.assertEqual(("switch", 2), network_element(SwitchFailure(2)))
+    self.assertEqual(("link", 1, 2), network_element(LinkFailure(2, 1, 1, 1)))
+    self.assertEqual(("link", 1, 2), network_element(LinkRecovery(1, 1, 2, 1)))
+    self.assertEqual(("controller", "c1"),
+                     network_element(ControllerFailure("c1")))
+    self.assertEqual(("host", 3), network_element(HostMigration(1, 1, 2, 1, 3)))
+    atomic = AtomicInput(SwitchFailure(4), [SwitchRecovery(4)])
+    self.assertEqual(("switch", 4), network_element(atomic))
+    self.assertEqual(None, network_element(MockInputEvent()))
+
+  def test_same_sizes_as_split_list(self):
+    inputs = [ SwitchFailure(i % 3 + 1) for i in range(7) ]
+    splitter = TopologyAwareSplitter()
+    for split_ways in range(1, 8):
+      splits = splitter(inputs, split_ways)
+      self.assertEqual([ len(s) for s in split_list(inputs, split_ways) ],
+                       [ len(s) for s in splits ])
+      self.assertEqual(set(inputs), set(e for s in splits for e in s))
+
+  def test_group_by_element(self):
+    s1 = [SwitchFailure(1), SwitchRecovery(1)]
+    s5 = [SwitchFailure(5), SwitchRecovery(5)]
+    inputs = [s1[0], s5[0], s1[1], s5[1]]
+    # Contiguous splitting mixes the two switches
+    self.assertEqual([[s1[0], s5[0]], [s1[1], s5[1]]], split_list(inputs, 2))
+    self.assertEqual([s1, s5], TopologyAwareSplitter()(inputs, 2))
+
+  def test_order_by_topology(self):
+    # Line topology 1 - 2 - 3 - 4: inputs on adjacent switches end up together
+    topology = MockTopology([MockLink(1, 2), MockLink(2, 3), MockLink(3, 4)])
+    (s1, s2, s3, s4) = [ SwitchFailure(i) for i in [1, 2, 3, 4] ]
+    inputs = [s1, s4, s2, s3]
+    self.assertEqual([[s1, s2], [s4, s3]],
+                     TopologyAwareSplitter(topology)(inputs, 2))
+
+  def test_links_from_inputs(self):
+    # Without a topology, adjacency is inferred from link inputs
+    l12 = LinkFailure(1, 1, 2, 1)
+    l34 = LinkFailure(3, 1, 4, 1)
+    (s1, s2, s3, s4) = [ SwitchFailure(i) for i in [1, 2, 3, 4] ]
+    inputs = [s4, s1, l34, s3, l12, s2]
+    self.assertEqual([[s1, l12, s2], [s4, l34, s3]],
+                     TopologyAwareSplitter()(inputs, 2))
+
+  def test_host_anchor(self):
+    migration = HostMigration(3, 1, 1, 1, 7)
+    s1 = SwitchFailure(1)
+    s2 = SwitchFailure(2)
+    s3 = SwitchFailure(3)
+    inputs = [migration, s1, s2, s3]
+    # The host is attached to switch 3 before it migrates
+    self.assertEqual([[s1, s2], [migration, s3]],
+                     TopologyAwareSplitter()(inputs, 2))
+
+  def test_atomic_inputs(self):
+    a1 = AtomicInput(SwitchFailure(1), [SwitchRecovery(1)])
+    a2 = AtomicInput(SwitchFailure(2), [SwitchRecovery(2)])
+    s1 = SwitchFailure(1)
+    self.assertEqual([[a1, s1], [a2]],
+                     TopologyAwareSplitter()([a1, a2, s1], 2))
+class EventIndexTest(unittest.TestCase):
+  def state_change(self):
+    return ControllerStateChange("c1", "fingerprint", "name", [])
+
+  def linear_next_state_change(self, events, index):
+    for event in events[index:]:
+      if type(event) == ControllerStateChange:
+        return event
+    return None
+
+  def test_next_state_change(self):
+    events = [ MockInputEvent(), self.state_change(), MockInputEvent(),
+               MockInputEvent(), self.state_change(), MockInputEvent() ]
+    dag = EventDag(events)
+    for index in range(-len(events) - 1, len(events) + 2):
+      self.assertEqual(self.linear_next_state_change(events, index),
+                       dag.next_state_change(index))
+
+  def test_view_next_state_change(self):
+    events = [ MockInputEvent(), self.state_change(), MockInputEvent(),
+               self.state_change(), MockInputEvent(), MockInputEvent() ]
+    dag = EventDag(events)
+    view = dag.input_subset([events[0], events[5]])
+    self.assertEqual(events[1], view.next_state_change(1))
+    self.assertEqual(events[3], view.next_state_change(2))
+    self.assertEqual(None, view.next_state_change(3))
+    # Same as passing in the view's events explicitly
+    for index in range(len(view.events)):
+      self.assertEqual(dag.next_state_change(index, events=view.events),
+                       view.next_state_change(index))
+
+  def test_input_events(self):
+    events = [ MockInputEvent(), self.state_change(), MockInputEvent() ]
+    events[2].prunable = False
+    dag = EventDag(events)
+    self.assertEqual([events[0]], dag.input_events)
+    # Memoized
+    self.assertTrue(dag.input_events is dag.input_events)
+    view = dag.input_complement([events[0]])
+    self.assertEqual([], view.input_events)
+
+  def test_positions(self):
+    events = [ MockInputEvent(), self.state_change(), MockInputEvent(),
+               self.state_change() ]
+    dag = EventDag(events)
+    self.assertEqual([1, 3], dag.positions(ControllerStateChange))
+    self.assertEqual([0, 2], dag.positions(MockInputEvent))
+    self.assertEqual([], dag.positions(InvariantViolation))
+    view = dag.input_subset([events[2]])
+    self.assertEqual([0, 2], view.positions(ControllerStateChange))
+  def test_happens_before(self):
+    receive = lambda dpid: ControlMessageReceive(dpid, "c1", ("ControlMessageReceive",
+                                                              "flow_mod", dpid, "c1"))
+    events = [ receive(1), receive(2), self.state_change(), receive(1),
+               MockInputEvent(), receive(2), receive(2),
+               DataplanePermit(["DataplanePermit", {}, 1, 2]) ]
+    dag = EventDag(events)
+    self.assertEqual([(), (), (), (0,), None, (), (5,), ()],
+                     [ dag.happens_before(i) for i in range(len(events)) ])
+    view = dag.input_complement([events[4]])
+    self.assertEqual([(), (), (), (0,), (1,), (4,), ()],
+                     [ view.happens_before(i) for i in range(len(view.events)) ])
+
+def legacy_replace_migration(replacee, old_location, new_location, event_list):
+  new_migration = HostMigration(old_location[0], old_location[1],
+                                new_location[0], new_location[1],
+                                host_id=replacee.host_id,
+                                time=replacee.time, label=replacee.label)
+  index = event_list.index(replacee)
+  event_list[index] = new_migration
+  return new_migration
+
+class LegacyEventDag(EventDag):
+  ''' EventDag's previous (quadratic) subsequence construction, as a
+  reference '''
+  def update_migrations(self, remaining, ignored_portion, events_list):
+    currentloc2unprunedloc = {}
+    for m in [e for e in events_list if type(e) == HostMigration]:
+      src = m.old_location
+      dst = m.new_location
+      if m in ignored_portion:
+        if src in currentloc2unprunedloc:
+          unprunedlocation = currentloc2unprunedloc[src]
+          del currentloc2unprunedloc[src]
+          currentloc2unprunedloc[dst] = unprunedlocation
+        else:
+          currentloc2unprunedloc[dst] = src
+      else:
+        if src in currentloc2unprunedloc:
+          unpruned_loc = currentloc2unprunedloc[src]
+          del currentloc2unprunedloc[src]
+          legacy_replace_migration(m, unpruned_loc, dst, remaining)
+
+  def _straighten_inserted_migrations(self, remaining_events):
+    host2migrations = migrations_per_host(remaining_events)
+    for host, migrations in host2migrations.iteritems():
+      previous_location = self._host2initial_location[host]
+      for m in migrations:
+        if m.old_location != previous_location:
+          replacement = legacy_replace_migration(m, previous_location,
+                                                 m.new_location, remaining_events)
+        else:
+          replacement = m
+        previous_location = replacement.new_location
+    return remaining_events
+
+  def insert_atomic_inputs(self, atomic_inputs, events_list=None):
+    inputs = self._expand_atomics(atomic_inputs)
+    result = []
+    for successor in events_list:
+      orig_successor_idx = self._event2idx[successor]
+      while len(inputs) > 0 and orig_successor_idx > self._event2idx[inputs[0]]:
+        result.append(inputs.pop(0))
+      result.append(successor)
+    result += inputs
+    result = self._straighten_inserted_migrations(result)
+    return EventDagView(self, result)
+
+class SubsequenceRegressionTest(unittest.TestCase):
+  def random_trace(self, rng, num_hosts=3, num_inputs=60):
+    host2location = dict((h, (h, 1)) for h in range(num_hosts))
+    trace = []
+    failed = set()
+    for _ in range(num_inputs):
+      kind = rng.random()
+      if kind < 0.4:
+        host = rng.randrange(num_hosts)
+        old_location = host2location[host]
+        new_location = (rng.randrange(1, 20), rng.randrange(1, 5))
+        host2location[host] = new_location
+        trace.append(HostMigration(old_location[0], old_location[1],
+                                   new_location[0], new_location[1], host))
+      elif kind < 0.7:
+        dpid = rng.randrange(1, 5)
+        if dpid in failed:
+          trace.append(SwitchRecovery(dpid))
+          failed.remove(dpid)
+        else:
+          trace.append(SwitchFailure(dpid))
+          failed.add(dpid)
+      elif kind < 0.85:
+        trace.append(MockInputEvent())
+      else:
+        trace.append(MockInternalEvent(("class", rng.random())))
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    return trace
+
+  def summary(self, view):
+    # Rewritten migrations are new objects, so compare their contents
+    return [ (type(e), e.label, getattr(e, "old_location", None),
+              getattr(e, "new_location", None)) for e in view.events ]
+
+  def test_same_as_legacy(self):
+    import random
+    rng = random.Random(0)
+    for _ in range(20):
+      trace = self.random_trace(rng)
+      dag = EventDag(trace)
+      dag.mark_invalid_input_sequences()
+      legacy = LegacyEventDag(trace)
+      inputs = dag.input_events
+      for _ in range(10):
+        subset = rng.sample(inputs, rng.randrange(len(inputs) + 1))
+        self.assertEqual(self.summary(legacy.input_subset(subset)),
+                         self.summary(dag.input_subset(subset)))
+        self.assertEqual(self.summary(legacy.input_complement(subset)),
+                         self.summary(dag.input_complement(subset)))
+        atomics = dag.atomic_input_events
+        (left, right) = split_list(atomics, 2)
+        self.assertEqual(self.summary(legacy.atomic_input_subset(left)),
+                         self.summary(dag.atomic_input_subset(left)))
+        legacy_view = legacy.atomic_input_subset(left).insert_atomic_inputs(right)
+        view = dag.atomic_input_subset(left).insert_atomic_inputs(right)
+        self.assertEqual(self.summary(legacy_view), self.summary(view))
+        # Events that aren't rewritten are shared, not copied
+        for (e, f) in zip(dag.events, dag.input_complement([]).events):
+          if type(e) != HostMigration:
+            self.assertTrue(e is f)
 
 if __name__ == '__main__':
   unittest.main()
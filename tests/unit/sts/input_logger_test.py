@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.input_logger import InputLogger
+from sts.replay_event import *
+from sts.syncproto.base import SyncTime
+
+class MockSyncCallback(object):
+  record_deterministic_values = False
+
+class MockControlFlow(object):
+  sync_callback = MockSyncCallback()
+  invariant_check_name = "InvariantChecker.check_correspondence"
+
+class InputLoggerTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def log_events(self, logger):
+    logger.open(self.tmpdir)
+    events = []
+    for i in xrange(100):
+      event = [SwitchFailure, SwitchRecovery][i % 2](i % 3 + 1, round=i,
+                                                     time=SyncTime(i, 0))
+      logger.log_input_event(event)
+      # Changes after logging are not logged
+      event.round = -1
+      events.append(event)
+    logger.close(MockControlFlow(), "simulation_config")
+    return events
+
+  def check_trace(self, logger, events):
+    parsed = log_parser.parse_path(logger.output_path)
+    # close() appends a WaitTime
+    self.assertEqual(len(events) + 1, len(parsed))
+    self.assertEqual([ e.label for e in events ], [ e.label for e in parsed[:-1] ])
+    self.assertEqual(range(len(events)), [ e.round for e in parsed[:-1] ])
+    self.assertEqual(WaitTime, type(parsed[-1]))
+
+  def test_background(self):
+    for binary in [False, True]:
+      logger = InputLogger(binary=binary, background=True,
+                           flush_interval_seconds=0.01)
+      events = self.log_events(logger)
+      self.check_trace(logger, events)
+      self.assertTrue(logger.output.closed)
+
+  def test_flush(self):
+    logger = InputLogger(background=True, flush_interval_seconds=60)
+    logger.open(self.tmpdir)
+    logger.log_input_event(SwitchFailure(1, round=1, time=SyncTime(1, 0)))
+    logger.flush()
+    self.assertEqual(1, len(log_parser.parse_path(logger.output_path)))
+    logger.close(MockControlFlow(), "simulation_config")
+
+  def test_after_close(self):
+    logger = InputLogger(background=True)
+    events = self.log_events(logger)
+    late = SwitchFailure(1, round=101, time=SyncTime(101, 0))
+    logger.log_input_event(late)
+    logger.dump_buffered_events([])
+    unacked = log_parser.parse_path(logger.output_path + ".unacked")
+    self.assertEqual([late.label], [ e.label for e in unacked ])
+    self.check_trace(logger, events)
+
+if __name__ == '__main__':
+  unittest.main()
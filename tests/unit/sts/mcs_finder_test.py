@@ -17,10 +17,13 @@ import unittest
 import sys
 import os
 import shutil
+import tempfile
+import xmlrpclib
 
-from sts.control_flow.mcs_finder import MCSFinder, EfficientMCSFinder
+from sts.control_flow.mcs_finder import MCSFinder, EfficientMCSFinder, ReplayCheckpoint, RuntimeStats, ReplayDeadlineEstimator
 from sts.replay_event import InputEvent, InvariantViolation
 from sts.event_dag import EventDag
+from sts.util.latency_histogram import ReplayLatencies
 import logging
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
@@ -31,9 +34,12 @@ class MockSimulationConfig(object):
 
 class MockMCSFinderBase(MCSFinder):
   ''' Overrides self.invariant_check and run_simulation_forward() '''
-  def __init__(self, event_dag, mcs):
+  def __init__(self, event_dag, mcs, num_replay_workers=1,
+               assume_monotone=False):
     super(MockMCSFinderBase, self).__init__(MockSimulationConfig(), event_dag,
-                                            invariant_check_name="InvariantChecker.check_liveness")
+                                            invariant_check_name="InvariantChecker.check_liveness",
+                                            num_replay_workers=num_replay_workers,
+                                            assume_monotone=assume_monotone)
     # Hack! Give a fake name in config.invariant_checks.name_to_invariant_checks, but
     # but remove it from our dict directly after. This is to prevent
     # sanity check exceptions from being thrown.
@@ -52,21 +58,80 @@ class MockMCSFinderBase(MCSFinder):
         return []
     return ["violation"]
 
-  def replay(self, new_dag, hook=None, ignore_runtime_stats=False):
+  def replay(self, new_dag, hook=None, ignore_runtime_stats=False, attempt=0):
     self.new_dag = new_dag
     return self.invariant_check(new_dag)
 
+  def _fork_replay_child(self, new_dag, label, task_name):
+    # Invoked concurrently by parallel replay workers, so don't touch
+    # self.new_dag
+    violation = all(e in new_dag._events_set for e in self.mcs)
+    return (violation, {}, [])
+
 # Horrible horrible hack. This way lies insanity
 class MockMCSFinder(MockMCSFinderBase, MCSFinder):
-  def __init__(self, event_dag, mcs):
-    MockMCSFinderBase.__init__(self, event_dag, mcs)
+  def __init__(self, event_dag, mcs, num_replay_workers=1,
+               assume_monotone=False):
+    MockMCSFinderBase.__init__(self, event_dag, mcs,
+                               num_replay_workers=num_replay_workers,
+                               assume_monotone=assume_monotone)
     self._log = logging.getLogger("mock_mcs_finder")
 
 class MockEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
-  def __init__(self, event_dag, mcs):
-    MockMCSFinderBase.__init__(self, event_dag, mcs)
+  def __init__(self, event_dag, mcs, num_replay_workers=1,
+               assume_monotone=False):
+    MockMCSFinderBase.__init__(self, event_dag, mcs,
+                               num_replay_workers=num_replay_workers,
+                               assume_monotone=assume_monotone)
     self._log = logging.getLogger("mock_efficient_mcs_finder")
 
+class SimulatedCrash(Exception):
+  pass
+
+class CheckpointedMockMCSFinder(MockMCSFinder):
+  ''' Replays through MCSFinder.replay() (and hence the checkpoint), and
+  "crashes" after crash_after replays have been forked '''
+  replay = MCSFinder.replay
+
+  def __init__(self, event_dag, mcs, crash_after=None):
+    MockMCSFinder.__init__(self, event_dag, mcs)
+    self.crash_after = crash_after
+    self.num_forked = 0
+
+  def _fork_replay_child(self, new_dag, label, task_name):
+    if self.num_forked == self.crash_after:
+      raise SimulatedCrash()
+    self.num_forked += 1
+    return MockMCSFinder._fork_replay_child(self, new_dag, label, task_name)
+
+class DeadlineMockMCSFinder(MockMCSFinder):
+  ''' Violating replays take violation_seconds, and all others run until
+  they are cut off by the deadline (if any) '''
+  replay = MCSFinder.replay
+
+  def __init__(self, event_dag, mcs, violation_seconds):
+    MockMCSFinder.__init__(self, event_dag, mcs)
+    self.deadline_estimator = ReplayDeadlineEstimator(margin=0.5)
+    self.violation_seconds = violation_seconds
+    self.deadlines = []
+    self.num_cut_off = 0
+
+  def _fork_replay_child(self, new_dag, label, task_name):
+    self.subsequence_id += 1
+    deadline = self._replay_deadline()
+    self.deadlines.append(deadline)
+    child_stats = RuntimeStats(self.subsequence_id)
+    (violation, _, timed_out) = MockMCSFinder._fork_replay_child(self, new_dag,
+                                                                 label, task_name)
+    if violation:
+      child_stats.record_replay_timing(self.violation_seconds, None, label)
+    elif deadline is not None:
+      self.num_cut_off += 1
+      cutoff = { "deadline_seconds" : deadline, "elapsed_seconds" : deadline,
+                 "events_skipped" : 1 }
+      child_stats.record_replay_timing(None, cutoff, label)
+    return (violation, child_stats.client_dict(), timed_out)
+
 class MockInputEvent(InputEvent):
   def __init__(self, fingerprint=None, **kws):
     super(MockInputEvent, self).__init__(**kws)
@@ -143,5 +208,207 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_parallel(self):
+    self.parallel(MockMCSFinder)
+
+  def test_parallel_efficient(self):
+    self.parallel(MockEfficientMCSFinder)
+
+  def parallel(self, mcs_finder_type):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs = [trace[1],trace[6]]
+    mcs_finder = mcs_finder_type(dag, mcs, num_replay_workers=4)
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+    self.assertTrue(len(mcs_finder._runtime_stats.replay_queue_wait_seconds) > 0)
+
+  def test_monotone(self):
+    self.monotone(MockMCSFinder, 1)
+
+  def test_monotone_efficient(self):
+    self.monotone(MockEfficientMCSFinder, 1)
+
+  def test_monotone_parallel(self):
+    self.monotone(MockMCSFinder, 4)
+
+  def test_monotone_parallel_efficient(self):
+    self.monotone(MockEfficientMCSFinder, 4)
+
+  def monotone(self, mcs_finder_type, num_replay_workers):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,17) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[2],trace[9],trace[13]]
+    mcs_finder = mcs_finder_type(EventDag(trace), mcs,
+                                 num_replay_workers=num_replay_workers,
+                                 assume_monotone=True)
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+    if mcs_finder_type == MockMCSFinder:
+      # ddmin revisits subsets of complements that did not violate
+      self.assertTrue(mcs_finder._runtime_stats.replays_skipped_by_monotonicity > 0)
+
+  def test_resume(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,17) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[2],trace[9],trace[13]]
+    # An uninterrupted run, for reference
+    reference = CheckpointedMockMCSFinder(EventDag(trace), mcs)
+    try:
+      os.makedirs(mcs_results_path)
+      reference.init_results(mcs_results_path)
+      reference.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    total_replays = reference.num_forked
+    crash_after = total_replays / 2
+
+    crashed = CheckpointedMockMCSFinder(EventDag(trace), mcs,
+                                        crash_after=crash_after)
+    resumed = CheckpointedMockMCSFinder(EventDag(trace), mcs)
+    resumed.resume_from_checkpoint = True
+    try:
+      os.makedirs(mcs_results_path)
+      crashed.init_results(mcs_results_path)
+      self.assertRaises(SimulatedCrash, crashed.simulate)
+      crashed.checkpoint.close()
+      resumed.init_results(mcs_results_path)
+      resumed.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, resumed.dag.input_events)
+    # No completed replay is redone
+    self.assertEqual(total_replays - crash_after, resumed.num_forked)
+    self.assertEqual(crash_after,
+                     resumed._runtime_stats.replays_restored_from_checkpoint)
+    self.assertEqual(reference._runtime_stats.total_replays,
+                     resumed._runtime_stats.total_replays)
+
+  def test_adaptive_deadline(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[2],trace[5]]
+    mcs_finder = DeadlineMockMCSFinder(EventDag(trace), mcs, 2.0)
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+    # The reproducibility run has no deadline; all later runs are cut off
+    # 50% after the time it took to find the violation
+    self.assertEqual(None, mcs_finder.deadlines[0])
+    self.assertEqual(set([3.0]), set(mcs_finder.deadlines[1:]))
+    runtime_stats = mcs_finder._runtime_stats
+    self.assertTrue(len(runtime_stats.seconds_until_violation) > 0)
+    # Every cutoff is accounted for
+    self.assertTrue(mcs_finder.num_cut_off > 0)
+    self.assertEqual(mcs_finder.num_cut_off, len(runtime_stats.early_cutoffs))
+    for cutoff in runtime_stats.early_cutoffs.values():
+      self.assertEqual(3.0, cutoff["deadline_seconds"])
+
+class ReplayDeadlineEstimatorTest(unittest.TestCase):
+  def test_deadline(self):
+    estimator = ReplayDeadlineEstimator(margin=1.0, min_samples=2)
+    estimator.record(1.5)
+    self.assertEqual(None, estimator.deadline())
+    estimator.record(1.0)
+    self.assertEqual(3.0, estimator.deadline())
+    estimator.record(2.5)
+    self.assertEqual(5.0, estimator.deadline())
+
+  def test_negative_margin(self):
+    self.assertRaises(ValueError, ReplayDeadlineEstimator, -0.5)
+
+class RuntimeStatsTest(unittest.TestCase):
+  def test_merge_grouped_events(self):
+    child = RuntimeStats(3)
+    child.record_new_internal_events(["lldp", "flow_mod", "lldp", "lldp"])
+    child.record_buffered_message_receipts([])
+    client_dict = child.client_dict()
+    self.assertEqual({"3" : [["lldp", 3], ["flow_mod", 1]]},
+                     client_dict["new_internal_events"])
+    parent = RuntimeStats(0)
+    parent.merge_client_dict(client_dict)
+    self.assertEqual({"3" : ["lldp", "lldp", "lldp", "flow_mod"]},
+                     parent.new_internal_events)
+    self.assertEqual({"3" : []}, parent.buffered_message_receipts)
+    child = RuntimeStats(4)
+    child.record_new_internal_events(["lldp"])
+    parent.merge_client_dict(child.client_dict())
+    self.assertEqual({"lldp" : 4, "flow_mod" : 1},
+                     dict(parent.new_internal_event_counts))
+
+  def test_merge_replay_latencies(self):
+    parent = RuntimeStats(0)
+    for subsequence_id in [1, 2]:
+      child = RuntimeStats(subsequence_id)
+      latencies = ReplayLatencies()
+      latencies.record_phase("bootstrap", 2.0 * subsequence_id)
+      latencies.record_event(MockInputEvent(), 0.5)
+      child.record_replay_latencies(latencies.to_dict())
+      client_dict = child.client_dict()
+      # Must survive the trip back from the forked child
+      xmlrpclib.dumps((client_dict,), methodresponse=True)
+      parent.merge_client_dict(client_dict)
+    self.assertEqual(["1", "2"], sorted(parent.replay_latencies.keys()))
+    totals = ReplayLatencies.from_dict(parent.replay_latency_totals)
+    self.assertEqual(2, totals.phases["bootstrap"].count)
+    self.assertEqual(4.0, totals.phases["bootstrap"].max_seconds)
+    self.assertEqual(1.0, totals.events["MockInputEvent"].total_seconds)
+
+class ReplayCheckpointTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "mcs_checkpoint.json")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_resume(self):
+    checkpoint = ReplayCheckpoint(self.path, "run")
+    checkpoint.put("a", (True, {}, ["e1"]))
+    checkpoint.put("a", (False, {}, []))
+    checkpoint.close()
+    # A crash in the middle of writing an entry
+    with open(self.path, "a") as journal:
+      journal.write('{"key": "b", "res')
+    checkpoint = ReplayCheckpoint(self.path, "run", resume=True)
+    self.assertEqual(2, checkpoint.num_loaded)
+    self.assertEqual((True, {}, ["e1"]), checkpoint.get("a"))
+    self.assertEqual((False, {}, []), checkpoint.get("a"))
+    self.assertEqual(None, checkpoint.get("a"))
+    self.assertEqual(None, checkpoint.get("b"))
+    checkpoint.put("b", (True, {}, []))
+    checkpoint.close()
+    checkpoint = ReplayCheckpoint(self.path, "run", resume=True)
+    self.assertEqual(3, checkpoint.num_loaded)
+    checkpoint.close()
+
+  def test_other_run(self):
+    ReplayCheckpoint(self.path, "run").close()
+    self.assertRaises(ValueError, ReplayCheckpoint, self.path, "other run",
+                      resume=True)
+
+  def test_no_resume(self):
+    checkpoint = ReplayCheckpoint(self.path, "run")
+    checkpoint.put("a", (True, {}, []))
+    checkpoint.close()
+    checkpoint = ReplayCheckpoint(self.path, "run")
+    self.assertEqual(None, checkpoint.get("a"))
+    checkpoint.close()
+
 if __name__ == '__main__':
   unittest.main()
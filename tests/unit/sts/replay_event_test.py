@@ -0,0 +1,172 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import copy
+import json
+import pickle
+from StringIO import StringIO
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.replay_event import *
+from sts.input_traces import log_parser
+from sts.syncproto.base import SyncTime
+from sts.util.convenience import base64_encode, is_flow_mod
+from pox.openflow.libopenflow_01 import ofp_flow_mod, ofp_echo_request
+
+dp_fingerprint = { 'dl_src' : "00:00:00:00:00:01", 'dl_dst' : "00:00:00:00:00:02",
+                   'nw_src' : "10.0.0.1", 'nw_dst' : "10.0.0.2" }
+
+def sample_events():
+  t = SyncTime(5, 6)
+  return [ SwitchFailure(1, round=1, time=t),
+           LinkFailure(1, 2, 3, 4, time=t),
+           WaitTime(2.5, time=t),
+           DataplaneDrop(["DataplaneDrop", dict(dp_fingerprint), 1, 2], time=t),
+           LinkDiscovery("c1", [1, 2], time=t),
+           ControlMessageReceive(1, "c1", { 'class' : "ofp_echo_request" },
+                                 b64_packet="AQIACAAAAAA=", time=t),
+           ControlMessageSend(1, "c1", { 'class' : "ofp_packet_in", 'in_port' : 1,
+                                         'data' : dict(dp_fingerprint) },
+                              b64_packet="AQoAEgAAAAA=", time=t,
+                              timeout_disallowed=True),
+           ControllerStateChange("c1", "fmt %s", "fmt %s", ["v"], time=t),
+           DeterministicValue("c1", "gettimeofday", [1, 2], time=t),
+           DataplanePermit(["DataplanePermit", dict(dp_fingerprint), 1, 2], time=t),
+           InvariantViolation(["violation"], time=t) ]
+
+class MockInputEvent(InputEvent):
+  ''' Subclasses that don't define __slots__ get a __dict__ '''
+  def __init__(self, **kws):
+    super(MockInputEvent, self).__init__(**kws)
+    self.extra = "extra"
+
+  def proceed(self, simulation):
+    return True
+
+class EventRepresentationTest(unittest.TestCase):
+  def test_no_dict(self):
+    for event in sample_events():
+      self.assertFalse(hasattr(event, '__dict__'), type(event).__name__)
+    self.assertFalse(hasattr(sample_events()[3].fingerprint[1], '__dict__'))
+    # (namedtuples have a __dict__ property)
+    self.assertRaises(AttributeError, setattr, SyncTime(1, 2), 'x', 1)
+
+  def test_json_round_trip(self):
+    for event in sample_events():
+      json_hash = json.loads(event.to_json())
+      self.assertEqual(type(event).__name__, json_hash['class'])
+      self.assertFalse('_fingerprint' in json_hash)
+      parsed = type(event).from_json(json_hash)
+      self.assertEqual(event.label, parsed.label)
+      # (The fingerprints of ControlMessages and ControllerStateChanges
+      # change shape when they are parsed)
+      if not isinstance(event, (ControlMessageBase, ControllerStateChange)):
+        self.assertEqual(event.fingerprint, parsed.fingerprint)
+        self.assertEqual(json_hash, json.loads(parsed.to_json()))
+
+  def test_attributes_set_later(self):
+    event = SwitchFailure(1)
+    self.assertFalse('timeout_disallowed' in json.loads(event.to_json()))
+    event.replay_time = SyncTime(7, 8)
+    event.timeout_disallowed = True
+    json_hash = json.loads(event.to_json())
+    self.assertEqual([7, 8], json_hash['replay_time'])
+    self.assertTrue(json_hash['timeout_disallowed'])
+    receive = sample_events()[5]
+    receive._packet = object()
+    self.assertFalse('_packet' in json.loads(receive.to_json()))
+
+  def test_subclass_without_slots(self):
+    event = MockInputEvent()
+    json_hash = json.loads(event.to_json())
+    self.assertEqual("extra", json_hash['extra'])
+    self.assertEqual(event.label, json_hash['label'])
+
+  def test_label_hashing(self):
+    event = SwitchFailure(1)
+    same = SwitchFailure.from_json(json.loads(event.to_json()))
+    self.assertEqual(event, same)
+    self.assertEqual(hash(event), hash(same))
+    self.assertEqual(1, len(set([event, same])))
+    self.assertNotEqual(event, SwitchFailure(1))
+
+  def test_copy(self):
+    for event in sample_events():
+      for clone in [copy.deepcopy(event), pickle.loads(pickle.dumps(event)),
+                    pickle.loads(pickle.dumps(event, 2))]:
+        self.assertEqual(event, clone)
+        self.assertEqual(json.loads(event.to_json()), json.loads(clone.to_json()))
+
+class PacketMemoizationTest(unittest.TestCase):
+  echo_request = "AQIACAAAAAA="
+  flow_mod = base64_encode(ofp_flow_mod(xid=3))
+
+  def receive(self, b64_packet):
+    return ControlMessageReceive(1, "c1", { 'class' : "ofp_echo_request" },
+                                 b64_packet=b64_packet, time=SyncTime(5, 6))
+
+  def test_decoded_once(self):
+    event = self.receive(self.echo_request)
+    packet = event.get_packet()
+    self.assertEqual(ofp_echo_request, type(packet))
+    self.assertTrue(packet is event.get_packet())
+    # Serializing the event neither drops nor writes out the decoded packet
+    self.assertFalse('_packet' in json.loads(event.to_json()))
+    self.assertTrue(packet is event.get_packet())
+    self.assertFalse(self.receive(self.echo_request).is_flow_mod())
+
+  def test_invalidated_on_payload_change(self):
+    event = self.receive(self.echo_request)
+    event.get_packet()
+    event.b64_packet = self.flow_mod
+    self.assertEqual(ofp_flow_mod, type(event.get_packet()))
+    self.assertEqual(3, event.get_packet().xid)
+    self.assertTrue(event.is_flow_mod())
+    self.assertTrue(is_flow_mod(event))
+
+  def test_copy_does_not_share_packet(self):
+    event = self.receive(self.flow_mod)
+    packet = event.get_packet()
+    for clone in [copy.deepcopy(event), pickle.loads(pickle.dumps(event))]:
+      self.assertFalse(packet is clone.get_packet())
+      self.assertEqual(packet.xid, clone.get_packet().xid)
+
+class LogParserTest(unittest.TestCase):
+  def test_parse(self):
+    events = sample_events()
+    superlog = StringIO("\n".join(e.to_json() for e in events))
+    parsed = log_parser.parse(superlog)
+    self.assertEqual(events, parsed)
+    for event, parsed_event in zip(events, parsed):
+      expected = type(event).from_json(json.loads(event.to_json()))
+      self.assertEqual(json.loads(expected.to_json()),
+                       json.loads(parsed_event.to_json()))
+    # Strings are shared between events
+    self.assertTrue(parsed[5].controller_id is parsed[6].controller_id)
+    self.assertEqual(str, type(parsed[5].b64_packet))
+
+  def test_compact_strings(self):
+    value = json.loads('{"a" : ["b", "c\\u00e9", {"d" : 1}], "e" : null}')
+    compacted = log_parser.compact_strings(value)
+    self.assertEqual(value, compacted)
+    self.assertEqual(str, type(compacted.keys()[0]))
+    self.assertEqual(str, type(compacted["a"][0]))
+    self.assertEqual(unicode, type(compacted["a"][1]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,57 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+from sts.topology import MeshTopology, BufferedPatchPanel
+from sts.simulation_state import SimulationConfig
+from sts.controller_manager import ControllerManager
+from sts.util.rpc_forker import PipeForker
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+def boot_no_controllers(controller_configs, snapshot_service,
+                        sync_connection_manager, multiplex_sockets=False):
+  return ControllerManager([])
+
+class SimulationConfigTest(unittest.TestCase):
+  def test_prebootstrap(self):
+    simulation_cfg = SimulationConfig([], MeshTopology, "num_switches=2",
+                                      BufferedPatchPanel)
+    template = simulation_cfg.prebootstrap()
+    self.assertEqual(2, len(template.topology.switches))
+
+    def bootstrap_twice():
+      # N.B. run in a fork()ed child
+      results = []
+      for _ in range(2):
+        simulation = simulation_cfg.bootstrap(boot_controllers=boot_no_controllers)
+        results.append((simulation.topology is template.topology,
+                        simulation.bootstrap_seconds_saved))
+        simulation.clean_up()
+      return results
+
+    forker = PipeForker()
+    forker.register_task("bootstrap_twice", bootstrap_twice)
+    # Only the first bootstrap in each child gets the template
+    expected = [[True, template.build_seconds], [False, 0]]
+    self.assertEqual(expected, forker.fork("bootstrap_twice"))
+    self.assertEqual(expected, forker.fork("bootstrap_twice"))
+    # ... and the process that built it never uses it
+    self.assertEqual(None, simulation_cfg._take_bootstrap_template())
+
+if __name__ == '__main__':
+  unittest.main()
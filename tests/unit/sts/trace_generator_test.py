@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.dataplane_traces.trace import StreamingTrace
+from sts.dataplane_traces.trace_generator import generate_example_trace_fat_tree
+
+class FatTreeTraceTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def generate(self, name, **kws):
+    path = os.path.join(self.tmpdir, name)
+    generate_example_trace_fat_tree(num_pods=4, rounds=7, tracefile_path=path, **kws)
+    with open(path, 'rb') as tracefile:
+      return (path, tracefile.read())
+
+  def test_sharded_identical(self):
+    (path, single) = self.generate("single", seed=3)
+    for processes in [2, 3, 8]:
+      (_, sharded) = self.generate("sharded%d" % processes, seed=3,
+                                   processes=processes)
+      self.assertEqual(single, sharded)
+    # Shards are cleaned up
+    self.assertEqual([], [ f for f in os.listdir(self.tmpdir) if ".shard" in f ])
+    (_, other_seed) = self.generate("other_seed", seed=4)
+    self.assertNotEqual(single, other_seed)
+
+  def test_trace(self):
+    (path, _) = self.generate("trace", seed=3)
+    events = list(StreamingTrace(path))
+    # A FatTree with 4 pods has 16 hosts
+    self.assertEqual(7 * 16, len(events))
+    for dp_event in events:
+      self.assertNotEqual(dp_event.packet.src, dp_event.packet.dst)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+import sts.util.background_writer as background_writer
+from sts.util.background_writer import BackgroundWriter
+
+class BackgroundWriterTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "output")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def contents(self):
+    with open(self.path) as output:
+      return output.read()
+
+  def test_ordered(self):
+    for durability in background_writer.DURABILITIES:
+      writer = BackgroundWriter(open(self.path, 'w'), encode=lambda i: "%d\n" % i,
+                                flush_interval_seconds=0.01, durability=durability)
+      for i in xrange(5000):
+        writer.write(i)
+      writer.close()
+      self.assertTrue(writer.closed)
+      self.assertEqual("".join("%d\n" % i for i in xrange(5000)), self.contents())
+      self.assertRaises(ValueError, writer.write, 0)
+
+  def test_flush(self):
+    writer = BackgroundWriter(open(self.path, 'w'), flush_interval_seconds=60)
+    writer.write("a")
+    writer.flush()
+    self.assertEqual("a", self.contents())
+    writer.close()
+
+  def test_flush_interval(self):
+    writer = BackgroundWriter(open(self.path, 'w'), flush_interval_seconds=0.05)
+    writer.write("a")
+    deadline = time.time() + 5
+    while self.contents() != "a" and time.time() < deadline:
+      time.sleep(0.01)
+    self.assertEqual("a", self.contents())
+    writer.close()
+
+  def test_encode_error(self):
+    def encode(item):
+      if item == 2:
+        raise ValueError("cannot encode")
+      return str(item)
+    writer = BackgroundWriter(open(self.path, 'w'), encode=encode)
+    for i in xrange(5):
+      writer.write(i)
+    self.assertRaises(ValueError, writer.close)
+    # Nothing is written after the failed item
+    self.assertEqual("01", self.contents())
+
+  def test_closed_at_exit(self):
+    # The interpreter exits with events still queued, and without close()
+    script = ("import sys\n"
+              "sys.path.append(%r)\n"
+              "from sts.util.background_writer import BackgroundWriter\n"
+              "writer = BackgroundWriter(open(%r, 'w'), encode=lambda i: '%%d\\n' %% i,\n"
+              "                          flush_interval_seconds=60)\n"
+              "for i in xrange(10000):\n"
+              "  writer.write(i)\n"
+              "raise KeyboardInterrupt()\n" %
+              (os.path.abspath(os.path.dirname(__file__) + "/../../../.."), self.path))
+    with open(os.devnull, 'w') as devnull:
+      self.assertNotEqual(0, subprocess.call([sys.executable, "-c", script],
+                                             stderr=devnull))
+    self.assertEqual("".join("%d\n" % i for i in xrange(10000)), self.contents())
+
+if __name__ == '__main__':
+  unittest.main()
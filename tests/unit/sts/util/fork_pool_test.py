@@ -0,0 +1,62 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.fork_pool import ForkPool
+
+class fork_pool_test(unittest.TestCase):
+
+  def test_order(self):
+    pool = ForkPool(3)
+    # Later jobs finish first
+    jobs = [ (lambda i: lambda worker_id: (time.sleep(0.01 * (5-i)), i)[1])(i)
+             for i in range(5) ]
+    results = pool.map(jobs)
+    self.assertEqual(range(5), [ r.value for r in results ])
+    for r in results:
+      self.assertTrue(0 <= r.worker_id < 3)
+      self.assertTrue(r.queue_wait_seconds >= 0)
+
+  def test_concurrent(self):
+    pool = ForkPool(4)
+    arrived = threading.Condition()
+    self.count = 0
+    def job(worker_id):
+      # Times out unless all 4 jobs run at the same time
+      with arrived:
+        self.count += 1
+        arrived.notify_all()
+        deadline = time.time() + 5
+        while self.count < 4 and time.time() < deadline:
+          arrived.wait(0.1)
+        self.assertEqual(4, self.count)
+      return worker_id
+    results = pool.map([job] * 4)
+    self.assertEqual(set(range(4)), set(r.value for r in results))
+
+  def test_exception(self):
+    pool = ForkPool(2)
+    def bad(worker_id):
+      raise ValueError("bad")
+    self.assertRaises(ValueError, pool.map, [lambda w: 1, bad])
+
+  def test_empty(self):
+    self.assertEqual([], ForkPool(2).map([]))
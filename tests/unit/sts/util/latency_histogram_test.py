@@ -0,0 +1,80 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import json
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.latency_histogram import LatencyHistogram, ReplayLatencies
+
+class MockEvent(object):
+  pass
+
+class LatencyHistogramTest(unittest.TestCase):
+  def test_buckets(self):
+    for seconds in [0.0, 5e-7, 1e-6, 3e-6, 0.001, 0.5, 2.0, 3600.0]:
+      (lower, upper) = LatencyHistogram.bucket_bounds(LatencyHistogram.bucket(seconds))
+      self.assertTrue(lower <= seconds < upper)
+
+  def test_percentiles(self):
+    histogram = LatencyHistogram()
+    for _ in range(90):
+      histogram.record(0.001)
+    for _ in range(10):
+      histogram.record(1.0)
+    self.assertEqual(100, histogram.count)
+    self.assertAlmostEqual(0.1009, histogram.mean_seconds())
+    self.assertTrue(0.001 <= histogram.percentile_seconds(50) < 0.002)
+    self.assertTrue(0.001 <= histogram.percentile_seconds(90) < 0.002)
+    self.assertEqual(1.0, histogram.percentile_seconds(99))
+    self.assertEqual(1.0, histogram.max_seconds)
+
+  def test_merge_same_as_recording_together(self):
+    rng = random.Random(0)
+    samples = [ rng.expovariate(100) for _ in range(1000) ]
+    together = LatencyHistogram()
+    left = LatencyHistogram()
+    right = LatencyHistogram()
+    for i, seconds in enumerate(samples):
+      together.record(seconds)
+      (left if i % 3 == 0 else right).record(seconds)
+    left.merge(right)
+    self.assertEqual(together.buckets, left.buckets)
+    self.assertEqual(together.count, left.count)
+    self.assertAlmostEqual(together.total_seconds, left.total_seconds)
+    self.assertEqual(together.max_seconds, left.max_seconds)
+
+class ReplayLatenciesTest(unittest.TestCase):
+  def test_serialization(self):
+    latencies = ReplayLatencies()
+    latencies.record_event(MockEvent(), 0.01)
+    latencies.record_event(MockEvent(), 0.02)
+    latencies.record_phase("bootstrap", 3.0)
+    d = json.loads(json.dumps(latencies.to_dict()))
+    restored = ReplayLatencies.from_dict(d)
+    self.assertEqual(["MockEvent"], restored.events.keys())
+    self.assertEqual(2, restored.events["MockEvent"].count)
+    self.assertEqual(latencies.events["MockEvent"].buckets,
+                     restored.events["MockEvent"].buckets)
+    self.assertEqual(3.0, restored.phases["bootstrap"].max_seconds)
+    restored.merge(latencies)
+    self.assertEqual(4, restored.events["MockEvent"].count)
+    self.assertEqual(2, restored.phases["bootstrap"].count)
+
+if __name__ == '__main__':
+  unittest.main()
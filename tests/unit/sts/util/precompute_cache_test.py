@@ -16,6 +16,8 @@
 import unittest
 import sys
 import os.path
+import shutil
+import tempfile
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -56,3 +58,41 @@ class precompute_cache_test(unittest.TestCase):
     self.assertTrue(p.already_done( (4,)))
     self.assertFalse(p.already_done( (1,2,3,4)))
 
+  def test_monotone(self):
+    m = MonotoneOutcomeIndex()
+    self.assertEqual(None, m.implied_outcome( (1,2,3) ))
+    m.update( (1,2), True )
+    self.assertEqual(True, m.implied_outcome( (1,2) ))
+    self.assertEqual(True, m.implied_outcome( (3,2,1) ))
+    self.assertEqual(None, m.implied_outcome( (1,3) ))
+    m.update( (3,4,5), False )
+    self.assertEqual(False, m.implied_outcome( (3,5) ))
+    self.assertEqual(False, m.implied_outcome( (4,) ))
+    self.assertEqual(False, m.implied_outcome( () ))
+    self.assertEqual(None, m.implied_outcome( (4,6) ))
+    # Violations take precedence
+    self.assertEqual(True, m.implied_outcome( (1,2,3,4,5) ))
+    m.update( (6,), True )
+    self.assertEqual(True, m.implied_outcome( (4,6) ))
+
+  def test_replay_outcome(self):
+    cache_dir = tempfile.mkdtemp()
+    try:
+      c = ReplayOutcomeCache(os.path.join(cache_dir, "cache"))
+      k1 = ReplayOutcomeCache.make_key([("e1", ("SwitchFailure", 1))], "cfg", 0)
+      k2 = ReplayOutcomeCache.make_key([("e1", ("SwitchFailure", 1))], "cfg", 1)
+      self.assertNotEqual(k1, k2)
+      self.assertEqual(k1, ReplayOutcomeCache.make_key([("e1", ("SwitchFailure", 1))], "cfg", 0))
+      self.assertEqual(None, c.get(k1))
+      c.put(k1, True, ["i3", "i4"])
+      self.assertEqual((True, ["i3", "i4"]), c.get(k1))
+      self.assertFalse(k2 in c)
+      # Entries survive across cache instances (i.e. across MCS runs)
+      c2 = ReplayOutcomeCache(os.path.join(cache_dir, "cache"))
+      self.assertEqual((True, ["i3", "i4"]), c2.get(k1))
+      c2.put(k1, False, [])
+      self.assertEqual((False, []), c.get(k1))
+      # No temporary files are left behind
+      self.assertEqual([k1 + ".json"], os.listdir(os.path.join(cache_dir, "cache")))
+    finally:
+      shutil.rmtree(cache_dir)
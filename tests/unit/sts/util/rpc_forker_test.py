@@ -0,0 +1,168 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import signal
+import shutil
+import tempfile
+import time
+import xmlrpclib
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.rpc_forker import *
+from sts.util.fork_pool import ForkPool
+
+# Tasks run by the daemons. N.B. tasks must live at module level.
+def add(x, y):
+  return x + y
+
+def sleep_for(seconds):
+  time.sleep(seconds)
+  return seconds
+
+def kill_daemon_once(marker_path):
+  if os.path.exists(marker_path):
+    return "survived"
+  open(marker_path, "w").close()
+  # Our parent is the daemon
+  os.kill(os.getppid(), signal.SIGKILL)
+  os._exit(1)
+
+def nested_result(x):
+  return (x, {"a" : (1, 2.5, None), "b" : [ "c", True ]})
+
+def raise_value_error():
+  raise ValueError("child failure")
+
+def exit_without_result():
+  os._exit(1)
+
+class PipeForkerTest(unittest.TestCase):
+  def test_fork(self):
+    forker = PipeForker()
+    forker.register_task("add", add)
+    self.assertEqual(3, forker.fork("add", 1, 2))
+
+  def test_same_as_xmlrpc(self):
+    # LocalForker results go through an XML-RPC response
+    forker = PipeForker()
+    forker.register_task("nested_result", nested_result)
+    response = xmlrpclib.dumps((nested_result(1),), methodresponse=True,
+                               allow_none=True)
+    self.assertEqual(xmlrpclib.loads(response)[0][0],
+                     forker.fork("nested_result", 1))
+
+  def test_unregistered(self):
+    self.assertRaises(ValueError, PipeForker().fork, "add", 1, 2)
+
+  def test_exception(self):
+    forker = PipeForker()
+    forker.register_task("raise_value_error", raise_value_error)
+    self.assertRaises(ReplayException, forker.fork, "raise_value_error")
+
+  def test_no_result(self):
+    forker = PipeForker()
+    forker.register_task("exit_without_result", exit_without_result)
+    self.assertRaises(ReplayException, forker.fork, "exit_without_result")
+
+  def test_concurrent(self):
+    forker = PipeForker()
+    forker.register_task("sleep_for", sleep_for)
+    results = ForkPool(4).map([ lambda worker_id: forker.fork("sleep_for", 0.2) ] * 4)
+    self.assertEqual([0.2] * 4, [ r.value for r in results ])
+
+class RemoteForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.daemon_pids = []
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    for pid in self.daemon_pids:
+      try:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+      except OSError:
+        pass
+    shutil.rmtree(self.tmp_dir)
+
+  def start_daemons(self, num_daemons):
+    ''' Start num_daemons ForkerDaemons on loopback ports, and return their
+    (ip, port) tuples '''
+    server_info_list = []
+    for _ in range(num_daemons):
+      # Bind in the parent, so that the port is known (and accepting
+      # connections) before the child starts serving.
+      daemon = ForkerDaemon('localhost', 0)
+      pid = os.fork()
+      if pid == 0:
+        try:
+          daemon.serve_forever()
+        finally:
+          os._exit(0)
+      daemon.server.server_close()
+      self.daemon_pids.append(pid)
+      server_info_list.append(daemon.server.server_address)
+    return server_info_list
+
+  def test_fork(self):
+    forker = RemoteForker(self.start_daemons(2))
+    forker.register_task("add", add)
+    for i in range(4):
+      self.assertEqual(i + 1, forker.fork("add", i, 1))
+
+  def test_unregistered(self):
+    forker = RemoteForker(self.start_daemons(1))
+    self.assertRaises(ValueError, forker.fork, "add", 1, 2)
+
+  def test_closure(self):
+    forker = RemoteForker(self.start_daemons(1))
+    y = 1
+    def add_y(x):
+      return x + y
+    self.assertRaises(ValueError, forker.register_task, "add_y", add_y)
+
+  def test_concurrent(self):
+    forker = RemoteForker(self.start_daemons(2))
+    forker.register_task("sleep_for", sleep_for)
+    results = ForkPool(4).map([ lambda worker_id: forker.fork("sleep_for", 0.2) ] * 4)
+    self.assertEqual([0.2] * 4, [ r.value for r in results ])
+
+  def test_timeout(self):
+    forker = RemoteForker(self.start_daemons(1), job_timeout=0.5)
+    forker.register_task("sleep_for", sleep_for)
+    forker.register_task("add", add)
+    self.assertRaises(JobTimeout, forker.fork, "sleep_for", 30)
+    # The daemon is still usable afterwards
+    self.assertEqual(3, forker.fork("add", 1, 2))
+
+  def test_daemon_dies(self):
+    forker = RemoteForker(self.start_daemons(2))
+    forker.register_task("kill_daemon_once", kill_daemon_once)
+    marker_path = os.path.join(self.tmp_dir, "killed")
+    self.assertEqual("survived", forker.fork("kill_daemon_once", marker_path))
+    self.assertEqual(1, len([ s for s in forker.servers if s.dead ]))
+
+  def test_all_daemons_dead(self):
+    forker = RemoteForker(self.start_daemons(1))
+    forker.register_task("add", add)
+    self.assertEqual(3, forker.fork("add", 1, 2))
+    os.kill(self.daemon_pids[0], signal.SIGKILL)
+    os.waitpid(self.daemon_pids[0], 0)
+    self.assertRaises(ReplayException, forker.fork, "add", 1, 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import time
+import types
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.virtual_clock import VirtualClock
+
+class MockSource(object):
+  ''' Just enough of an EventMixin to be watched '''
+  def __init__(self):
+    self.listeners = []
+
+  def addListener(self, event_type, handler):
+    self.listeners.append(handler)
+
+  def raiseEvent(self, event):
+    for handler in self.listeners:
+      handler(event)
+
+class MockFlowTable(object):
+  def __init__(self, expiry_times):
+    self.expiry_times = list(expiry_times)
+    self.expired = []
+
+  def remove_expired_entries(self, now):
+    for t in sorted(self.expiry_times):
+      if t <= now:
+        self.expiry_times.remove(t)
+        self.expired.append((t, now))
+
+class VirtualClockTest(unittest.TestCase):
+  def setUp(self):
+    self.selects = []
+    self.clock = VirtualClock(self.selects.append)
+
+  def test_skip_when_quiet(self):
+    start = time.time()
+    virtual_start = self.clock.time()
+    self.clock.sleep(3600)
+    self.assertTrue(time.time() - start < 60)
+    self.assertTrue(self.clock.time() - virtual_start >= 3600)
+    self.assertTrue(self.clock.seconds_skipped > 3599)
+    self.assertEqual(1, len(self.selects))
+
+  def test_timeouts_fire_in_order(self):
+    now = self.clock.time()
+    tables = [ MockFlowTable([now + 30, now + 10]), MockFlowTable([now + 20]) ]
+    for table in tables:
+      self.clock.add_tick_listener(table.remove_expired_entries)
+    self.clock.sleep(60)
+    expired = sorted(tables[0].expired + tables[1].expired,
+                     key=lambda (t, fired): fired)
+    self.assertEqual([now + 10, now + 20, now + 30],
+                     [ t for (t, fired) in expired ])
+    for (t, fired) in expired:
+      self.assertTrue(fired - t <= self.clock.resolution_seconds + 0.01)
+
+  def test_activity_stops_skipping(self):
+    source = MockSource()
+    self.clock.watch(source, object)
+    now = self.clock.time()
+    fired = []
+    def tick(t):
+      # A timeout at +10 causes some activity
+      if t >= now + 10 and not fired:
+        fired.append(t)
+        source.raiseEvent(None)
+    self.clock.add_tick_listener(tick)
+    self.clock.sleep(60)
+    self.assertEqual(1, len(fired))
+    # Skipping stopped at the activity, and resumed once things were quiet
+    self.assertEqual(2, len(self.selects))
+    self.assertTrue(self.clock.time() - now >= 60)
+
+  def test_patch_module(self):
+    module = types.ModuleType("flow_table")
+    module.time = time
+    self.assertTrue(self.clock.patch_module(module))
+    self.clock.sleep(100)
+    self.assertTrue(module.time.time() - time.time() >= 99)
+    # Everything else comes from the time module
+    self.assertEqual(time.sleep, module.time.sleep)
+    self.clock.restore()
+    self.assertTrue(module.time is time)
+    module.time = "not a clock"
+    self.assertFalse(self.clock.patch_module(module))
+
+if __name__ == '__main__':
+  unittest.main()
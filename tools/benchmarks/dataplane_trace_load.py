@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Benchmark: bootstrap time and peak RSS of loading each bundled dataplane
+# trace, pickled (Trace) and converted to the streaming format
+# (StreamingTrace), plus the time to play back every event.
+#
+# Each measurement runs in its own fork()ed child, so that peak RSS is not
+# shared between them. With -r, every trace is first repeated that many times,
+# to approximate the size of a generated fat tree trace.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/dataplane_trace_load.py -r 10000
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.dataplane_traces.trace import Trace, load_trace, write_streaming_trace
+from sts.dataplane_traces.trace_generator import write_trace_log
+
+def measure(path):
+  ''' In a child process: load and play back the trace at path. Returns
+  (bootstrap seconds, playback seconds, number of events, peak RSS bytes) '''
+  (read_fd, write_fd) = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    os.close(read_fd)
+    start = time.time()
+    trace = load_trace(path)
+    loaded = time.time()
+    events = 0
+    while trace._next_event() is not None:
+      trace._advance()
+      events += 1
+    os.write(write_fd, "%f %f %d" % (loaded - start, time.time() - loaded, events))
+    os._exit(0)
+  os.close(write_fd)
+  result = os.read(read_fd, 1024)
+  os.close(read_fd)
+  (_, _, rusage) = os.wait4(pid, 0)
+  (bootstrap_seconds, playback_seconds, events) = result.split()
+  # ru_maxrss is in kilobytes on Linux
+  return (float(bootstrap_seconds), float(playback_seconds), int(events),
+          rusage.ru_maxrss * 1024)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('traces', nargs='*',
+                      default=sorted(glob.glob("dataplane_traces/*.trace")),
+                      help='pickled dataplane traces (default: the bundled ones)')
+  parser.add_argument('-r', '--repeat', type=int, default=1,
+                      help='repeat each trace this many times')
+  args = parser.parse_args()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    print "%-45s %-9s %8s %12s %10s %10s" % ("trace", "format", "events",
+                                              "bootstrap/s", "playback/s", "RSS MB")
+    for path in args.traces:
+      name = os.path.basename(path)
+      pickled_path = path
+      if args.repeat > 1:
+        pickled_path = os.path.join(tmpdir, name)
+        write_trace_log(Trace(path).dataplane_trace * args.repeat, pickled_path)
+      streaming_path = os.path.join(tmpdir, name + ".stream")
+      write_streaming_trace(Trace(pickled_path).dataplane_trace, streaming_path)
+      for (trace_format, trace_path) in [("pickle", pickled_path),
+                                         ("streaming", streaming_path)]:
+        (bootstrap_seconds, playback_seconds, events, rss) = measure(trace_path)
+        print "%-45s %-9s %8d %12.4f %10.4f %10.1f" % (name, trace_format, events,
+                                                       bootstrap_seconds,
+                                                       playback_seconds, rss / 1e6)
+  finally:
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Benchmark: the per-event DAG lookups Replayer does while replaying a large
+# synthetic trace (state-change lookahead, input event lists), with the
+# indexed EventDag/EventDagView vs. the previous linear scans.
+#
+# The controllers are mocked out: the mock controller always has the next
+# expected state change pending, so every event exercises
+# Replayer._check_early_state_changes() / _check_new_state_changes().
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/event_dag_lookahead.py -n 20000 -s 200
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.control_flow.replayer import Replayer
+from sts.event_dag import EventDag, EventDagView
+from sts.replay_event import *
+
+class MockSimulationConfig(object):
+  ignore_interposition = False
+
+class MockControllerSyncCallback(object):
+  ''' A controller that is always about to make the next expected state
+  change '''
+  def __init__(self, events):
+    self.state_changes = [ (i, e.pending_state_change)
+                           for i, e in enumerate(events)
+                           if type(e) == ControllerStateChange ]
+    self.next = 0
+
+  def advance(self, index):
+    while (self.next < len(self.state_changes) and
+           self.state_changes[self.next][0] < index):
+      self.next += 1
+
+  def pending_state_changes(self):
+    if self.next == len(self.state_changes):
+      return []
+    return [self.state_changes[self.next][1]]
+
+  def ack_pending_state_change(self, state_change):
+    pass
+
+class LinearScanEventDagView(EventDagView):
+  ''' EventDagView without indexes, as it was before they were added '''
+  @property
+  def input_events(self):
+    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+
+  def next_state_change(self, index):
+    for event in self._events_list[index:]:
+      if type(event) == ControllerStateChange:
+        return event
+    return None
+
+def synthetic_dag(num_events, state_change_every):
+  events = []
+  for i in xrange(num_events - 1):
+    if i % state_change_every == state_change_every - 1:
+      events.append(ControllerStateChange("c1", "state %d" % i, "state", [i]))
+    elif i % 2 == 0:
+      events.append(SwitchFailure(i % 16 + 1))
+    else:
+      events.append(SwitchRecovery(i % 16 + 1))
+  events.append(InvariantViolation(["violation"], persistent=True))
+  dag = EventDag(events)
+  dag.mark_invalid_input_sequences()
+  return dag
+
+def replay_lookahead(view):
+  ''' The DAG lookups of one replay of view '''
+  replayer = Replayer(MockSimulationConfig(), view)
+  sync_callback = MockControllerSyncCallback(view.events)
+  replayer.sync_callback = sync_callback
+  # MCSFinder looks at the input events a few times per replay
+  for _ in range(3):
+    len(view.input_events)
+  for i, event in enumerate(view.events):
+    sync_callback.advance(i)
+    if isinstance(event, InputEvent):
+      replayer._check_early_state_changes(view, i, event)
+    replayer._check_new_state_changes(view, i)
+
+def measure(view_type, dag, num_replays):
+  # Replay views of the first half of the inputs, as delta debugging would
+  inputs = dag.input_events[:len(dag.input_events) / 2]
+  durations = []
+  for _ in xrange(num_replays):
+    start = time.time()
+    view = view_type(dag, dag.input_subset(inputs).events)
+    replay_lookahead(view)
+    durations.append(time.time() - start)
+  return durations
+
+def summarize(name, durations):
+  durations = sorted(durations)
+  print "%-8s mean %8.1fms  median %8.1fms  max %8.1fms" % \
+    (name, sum(durations) / len(durations) * 1000,
+     durations[len(durations)/2] * 1000, durations[-1] * 1000)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=20000,
+                      help='number of events in the synthetic trace')
+  parser.add_argument('-s', '--state-change-every', type=int, default=200,
+                      help='one in this many events is a ControllerStateChange')
+  parser.add_argument('-r', '--replays', type=int, default=3,
+                      help='number of replays to time')
+  args = parser.parse_args()
+
+  # Every input of the mock run triggers an early state change warning
+  logging.getLogger("Replayer").setLevel(logging.ERROR)
+
+  dag = synthetic_dag(args.events, args.state_change_every)
+  for (name, view_type) in [("linear", LinearScanEventDagView),
+                            ("indexed", EventDagView)]:
+    summarize(name, measure(view_type, dag, args.replays))
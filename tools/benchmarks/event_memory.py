@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# Benchmark: memory held by the events of a large synthetic superlog, once
+# parsed, and by several EventDags over them (as MCSFinder holds during delta
+# debugging).
+#
+# The trace is a mix of ControlMessageReceives/Sends (with base64-encoded
+# packets), ControllerStateChanges, DataplanePermits and input events,
+# written with Event.to_json() and parsed back with log_parser.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/event_memory.py -n 100000
+
+import argparse
+import base64
+import gc
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.event_dag import EventDag
+from sts.input_traces import log_parser
+from sts.replay_event import *
+
+def rss_bytes():
+  with open("/proc/self/status") as status:
+    for line in status:
+      if line.startswith("VmRSS:"):
+        return int(line.split()[1]) * 1024
+  return 0
+
+def dp_fingerprint(i):
+  return { 'dl_src' : "00:00:00:00:00:%02x" % (i % 200 + 1),
+           'dl_dst' : "00:00:00:00:01:%02x" % (i % 100 + 1),
+           'nw_src' : "10.0.0.%d" % (i % 200 + 1),
+           'nw_dst' : "10.0.1.%d" % (i % 100 + 1) }
+
+def synthetic_event(i, num_switches):
+  dpid = i % num_switches + 1
+  kind = i % 10
+  if kind < 4:
+    # Fingerprints as parsed from a superlog, and packets of a typical size
+    if kind % 2 == 0:
+      fingerprint = { 'class' : "ofp_packet_in", 'in_port' : i % 4 + 1,
+                      'data' : dp_fingerprint(i) }
+      packet = os.urandom(60)
+    else:
+      fingerprint = { 'class' : "ofp_echo_request" }
+      packet = os.urandom(8)
+    event_type = ControlMessageReceive if kind < 2 else ControlMessageSend
+    return event_type(dpid, "c1", fingerprint,
+                      b64_packet=base64.b64encode(packet), round=i)
+  if kind < 6:
+    return ControllerStateChange("c1", "Flow installed at %s", "Flow installed at %s",
+                                 [str(dpid)], round=i)
+  if kind < 9:
+    return DataplanePermit(["DataplanePermit", dp_fingerprint(i), dpid, i % 4 + 1],
+                           round=i)
+  return [SwitchFailure, SwitchRecovery][(i / 10) % 2](dpid, round=i)
+
+def write_trace(path, num_events, num_switches):
+  with open(path, "w") as output:
+    for i in xrange(num_events):
+      output.write(synthetic_event(i, num_switches).to_json() + "\n")
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=100000,
+                      help='number of events in the synthetic superlog')
+  parser.add_argument('-d', '--dags', type=int, default=4,
+                      help='number of EventDags to hold over the events')
+  parser.add_argument('-s', '--switches', type=int, default=16)
+  args = parser.parse_args()
+
+  (fd, path) = tempfile.mkstemp(suffix=".trace")
+  os.close(fd)
+  try:
+    write_trace(path, args.events, args.switches)
+    gc.collect()
+    baseline = rss_bytes()
+    start = time.time()
+    events = log_parser.parse_path(path)
+    parse_seconds = time.time() - start
+    gc.collect()
+    parsed = rss_bytes()
+    dags = []
+    for i in xrange(args.dags):
+      # As MCSFinder does: subsequences of the trace, sharing its events
+      dags.append(EventDag(events[i % 2::2] if i > 0 else events))
+    gc.collect()
+    with_dags = rss_bytes()
+    print "%d events, trace %.1f MB, parsed in %.2fs" % \
+      (len(events), os.path.getsize(path) / 1e6, parse_seconds)
+    print "events:      %8.1f MB (%6d bytes/event)" % \
+      ((parsed - baseline) / 1e6, (parsed - baseline) / len(events))
+    print "+ %d dags:    %8.1f MB (%6d bytes/event)" % \
+      (args.dags, (with_dags - baseline) / 1e6,
+       (with_dags - baseline) / len(events))
+  finally:
+    os.remove(path)
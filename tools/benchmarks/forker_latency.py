@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+# Microbenchmark: fork-to-result latency of LocalForker (XML-RPC server in
+# the child) vs. PipeForker (inherited pipe + marshal).
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/forker_latency.py -n 200 -l 1000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.util.rpc_forker import LocalForker, PipeForker
+
+def replay_like_result(num_labels):
+  ''' Roughly the shape of MCSFinder's play_forward() return value:
+  (violation_found, RuntimeStats.client_dict(), timed_out_internal) '''
+  labels = [ "i%d" % i for i in xrange(num_labels) ]
+  client_dict = {
+    "new_internal_events" : { "1" : [ ["ControlMessageReceive", "c1", i]
+                                      for i in xrange(num_labels / 10) ] },
+    "early_internal_events" : labels[:num_labels / 10],
+    "snapshot_and_replay_duration" : 1.5,
+  }
+  return (False, client_dict, labels)
+
+def measure(forker, num_iterations, num_labels):
+  forker.register_task("replay_like_result", replay_like_result)
+  latencies = []
+  for _ in xrange(num_iterations):
+    start = time.time()
+    forker.fork("replay_like_result", num_labels)
+    latencies.append(time.time() - start)
+  return latencies
+
+def summarize(name, latencies):
+  latencies = sorted(latencies)
+  mean = sum(latencies) / len(latencies)
+  print "%-12s mean %7.2fms  median %7.2fms  p99 %7.2fms  max %7.2fms" % \
+    (name, mean * 1000, latencies[len(latencies)/2] * 1000,
+     latencies[int(len(latencies)*0.99)] * 1000, latencies[-1] * 1000)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--iterations', type=int, default=100,
+                      help='number of forks per transport')
+  parser.add_argument('-l', '--labels', type=int, default=500,
+                      help='number of timed out labels in each result')
+  args = parser.parse_args()
+
+  for name, forker in [("xmlrpc", LocalForker()), ("pipe", PipeForker())]:
+    summarize(name, measure(forker, args.iterations, args.labels))
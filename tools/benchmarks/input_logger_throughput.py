@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+# Benchmark: events per second that InputLogger.log_input_event() accepts
+# (i.e. what the caller's round loop sees), and events per second until the
+# superlog is complete on close(), for synchronous logging and for each
+# durability of background logging.
+#
+# Uses the same synthetic events as event_memory.py.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/input_logger_throughput.py -n 100000
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.input_traces.input_logger import InputLogger
+import sts.util.background_writer as background_writer
+from tools.benchmarks.event_memory import synthetic_event
+
+class MockSyncCallback(object):
+  record_deterministic_values = False
+
+class MockControlFlow(object):
+  sync_callback = MockSyncCallback()
+  invariant_check_name = "InvariantChecker.check_correspondence"
+
+def run(events, results_dir, **kws):
+  logger = InputLogger(**kws)
+  logger.open(results_dir)
+  start = time.time()
+  for event in events:
+    logger.log_input_event(event)
+  logged = time.time()
+  logger.close(MockControlFlow(), "simulation_config")
+  closed = time.time()
+  size = os.path.getsize(logger.output_path)
+  return (len(events) / (logged - start), len(events) / (closed - start), size)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=100000,
+                      help='number of events to log')
+  parser.add_argument('-s', '--switches', type=int, default=16)
+  parser.add_argument('-b', '--binary', action="store_true", default=False,
+                      help='log in the binary superlog format')
+  parser.add_argument('-f', '--flush-interval', type=float, default=1.0,
+                      help='flush_interval_seconds of background logging')
+  args = parser.parse_args()
+
+  events = [ synthetic_event(i, args.switches) for i in xrange(args.events) ]
+  modes = [("synchronous", {})]
+  for durability in background_writer.DURABILITIES:
+    modes.append(("background, %s" % durability,
+                  { 'background' : True, 'durability' : durability,
+                    'flush_interval_seconds' : args.flush_interval }))
+
+  print "%d events, %s format" % (len(events), "binary" if args.binary else "JSON")
+  print "%-22s %14s %14s %10s" % ("mode", "logged/s", "complete/s", "MB")
+  results_dir = tempfile.mkdtemp()
+  try:
+    for (name, kws) in modes:
+      (logged_rate, complete_rate, size) = run(events, results_dir,
+                                               binary=args.binary, **kws)
+      print "%-22s %14.0f %14.0f %10.1f" % (name, logged_rate, complete_rate,
+                                            size / 1e6)
+  finally:
+    shutil.rmtree(results_dir)
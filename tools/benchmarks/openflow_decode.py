@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Benchmark: OpenFlow decoding over a flow_mod-heavy trace, with packets
+# memoized on the events (ControlMessageBase.get_packet()) versus decoded from
+# b64_packet on every access, as the tools and replayers used to.
+#
+# Each "replay" walks the trace the way OpenFlowReplayer and the replay tools
+# do: is_flow_mod() on every ControlMessageReceive, then the command and match
+# of each flow_mod.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/openflow_decode.py -n 20000 -r 10
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import sts.replay_event
+from sts.replay_event import ControlMessageReceive
+from sts.util.convenience import base64_encode, base64_decode_openflow
+from pox.openflow.libopenflow_01 import *
+
+class CountingDecoder(object):
+  def __init__(self):
+    self.decodes = 0
+
+  def __call__(self, data):
+    self.decodes += 1
+    return base64_decode_openflow(data)
+
+def synthetic_receives(num_events, num_switches):
+  events = []
+  for i in xrange(num_events):
+    if i % 5 < 4:
+      match = ofp_match(dl_type=0x800, nw_src="10.0.0.%d" % (i % 200 + 1),
+                        nw_dst="10.0.1.%d" % (i % 100 + 1))
+      packet = ofp_flow_mod(xid=i, match=match,
+                            actions=[ofp_action_output(port=i % 4 + 1)])
+      fingerprint = { 'class' : "ofp_flow_mod" }
+    else:
+      packet = ofp_echo_request(xid=i)
+      fingerprint = { 'class' : "ofp_echo_request" }
+    events.append(ControlMessageReceive(i % num_switches + 1, "c1", fingerprint,
+                                        b64_packet=base64_encode(packet)))
+  return events
+
+def replay_uncached(events, decode):
+  for event in events:
+    if type(decode(event.b64_packet)) == ofp_flow_mod:
+      decode(event.b64_packet).command
+      decode(event.b64_packet).match
+
+def replay_cached(events):
+  for event in events:
+    if event.is_flow_mod():
+      event.get_packet().command
+      event.get_packet().match
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=20000,
+                      help='number of ControlMessageReceives in the trace')
+  parser.add_argument('-r', '--replays', type=int, default=10,
+                      help='number of passes over the trace')
+  parser.add_argument('-s', '--switches', type=int, default=16)
+  args = parser.parse_args()
+
+  events = synthetic_receives(args.events, args.switches)
+  decoder = CountingDecoder()
+  sts.replay_event.base64_decode_openflow = decoder
+
+  start = time.time()
+  for _ in xrange(args.replays):
+    replay_uncached(events, decoder)
+  uncached_seconds = time.time() - start
+  uncached_decodes = decoder.decodes
+
+  decoder.decodes = 0
+  start = time.time()
+  for _ in xrange(args.replays):
+    replay_cached(events)
+  cached_seconds = time.time() - start
+  cached_decodes = decoder.decodes
+
+  print "%d events (%d flow_mods), %d replays" % \
+    (len(events), sum(1 for e in events if e.is_flow_mod()), args.replays)
+  print "decoded on every access: %8d decodes %7.2fs" % \
+    (uncached_decodes, uncached_seconds)
+  print "memoized on the event:   %8d decodes %7.2fs" % \
+    (cached_decodes, cached_seconds)
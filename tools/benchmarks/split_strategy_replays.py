@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Benchmark: number of replays delta debugging needs to find the MCS with
+# contiguous (split_list) vs. topology-aware (TopologyAwareSplitter) input
+# partitioning.
+#
+# Replays are not actually run: an oracle decides that a subsequence
+# reproduces the violation iff it contains every culprit input. Culprits are
+# either drawn from a small neighborhood of the network ("local", the common
+# case for real bugs) or uniformly at random ("random").
+#
+# By default, synthetic traces over a grid of switches are used. Superlogs of
+# previous experiments can be given instead, e.g.
+#
+#   ./tools/benchmarks/split_strategy_replays.py experiments/*/events.trace
+#
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.control_flow.mcs_finder import MCSFinder, EfficientMCSFinder
+from sts.event_dag import EventDag, split_list, TopologyAwareSplitter, network_element
+from sts.replay_event import *
+import sts.input_traces.log_parser as log_parser
+
+class OracleSimulationConfig(object):
+  ignore_interposition = False
+
+class OracleMixin(object):
+  ''' Replaces forked replays with a check for the culprit inputs '''
+  def set_culprits(self, culprits):
+    self.culprits = culprits
+    self.num_replays = 0
+
+  def _fork_replay_child(self, new_dag, label, task_name):
+    self.num_replays += 1
+    violation = all(e in new_dag._events_set for e in self.culprits)
+    return (violation, {}, [])
+
+  def log(self, s):
+    pass
+
+  log_violation = log
+  log_no_violation = log
+
+class OracleMCSFinder(OracleMixin, MCSFinder):
+  pass
+
+class OracleEfficientMCSFinder(OracleMixin, EfficientMCSFinder):
+  pass
+
+class GridTopology(object):
+  ''' Just enough of sts.topology.Topology for TopologyAwareSplitter '''
+  class Switch(object):
+    def __init__(self, dpid):
+      self.dpid = dpid
+
+  class Link(object):
+    def __init__(self, start, end):
+      self.start_software_switch = start
+      self.end_software_switch = end
+
+  def __init__(self, width):
+    self.switches = [ self.Switch(dpid) for dpid in range(1, width * width + 1) ]
+    self.network_links = []
+    for i, switch in enumerate(self.switches):
+      if (i + 1) % width != 0:
+        self.network_links.append(self.Link(switch, self.switches[i + 1]))
+      if i + width < len(self.switches):
+        self.network_links.append(self.Link(switch, self.switches[i + width]))
+    self.access_links = []
+
+def synthetic_trace(topology, num_failures, rng):
+  ''' Failure/recovery pairs of random switches and links, interleaved '''
+  events = []
+  open_failures = []
+  for _ in range(num_failures):
+    if rng.random() < 0.5:
+      dpid = rng.choice(topology.switches).dpid
+      failure = SwitchFailure(dpid)
+      recovery = SwitchRecovery(dpid)
+    else:
+      link = rng.choice(topology.network_links)
+      (start, end) = (link.start_software_switch.dpid,
+                      link.end_software_switch.dpid)
+      failure = LinkFailure(start, 1, end, 1)
+      recovery = LinkRecovery(start, 1, end, 1)
+    events.append(failure)
+    open_failures.append(recovery)
+    # Recover some of the outstanding failures
+    while open_failures and rng.random() < 0.5:
+      events.append(open_failures.pop(rng.randrange(len(open_failures))))
+  events += open_failures
+  events.append(InvariantViolation(["violation"], persistent=True))
+  return events
+
+def choose_culprits(inputs, num_culprits, local, rng):
+  ''' Choose failure inputs (recoveries can't be pruned on their own) '''
+  candidates = [ e for e in inputs if type(e) in [SwitchFailure, LinkFailure] ]
+  if not local:
+    return rng.sample(candidates, min(num_culprits, len(candidates)))
+  # Pick a switch, and culprits that affect it or its links
+  center = network_element(rng.choice(candidates))[1]
+  nearby = [ e for e in candidates if center in network_element(e)[1:] ]
+  return rng.sample(nearby, min(num_culprits, len(nearby)))
+
+def count_replays(finder_type, events, culprits, split_strategy, results_dir):
+  # Silence MCSFinder's console output
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, "w")
+  try:
+    finder = finder_type(OracleSimulationConfig(), EventDag(events),
+                         invariant_check_name="InvariantChecker.check_liveness",
+                         replay_final_trace=False, split_strategy=split_strategy)
+    finder.set_culprits(culprits)
+    finder.init_results(tempfile.mkdtemp(dir=results_dir))
+    finder.simulate(check_reproducibility=False)
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  assert(set(culprits) <= set(finder.dag.input_events))
+  return finder.num_replays
+
+def summarize(name, counts):
+  counts = sorted(counts)
+  print "%-40s mean %7.1f  median %5d  max %5d" % \
+    (name, float(sum(counts)) / len(counts), counts[len(counts)/2], counts[-1])
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('superlogs', nargs='*',
+                      help='superlog paths (default: synthetic grid traces)')
+  parser.add_argument('-t', '--trials', type=int, default=20,
+                      help='culprit sets to try per trace')
+  parser.add_argument('-c', '--culprits', type=int, default=2,
+                      help='number of culprit inputs')
+  parser.add_argument('-w', '--grid-width', type=int, default=5,
+                      help='width of the synthetic switch grid')
+  parser.add_argument('-f', '--failures', type=int, default=60,
+                      help='failure/recovery pairs per synthetic trace')
+  parser.add_argument('-s', '--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.WARN)
+  rng = random.Random(args.seed)
+  if args.superlogs:
+    traces = [ (path, log_parser.parse_path(path), None)
+               for path in args.superlogs ]
+  else:
+    topology = GridTopology(args.grid_width)
+    traces = [ ("synthetic %d" % i,
+                synthetic_trace(topology, args.failures, rng), topology)
+               for i in range(3) ]
+
+  results_dir = tempfile.mkdtemp()
+  try:
+    for (name, events, topology) in traces:
+      inputs = [ e for e in events if isinstance(e, InputEvent) ]
+      print "=== %s: %d inputs ===" % (name, len(inputs))
+      for local in [True, False]:
+        culprit_sets = [ choose_culprits(inputs, args.culprits, local, rng)
+                         for _ in range(args.trials) ]
+        for finder_type in [OracleMCSFinder, OracleEfficientMCSFinder]:
+          for (strategy_name, strategy) in [
+              ("contiguous", split_list),
+              ("topology", TopologyAwareSplitter(topology))]:
+            counts = [ count_replays(finder_type, events, culprits, strategy,
+                                     results_dir)
+                       for culprits in culprit_sets ]
+            summarize("%s %s %s" % ("local" if local else "random",
+                                    finder_type.__name__[6:], strategy_name),
+                      counts)
+  finally:
+    shutil.rmtree(results_dir)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# Benchmark: time to load a large synthetic superlog in the JSON lines format
+# and in the binary format, and then to access every event's fields (which,
+# for the binary format, decodes them).
+#
+# Uses the same synthetic trace as event_memory.py.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/superlog_load.py -n 100000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from sts.input_traces import log_parser
+from tools.benchmarks.event_memory import write_trace
+
+def timed(f, *args):
+  start = time.time()
+  result = f(*args)
+  return (result, time.time() - start)
+
+def decode_all(events):
+  for event in events:
+    event.round
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=100000,
+                      help='number of events in the synthetic superlog')
+  parser.add_argument('-s', '--switches', type=int, default=16)
+  args = parser.parse_args()
+
+  (fd, json_path) = tempfile.mkstemp(suffix=".trace")
+  os.close(fd)
+  binary_path = json_path + ".bin"
+  try:
+    write_trace(json_path, args.events, args.switches)
+    with open(json_path, 'rb') as json_file:
+      with open(binary_path, 'wb') as binary_file:
+        (_, convert_seconds) = timed(log_parser.json_to_binary, json_file, binary_file)
+
+    (events, json_seconds) = timed(log_parser.parse_path, json_path)
+    del events
+    (events, binary_seconds) = timed(log_parser.parse_path, binary_path)
+    (_, decode_seconds) = timed(decode_all, events)
+
+    print "%d events, JSON %.1f MB, binary %.1f MB, converted in %.2fs" % \
+      (len(events), os.path.getsize(json_path) / 1e6,
+       os.path.getsize(binary_path) / 1e6, convert_seconds)
+    print "JSON lines:         %6.2fs" % json_seconds
+    print "binary, load:       %6.2fs" % binary_seconds
+    print "binary, decode all: %6.2fs (%.2fs in total)" % \
+      (decode_seconds, binary_seconds + decode_seconds)
+  finally:
+    for path in [json_path, binary_path]:
+      if os.path.exists(path):
+        os.remove(path)
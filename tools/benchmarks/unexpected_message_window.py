@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Benchmark: Replayer._check_unexpected_cp_messages() over a large synthetic
+# trace of ControlMessageReceives/Sends with a large
+# expected_message_round_window, with the sliding ExpectedMessageWindow vs.
+# rebuilding the expected fingerprint sets for every event.
+#
+# The simulation is mocked out: no messages are pending, so only the cost of
+# finding the expected fingerprints is measured.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/benchmarks/unexpected_message_window.py -n 20000 -w 500
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from sts.control_flow.replayer import Replayer
+from sts.event_dag import EventDag
+from sts.replay_event import *
+
+class MockSimulationConfig(object):
+  ignore_interposition = False
+
+class MockOpenFlowBuffer(object):
+  pending_receives = []
+  pending_sends = []
+
+class MockSimulation(object):
+  openflow_buffer = MockOpenFlowBuffer()
+
+def synthetic_dag(num_events, events_per_round, num_switches):
+  events = []
+  for i in xrange(num_events):
+    event_type = ControlMessageReceive if i % 2 == 0 else ControlMessageSend
+    dpid = i % num_switches + 1
+    fingerprint = (event_type.__name__, "ofp_packet_in %d" % (i % 97), dpid, "c1")
+    events.append(event_type(dpid, "c1", fingerprint,
+                             round=i / events_per_round))
+  return EventDag(events)
+
+def measure(dag, round_window, incremental):
+  replayer = Replayer(MockSimulationConfig(), dag,
+                      allow_unexpected_messages=True,
+                      expected_message_round_window=round_window,
+                      incremental_message_window=incremental)
+  replayer.simulation = MockSimulation()
+  start = time.time()
+  for i in xrange(len(dag.events)):
+    replayer._check_unexpected_cp_messages(dag, i)
+  return time.time() - start
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', '--events', type=int, default=20000,
+                      help='number of events in the synthetic trace')
+  parser.add_argument('-w', '--round-window', type=int, default=500,
+                      help='expected_message_round_window')
+  parser.add_argument('-e', '--events-per-round', type=int, default=4)
+  parser.add_argument('-s', '--switches', type=int, default=16)
+  args = parser.parse_args()
+
+  logging.getLogger("Replayer").setLevel(logging.ERROR)
+
+  dag = synthetic_dag(args.events, args.events_per_round, args.switches)
+  print "%d events, window of %d rounds (~%d events)" % \
+    (args.events, args.round_window, args.round_window * args.events_per_round)
+  for (name, incremental) in [("rebuild", False), ("sliding", True)]:
+    seconds = measure(dag, args.round_window, incremental)
+    print "%-8s total %8.2fs  per event %8.1fus" % \
+      (name, seconds, seconds / len(dag.events) * 1e6)
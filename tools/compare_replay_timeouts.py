@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Print the internal event timeouts of two MCS runs side by side, per replay
+# and per event type, e.g. of a run with Replayer's partial_order and one
+# without. Also prints how many events the second run matched out of
+# recorded order.
+#
+# Usage: ./tools/compare_replay_timeouts.py total/runtime_stats.json partial/runtime_stats.json
+
+import argparse
+import json
+
+def load_json(path):
+  with open(path) as json_input:
+    return json.load(json_input)
+
+def total(count):
+  # ControlMessageReceive/Send counts are broken down by packet class
+  if type(count) == dict:
+    return count['total']
+  return count
+
+def sum_timeouts(replay2timeouts):
+  event2timeouts = {}
+  for timeouts in replay2timeouts.values():
+    for event_type, count in timeouts.iteritems():
+      event2timeouts[event_type] = event2timeouts.get(event_type, 0) + total(count)
+  return event2timeouts
+
+def sum_reordered(replay2reordered):
+  return sum(sum(reordered.values()) for reordered in replay2reordered.values())
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('baseline', help='runtime_stats.json of the first run')
+  parser.add_argument('other', help='runtime_stats.json of the second run')
+  parser.add_argument('-r', '--per-replay', action="store_true", default=False,
+                      help='also print the total timeouts of each replay')
+  args = parser.parse_args()
+
+  baseline = load_json(args.baseline)
+  other = load_json(args.other)
+  baseline_timeouts = baseline.get('timed_out_events', {})
+  other_timeouts = other.get('timed_out_events', {})
+
+  print "%-30s %10s %10s" % ("Timeouts", "baseline", "other")
+  baseline_sums = sum_timeouts(baseline_timeouts)
+  other_sums = sum_timeouts(other_timeouts)
+  for event_type in sorted(set(baseline_sums) | set(other_sums)):
+    print "%-30s %10d %10d" % (event_type, baseline_sums.get(event_type, 0),
+                               other_sums.get(event_type, 0))
+  print "%-30s %10d %10d" % ("total", sum(baseline_sums.values()),
+                             sum(other_sums.values()))
+  print "%-30s %10d %10d" % ("replays", len(baseline_timeouts),
+                             len(other_timeouts))
+  print "%-30s %10d %10d" % ("matched out of order",
+                             sum_reordered(baseline.get('reordered_events', {})),
+                             sum_reordered(other.get('reordered_events', {})))
+
+  if args.per_replay:
+    print
+    print "%-30s %10s %10s" % ("Timeouts per replay", "baseline", "other")
+    for replay in sorted(set(baseline_timeouts) | set(other_timeouts), key=int):
+      print "%-30s %10s %10s" % (replay,
+        sum(total(c) for c in baseline_timeouts.get(replay, {}).values()),
+        sum(total(c) for c in other_timeouts.get(replay, {}).values()))
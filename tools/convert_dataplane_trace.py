@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+# Convert a dataplane trace between the pickle format and the streaming
+# format of sts/dataplane_traces/trace.py. The direction is chosen from the
+# format of the input.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/convert_dataplane_trace.py dataplane_traces/ping_pong.trace /tmp/ping_pong.trace
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.dataplane_traces.trace import Trace, StreamingTrace, \
+                                       is_streaming_trace, write_streaming_trace
+from sts.dataplane_traces.trace_generator import write_trace_log
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('input', help='dataplane trace to convert')
+  parser.add_argument('output', help='where to write the converted trace')
+  args = parser.parse_args()
+
+  if os.path.abspath(args.input) == os.path.abspath(args.output):
+    raise ValueError("Refusing to overwrite the input trace")
+
+  if is_streaming_trace(args.input):
+    write_trace_log(list(StreamingTrace(args.input)), args.output)
+    print "Wrote pickled dataplane trace %s" % args.output
+  else:
+    write_streaming_trace(Trace(args.input).dataplane_trace, args.output)
+    print "Wrote streaming dataplane trace %s" % args.output
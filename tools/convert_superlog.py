@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+# Convert a superlog between the JSON lines format and the binary format of
+# sts/input_traces/binary_superlog.py. The direction is chosen from the format
+# of the input.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/convert_superlog.py experiments/fuzz/events.trace /tmp/events.trace.bin
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.binary_superlog import is_binary_superlog
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('input', help='superlog to convert')
+  parser.add_argument('output', help='where to write the converted superlog')
+  args = parser.parse_args()
+
+  if os.path.abspath(args.input) == os.path.abspath(args.output):
+    raise ValueError("Refusing to overwrite the input superlog")
+
+  with open(args.input, 'rb') as input_file:
+    with open(args.output, 'wb') as output_file:
+      if is_binary_superlog(args.input):
+        log_parser.binary_to_json(input_file, output_file)
+        print "Wrote JSON lines superlog %s" % args.output
+      else:
+        log_parser.json_to_binary(input_file, output_file)
+        print "Wrote binary superlog %s" % args.output
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+# Run a worker daemon that executes jobs for sts.util.rpc_forker.RemoteForker.
+#
+# note: must be invoked from the top-level sts directory (tasks are imported
+# by module name), e.g. to run four daemons on this machine:
+#
+#   for port in 7000 7001 7002 7003; do ./tools/forker_daemon.py -p $port & done
+#
+# and then pass RemoteForker([("localhost", 7000), ..., ("localhost", 7003)])
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.util.rpc_forker import ForkerDaemon
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-i', '--ip', default='localhost',
+                      help='address to listen on')
+  parser.add_argument('-p', '--port', type=int, default=7000,
+                      help='port to listen on')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO)
+  daemon = ForkerDaemon(args.ip, args.port)
+  print "Listening for jobs on %s:%d" % (args.ip, args.port)
+  try:
+    daemon.serve_forever()
+  except KeyboardInterrupt:
+    pass
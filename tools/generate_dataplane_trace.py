@@ -2,12 +2,37 @@
 
 # note: must be invoked from the top-level sts directory
 
+import argparse
 import os
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from sts.dataplane_traces.trace_generator import generate_example_trace_same_subnet
+from sts.dataplane_traces.trace_generator import generate_example_trace_same_subnet, \
+                                                 generate_example_trace_fat_tree
 
-# TODO(cs): output filename should be a parameter
-generate_example_trace_same_subnet(num_switches=2)
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-f', '--fat-tree', dest="num_pods", type=int, default=None,
+                      help='''generate a streaming ping trace for a FatTree with '''
+                           '''this many pods, rather than a ping pong trace for '''
+                           '''a 2 switch mesh''')
+  parser.add_argument('-r', '--rounds', type=int, default=50000,
+                      help='(fat tree) number of rounds of pings')
+  parser.add_argument('-s', '--seed', type=int, default=None,
+                      help='(fat tree) random seed. Default: chosen at random')
+  parser.add_argument('-j', '--processes', type=int, default=1,
+                      help='(fat tree) number of processes to generate the trace with')
+  parser.add_argument('-o', '--output', default="dataplane_traces/ping_pong_fat_tree.trace",
+                      help='(fat tree) where to write the trace')
+  args = parser.parse_args()
+
+  if args.num_pods is None:
+    # TODO(cs): output filename should be a parameter
+    generate_example_trace_same_subnet(num_switches=2)
+  else:
+    seed = generate_example_trace_fat_tree(num_pods=args.num_pods,
+                                           rounds=args.rounds, seed=args.seed,
+                                           processes=args.processes,
+                                           tracefile_path=args.output)
+    print "Wrote %s (seed %d)" % (args.output, seed)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+# Build the sidecar index of one or more superlogs (events.trace.index), so
+# that tools like pretty_print_input_trace.py, tabulate_events.py and
+# OpenFlowReplayer only decode the events they need.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/index_superlog.py experiments/fuzz/events.trace
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.input_traces.trace_index import build_index, index_path
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('superlogs', metavar="SUPERLOG", nargs='+',
+                      help='superlogs to index')
+  args = parser.parse_args()
+
+  for superlog in args.superlogs:
+    index = build_index(superlog)
+    print "Indexed %d events of %s in %s" % (len(index['offsets']), superlog,
+                                            index_path(superlog))
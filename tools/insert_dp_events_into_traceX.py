@@ -6,7 +6,7 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import sts.replay_event as replay_events
-from sts.dataplane_traces.trace import Trace
+from sts.dataplane_traces.trace import load_trace
 from sts.input_traces.input_logger import InputLogger
 from sts.input_traces.log_parser import parse
 
@@ -14,7 +14,7 @@ def main(args):
   if args.dp_trace_path is None:
     args.dp_trace_path = os.path.dirname(args.input) + "/dataplane.trace"
 
-  dp_trace = Trace(args.dp_trace_path).dataplane_trace
+  dp_trace = iter(load_trace(args.dp_trace_path))
 
   event_logger = InputLogger()
   event_logger.open(results_dir="/tmp/events.trace")
@@ -23,7 +23,7 @@ def main(args):
     trace = parse(input_file)
     for event in trace:
       if type(event) == replay_events.TrafficInjection:
-        event.dp_event = dp_trace.pop(0)
+        event.dp_event = next(dp_trace)
       event_logger.log_input_event(event)
 
     event_logger.output.close()
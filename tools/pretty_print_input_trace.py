@@ -10,8 +10,8 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
-from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.dataplane_traces.trace import load_trace
+from sts.input_traces.trace_index import open_trace
 from trace_utils import Stats
 
 default_fields = ['class_with_label', 'fingerprint', 'event_delimiter']
@@ -95,7 +95,7 @@ def main(args):
 
   dp_trace = None
   if args.dp_trace_path is not None:
-    dp_trace = Trace(args.dp_trace_path).dataplane_trace
+    dp_trace = iter(load_trace(args.dp_trace_path))
 
   if hasattr(format_def, "fields"):
     fields = format_def.fields
@@ -113,15 +113,26 @@ def main(args):
 
   stats = Stats()
 
+  # Only decodes the selected events if the trace has an index (see
+  # tools/index_superlog.py)
+  trace = open_trace(args.input)
+  rounds = None
+  if args.rounds is not None:
+    rounds = [ int(r) for r in args.rounds.split(":") ]
+    rounds = (rounds[0], rounds[-1])
+  dpids = None
+  if args.dpid is not None:
+    dpids = [args.dpid]
+
   # all events are printed with a fixed number of lines, and (optionally)
   # separated by delimiter lines of the form:
   # ----------------------------------
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
+  try:
+    for event in trace.select(rounds=rounds, dpids=dpids,
+                              inputs_only=args.inputs_only):
       if type(event) not in filtered_classes:
         if dp_trace is not None and type(event) == replay_events.TrafficInjection:
-          event.dp_event = dp_trace.pop(0)
+          event.dp_event = next(dp_trace)
         for field in fields:
           field_formatters[field](event)
         stats.update(event)
@@ -132,6 +143,8 @@ def main(args):
       print ("Violation does not occur at end of trace: %s",
              args.violation_signature)
     print
+  finally:
+    trace.close()
 
   if args.stats:
     print "Stats: %s" % stats
@@ -156,6 +169,12 @@ if __name__ == '__main__':
   parser.add_argument('-d', '--dp-trace-path', dest="dp_trace_path",
                       help="for older traces, specify path to the TrafficInjection packets",
                       default=None)
+  parser.add_argument('-r', '--rounds', default=None,
+                      help="only print the events of rounds FIRST:LAST (inclusive)")
+  parser.add_argument('--dpid', type=int, default=None,
+                      help="only print the events of the given switch")
+  parser.add_argument('-i', '--inputs-only', action="store_true", default=False,
+                      help="only print input events")
   parser.add_argument('-s', '--violation-signature', dest="violation_signature",
                       help=('''Check whether the given violation signature '''
                             '''(return value from InvariantChecker), '''
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Render the per-event-class and per-phase replay latency histograms recorded
+# in a runtime_stats.json file.
+#
+# note: must be invoked from the top-level sts directory, e.g.
+#   ./tools/print_replay_latencies.py experiments/foo_mcs/runtime_stats.json
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.util.latency_histogram import LatencyHistogram, ReplayLatencies
+from sts.util.tabular import Tabular
+
+def load_latencies(runtime_stats, replay_id=None):
+  ''' Return the ReplayLatencies of the given replay iteration, or of all
+  replays if replay_id is None '''
+  per_replay = runtime_stats.get('replay_latencies', {})
+  if replay_id is not None:
+    if str(replay_id) not in per_replay:
+      raise ValueError("No latencies recorded for replay %s" % str(replay_id))
+    return ReplayLatencies.from_dict(per_replay[str(replay_id)])
+  if 'replay_latency_totals' in runtime_stats:
+    return ReplayLatencies.from_dict(runtime_stats['replay_latency_totals'])
+  # runtime_stats of a single child replay
+  latencies = ReplayLatencies()
+  for d in per_replay.values():
+    latencies.merge(ReplayLatencies.from_dict(d))
+  return latencies
+
+def format_seconds(seconds):
+  if seconds < 1e-3:
+    return "%.1fus" % (seconds * 1e6)
+  if seconds < 1:
+    return "%.2fms" % (seconds * 1e3)
+  return "%.2fs" % seconds
+
+def show_summary(title, histograms):
+  seconds = lambda f: lambda (name, h): format_seconds(f(h))
+  Tabular([ (title, lambda (name, h): name),
+            ("count", lambda (name, h): h.count),
+            ("total", seconds(lambda h: h.total_seconds)),
+            ("mean", seconds(lambda h: h.mean_seconds())),
+            ("p50", seconds(lambda h: h.percentile_seconds(50))),
+            ("p90", seconds(lambda h: h.percentile_seconds(90))),
+            ("p99", seconds(lambda h: h.percentile_seconds(99))),
+            ("max", seconds(lambda h: h.max_seconds)) ]).show(
+    sorted(histograms.items(), key=lambda (name, h): -h.total_seconds))
+
+def show_histogram(name, histogram, width=50):
+  print "%s (%d samples)" % (name, histogram.count)
+  if histogram.count == 0:
+    return
+  most = max(histogram.buckets.values())
+  for bucket in range(min(histogram.buckets), max(histogram.buckets) + 1):
+    count = histogram.buckets.get(bucket, 0)
+    (lower, upper) = LatencyHistogram.bucket_bounds(bucket)
+    print "  [%9s, %9s) %8d %s" % (format_seconds(lower), format_seconds(upper),
+                                   count, "#" * (count * width / most))
+
+def main(args):
+  with open(args.runtime_stats) as input_file:
+    runtime_stats = json.load(input_file)
+  latencies = load_latencies(runtime_stats, args.replay)
+  show_summary("phase", latencies.phases)
+  show_summary("event class", latencies.events)
+  if args.histograms:
+    for histograms in [latencies.phases, latencies.events]:
+      for name in sorted(histograms.keys()):
+        show_histogram(name, histograms[name])
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('runtime_stats', nargs='?', default="runtime_stats.json",
+                      help='path to runtime_stats.json')
+  parser.add_argument('-r', '--replay', default=None,
+                      help='only show the latencies of this replay iteration')
+  parser.add_argument('-H', '--histograms', action="store_true", default=False,
+                      help='also draw each histogram')
+  args = parser.parse_args()
+
+  main(args)